@@ -9,16 +9,20 @@ import sys
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google.auth.transport.requests import Request
 import json
 
-# Test credentials (you'll need to provide these)
-# This should be the same credentials from your OAuth flow
+# Load environment variables
+from dotenv import load_dotenv
+load_dotenv()
+
+# Test credentials from your OAuth flow, read from the environment (never commit tokens)
 TEST_CREDENTIALS = {
-    'token': 'ya29.a0ATi6K2tF0Rp9NhteRPq5emV8NjjCCfdcFl8p9tuZv9iE3MbvQQrBvUOdpMx3JzGj-4jgwSUSPdsMhgE_GM9t6vCQcp3lbJXXbO5lKut_4EQhv1L-DQiCaNdq3HhdRFZ0zbvX0qdQdp5xVqRsmvdKJynCBLg7zrYwUe3j-6xoevj8C6izU50TTeQn527m8K4bPzpLsiYaCgYKATASARMSFQHGX2MiRb9rgtPlcUo6RXPUCrwTXQ0206',
-    'refresh_token': '1//0gEqCxMkPLuywCgYIARAAGBASNwF-L9IrFwc8HC6VxKNRz3n8_ZAubJvOKNEfKGv5IMAowu9qAjCGv8TnQp9BgTQ1BoNGqIeeOqo',
+    'token': os.getenv('GMAIL_TEST_ACCESS_TOKEN'),
+    'refresh_token': os.getenv('GMAIL_TEST_REFRESH_TOKEN'),
     'token_uri': 'https://oauth2.googleapis.com/token',
-    'client_id': '37019452145-gfmdneb9o2vps2sap5mlnbv07u4scc3t.apps.googleusercontent.com',
-    'client_secret': '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',
+    'client_id': os.getenv('GOOGLE_CLIENT_ID'),
+    'client_secret': os.getenv('GOOGLE_CLIENT_SECRET'),
     'scopes': [
         'https://www.googleapis.com/auth/gmail.readonly',
         'https://www.googleapis.com/auth/gmail.modify',
@@ -26,8 +30,10 @@ TEST_CREDENTIALS = {
     ]
 }
 
-PROJECT_ID = "automationspecialist"
-TOPIC_NAME = "projects/automationspecialist/topics/gmail-notifs"
+PROJECT_ID = os.getenv('GOOGLE_CLOUD_PROJECT_ID', '')
+TOPIC_NAME = os.getenv('GMAIL_PUBSUB_TOPIC') or f"projects/{PROJECT_ID}/topics/gmail-notifs"
+if not TOPIC_NAME.startswith('projects/'):
+    TOPIC_NAME = f"projects/{PROJECT_ID}/topics/{TOPIC_NAME}"
 
 def test_gmail_watch():
     """Test Gmail watch setup with detailed error reporting"""
@@ -52,9 +58,9 @@ def test_gmail_watch():
         )
         
         # Refresh if needed
-        if creds.expired:
+        if creds.expired or not creds.token:
             print("   Credentials expired, refreshing...")
-            creds.refresh(None)
+            creds.refresh(Request())
             print("   ✅ Credentials refreshed")
         else:
             print("   ✅ Credentials valid")
@@ -121,8 +127,10 @@ def test_gmail_watch():
         return False
 
 if __name__ == "__main__":
-    print("\n⚠️  NOTE: This script uses hardcoded credentials from your error log.")
-    print("   For security, update TEST_CREDENTIALS with fresh credentials.\n")
+    if not (TEST_CREDENTIALS['refresh_token'] or TEST_CREDENTIALS['token']) or not PROJECT_ID:
+        print("\n❌ Set GMAIL_TEST_REFRESH_TOKEN (or GMAIL_TEST_ACCESS_TOKEN), GOOGLE_CLIENT_ID,")
+        print("   GOOGLE_CLIENT_SECRET and GOOGLE_CLOUD_PROJECT_ID in your .env file.\n")
+        sys.exit(1)
     
     success = test_gmail_watch()
     
@@ -131,8 +139,8 @@ if __name__ == "__main__":
         print("TROUBLESHOOTING STEPS:")
         print("=" * 80)
         print("1. Verify permissions are set correctly:")
-        print("   - Topic: https://console.cloud.google.com/cloudpubsub/topic/detail/gmail-notifs?project=automationspecialist")
-        print("   - Project: https://console.cloud.google.com/iam-admin/iam?project=automationspecialist")
+        print(f"   - Topic: https://console.cloud.google.com/cloudpubsub/topic/detail/{TOPIC_NAME.rsplit('/', 1)[-1]}?project={PROJECT_ID}")
+        print(f"   - Project: https://console.cloud.google.com/iam-admin/iam?project={PROJECT_ID}")
         print()
         print("2. Wait 10-15 minutes for permission propagation")
         print()
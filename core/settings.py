@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'image_gen',
@@ -132,6 +133,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Media files (uploaded images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Absolute URL MEDIA_ROOT is served from (e.g. https://api.example.com/media/), used for links to
+# generated files made outside a request; unset, the URL of the request that queued the job is used
+PUBLIC_MEDIA_BASE_URL = os.getenv('PUBLIC_MEDIA_BASE_URL')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
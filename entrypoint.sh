@@ -16,6 +16,8 @@ done
 echo "PostgreSQL is up - running migrations..."
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
+# Move reference images still stored as base64 text to files (no-op once done)
+python manage.py migrate_reference_images
 
   
 echo "Starting Django server..."
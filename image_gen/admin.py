@@ -1,5 +1,5 @@
 from django.contrib import admin
-from image_gen.models import ImageGenerationJob, ReferenceImage
+from image_gen.models import ImageGenerationJob, ReferenceAsset, ReferenceImage
 from image_gen.db_models.user import Users
 
 # Register your models here.
@@ -17,6 +17,12 @@ class ReferenceImageAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['job__job_id', 'filename']
 
+@admin.register(ReferenceAsset)
+class ReferenceAssetAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'content_type', 'size', 'created_at']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'file_path', 'size', 'created_at']
+
 @admin.register(Users)
 class UsersAdmin(admin.ModelAdmin):
     list_display = ['uid', 'email', 'name', 'user_type', 'is_email_verified', 'mobile', 'created_at']
@@ -0,0 +1,181 @@
+import contextlib
+import io
+import json
+import random
+import resource
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+from image_gen.db_models.user import Users
+from image_gen.models import EmailAccount, ProcessedEmail
+from image_gen.views.email_automation_view import GmailPushWebhookView
+from utils import rate_limit
+from utils.fake_google import FakeGoogle
+from utils.gmail_queue import claim_notifications, process_notifications
+from utils.google_clients import google_clients
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the Gmail push -> invoice pipeline against an in-process fake of Gmail, Drive and Pub/Sub, "
+        "on a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma-separated mailbox sizes (messages per run)')
+        parser.add_argument('--invoice-ratio', type=float, default=0.3, help='Share of messages that are invoices')
+        parser.add_argument('--attachments', type=int, default=2, help='Attachments per invoice message')
+        parser.add_argument('--attachment-kb', type=int, default=64, help='Size of each attachment in KB')
+        parser.add_argument('--body-kb', type=int, default=4, help='Approximate body size per message in KB')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Simulated latency per HTTP round trip')
+        parser.add_argument('--gmail-rate', type=float, default=0, help='Gmail calls/s per account (0 = unlimited, the pipeline is measured, not the quota)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help="Write the results as JSON to this file ('-' for stdout)")
+        parser.add_argument('--min-rate', type=float, default=0, help='Fail if any run processes fewer messages/s than this')
+        parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own log output")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+
+        # Like the test runner: no query log, and a test database that is dropped afterwards
+        settings.DEBUG = False
+        rate_limit.GMAIL_CALLS_PER_SECOND = options['gmail_rate']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        fake = FakeGoogle(latency=options['latency_ms'] / 1000)
+        google_clients.override(fake.client_class())
+        # Progress goes to stderr when stdout carries the JSON
+        log = sys.stderr if options['json_path'] == '-' else sys.stdout
+        results = []
+        try:
+            user = Users.objects.create(email='benchmark@example.com', password='benchmark')
+            for size in sizes:
+                result = self._run(fake, user, size, options)
+                results.append(result)
+                print(
+                    f"📊 {size} message(s): {result['messages_per_second']:.1f} msg/s, "
+                    f"{result['api_calls_per_message']:.2f} API calls/msg, "
+                    f"{result['http_requests_per_message']:.2f} HTTP requests/msg, "
+                    f"{result['invoices_saved']}/{result['invoices_expected']} invoices saved, "
+                    f"peak RSS {result['peak_rss_mb']:.0f} MB",
+                    file=log
+                )
+        finally:
+            google_clients.override()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'config': {key: options[key] for key in (
+                'invoice_ratio', 'attachments', 'attachment_kb', 'body_kb', 'latency_ms', 'gmail_rate', 'seed'
+            )},
+            'results': results
+        }
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 Results written to {options['json_path']}")
+
+        for result in results:
+            if result['invoices_saved'] != result['invoices_expected']:
+                raise CommandError(f"Only {result['invoices_saved']} of {result['invoices_expected']} invoices saved for {result['messages']} message(s)")
+            if options['min_rate'] and result['messages_per_second'] < options['min_rate']:
+                raise CommandError(f"{result['messages_per_second']:.1f} msg/s for {result['messages']} message(s) is below --min-rate {options['min_rate']}")
+
+    def _run(self, fake, user, size, options):
+        rng = random.Random(options['seed'] + size)
+        email_address = f'benchmark-{size}-{len(fake.mailboxes)}@example.com'
+        mailbox = fake.mailbox(email_address)
+        account = EmailAccount.objects.create(
+            user=user,
+            email=email_address,
+            credentials={},
+            is_active=True,
+            is_automated=True,
+            watch_history_id=str(mailbox.history_id)
+        )
+        invoices_expected = self._populate(mailbox, rng, size, options)
+
+        fake.stats.reset()
+        webhook = GmailPushWebhookView.as_view()
+        factory = APIRequestFactory()
+        output = contextlib.nullcontext() if options['verbose'] else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        with output:
+            request = factory.post('/webhook/', json.dumps(fake.pubsub.push_envelope(mailbox)), content_type='application/json')
+            response = webhook(request)
+            if response.status_code != 200:
+                raise CommandError(f"Webhook returned {response.status_code}")
+            while True:
+                notifications = claim_notifications(10)
+                if not notifications:
+                    break
+                process_notifications(notifications)
+        elapsed = time.perf_counter() - started
+
+        stats = fake.stats.snapshot()
+        # ru_maxrss is in KB on Linux and bytes on macOS; it is the process high-water mark so far
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+        return {
+            'messages': size,
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(size / elapsed, 2) if elapsed else None,
+            'api_calls': stats['api_calls'],
+            'api_calls_per_message': round(stats['api_calls'] / size, 3) if size else 0,
+            'http_requests': stats['http_requests'],
+            'http_requests_per_message': round(stats['http_requests'] / size, 3) if size else 0,
+            'calls': stats['calls'],
+            'invoices_expected': invoices_expected,
+            'invoices_saved': ProcessedEmail.objects.filter(email_account=account).count(),
+            'drive_mb_uploaded': round(fake.drive(email_address).bytes_uploaded / (1024 * 1024), 2),
+            'peak_rss_mb': round(peak_rss_mb, 1),
+        }
+
+    def _populate(self, mailbox, rng, size, options):
+        """Invoices (keyword in the subject, with attachments) mixed with promotions and plain mail, both
+        rejected after a body scan (promotions on their label if INVOICE_TRIAGE_SKIP_LABELS lists it).
+        Returns the number of invoices."""
+        words = [''.join(rng.choice('acfghklmnoqrstvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(300)]
+        body_chars = options['body_kb'] * 1024
+        attachment_bytes = options['attachment_kb'] * 1024
+        invoices = 0
+        for index in range(size):
+            paragraphs = []
+            length = 0
+            while length < body_chars:
+                paragraph = ' '.join(rng.choice(words) for _ in range(40)).capitalize() + '.\n'
+                paragraphs.append(paragraph)
+                length += len(paragraph)
+            body = ''.join(paragraphs)[:body_chars]
+            if rng.random() < options['invoice_ratio']:
+                invoices += 1
+                mailbox.add_message(
+                    f"Invoice #{index} for {rng.choice(words)}",
+                    body,
+                    sender='billing@vendor.example.com',
+                    attachments=[
+                        (f'invoice-{index}-{n}.pdf', 'application/pdf', attachment_bytes)
+                        for n in range(options['attachments'])
+                    ]
+                )
+            elif rng.random() < 0.5:
+                mailbox.add_message(
+                    ' '.join(rng.choice(words) for _ in range(5)).title(),
+                    body,
+                    sender='news@shop.example.com',
+                    labels=('INBOX', 'UNREAD', 'CATEGORY_PROMOTIONS')
+                )
+            else:
+                mailbox.add_message(
+                    ' '.join(rng.choice(words) for _ in range(5)).title(),
+                    body,
+                    sender='friend@mail.example.com'
+                )
+        return invoices
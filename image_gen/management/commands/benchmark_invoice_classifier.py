@@ -0,0 +1,96 @@
+import random
+import re
+import time
+from django.core.management.base import BaseCommand
+from utils.invoice_classifier import DEFAULT_CLASSIFIER, DEFAULT_INVOICE_KEYWORDS, DEFAULT_INVOICE_DOMAINS
+
+
+def legacy_is_invoice(subject, sender, body):
+    """The original list-scan classifier, kept here as the benchmark baseline"""
+    subject = subject.lower()
+    sender = sender.lower()
+    if any(keyword in subject for keyword in DEFAULT_INVOICE_KEYWORDS):
+        return True
+    if any(domain in sender for domain in DEFAULT_INVOICE_DOMAINS):
+        return True
+    if any(keyword in body.lower() for keyword in DEFAULT_INVOICE_KEYWORDS):
+        return True
+    return False
+
+
+def regex_classifier(classifier=DEFAULT_CLASSIFIER):
+    """The classifier's minimal term sets as one compiled alternation regex each (the alternative it was measured against)"""
+    keyword_re = re.compile('|'.join(re.escape(term) for term in classifier._keyword_terms))
+    domain_re = re.compile('|'.join(re.escape(term) for term in classifier._domain_terms))
+
+    def is_invoice(subject, sender, body):
+        if keyword_re.search(subject.lower()) or domain_re.search(sender.lower()):
+            return True
+        return keyword_re.search(body.lower()) is not None
+
+    return is_invoice
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark the invoice classifier against the original keyword scan and an alternation regex on synthetic large emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=200, help='Number of synthetic emails')
+        parser.add_argument('--size-kb', type=int, default=200, help='Approximate body size per email in KB')
+        parser.add_argument('--invoice-ratio', type=float, default=0.1, help='Share of emails with a keyword near the end of the body')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per classifier (best time is reported)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = [
+            self._synthetic_email(rng, options['size_kb'] * 1024, rng.random() < options['invoice_ratio'])
+            for _ in range(options['emails'])
+        ]
+        total_mb = sum(len(body) for _, _, body in corpus) / (1024 * 1024)
+        print(f"📦 Corpus: {len(corpus)} emails, {total_mb:.1f} MB of body text")
+
+        legacy_time, legacy_results = self._run(legacy_is_invoice, corpus, options['repeat'])
+        compiled_time, compiled_results = self._run(DEFAULT_CLASSIFIER.is_invoice, corpus, options['repeat'])
+        regex_time, regex_results = self._run(regex_classifier(), corpus, options['repeat'])
+
+        for name, results in (('Compiled classifier', compiled_results), ('Alternation regex', regex_results)):
+            if results != legacy_results:
+                mismatches = sum(1 for a, b in zip(legacy_results, results) if a != b)
+                print(f"❌ {name} disagrees with the legacy scan on {mismatches} email(s)")
+        if legacy_results == compiled_results == regex_results:
+            print(f"✅ Classifiers agree ({sum(compiled_results)} invoice(s) detected)")
+
+        print(f"⏱️  Legacy keyword scan: {legacy_time * 1000:.1f} ms ({total_mb / legacy_time:.1f} MB/s)")
+        print(f"⏱️  Compiled classifier: {compiled_time * 1000:.1f} ms ({total_mb / compiled_time:.1f} MB/s)")
+        print(f"⏱️  Alternation regex:   {regex_time * 1000:.1f} ms ({total_mb / regex_time:.1f} MB/s)")
+        print(f"🚀 Speedup: {legacy_time / compiled_time:.1f}x over the legacy scan, {regex_time / compiled_time:.1f}x over the regex")
+
+    def _run(self, classify, corpus, repeat):
+        best = None
+        results = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            results = [classify(subject, sender, body) for subject, sender, body in corpus]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, results
+
+    def _synthetic_email(self, rng, size, is_invoice):
+        """HTML newsletter-style body without invoice keywords, optionally with one near the end"""
+        words = [
+            ''.join(rng.choice('acfghklmnoqrstvwxyz') for _ in range(rng.randint(3, 9)))
+            for _ in range(500)
+        ]
+        chunks = []
+        length = 0
+        while length < size:
+            paragraph = ' '.join(rng.choice(words) for _ in range(40))
+            chunk = f'<tr><td style="padding: 10px; color: #333333;"><p>{paragraph.capitalize()}.</p></td></tr>\n'
+            chunks.append(chunk)
+            length += len(chunk)
+        if is_invoice:
+            chunks.insert(len(chunks) - 1, f"<p>Your {rng.choice(DEFAULT_INVOICE_KEYWORDS).upper()} is attached.</p>")
+        subject = ' '.join(rng.choice(words) for _ in range(6)).title()
+        sender = f"News <{rng.choice(words)}@{rng.choice(words)}.{rng.choice(['com', 'io', 'net'])}>"
+        return subject, sender, ''.join(chunks)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from utils.reference_assets import REFERENCE_MODELS, ensure_reference_asset, legacy_reference_rows, prune_unused_assets
+
+
+class Command(BaseCommand):
+    help = "Move reference images stored as base64 text into the content-addressed reference asset store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Rows loaded at a time')
+        parser.add_argument('--prune', action='store_true', help='Also delete assets no job references any more (unused for REFERENCE_ASSET_PRUNE_GRACE_SECONDS)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        for model in REFERENCE_MODELS:
+            pks = list(legacy_reference_rows(model).order_by('pk').values_list('pk', flat=True))
+            if not pks:
+                continue
+            print(f"🖼️ Moving {len(pks)} {model.__name__} row(s) to the reference asset store...")
+
+            moved = 0
+            for start in range(0, len(pks), batch_size):
+                # Only one batch of base64 text is in memory at a time
+                for ref_img in model.objects.filter(pk__in=pks[start:start + batch_size]):
+                    try:
+                        ensure_reference_asset(ref_img)
+                        moved += 1
+                    except Exception as e:
+                        print(f"❌ Could not move {model.__name__} {ref_img.pk}: {e}")
+                print(f"   {min(start + batch_size, len(pks))}/{len(pks)}")
+            print(f"✅ Moved {moved} {model.__name__} row(s)")
+
+        if options['prune']:
+            print(f"🗑️ Deleted {prune_unused_assets()} unused reference asset(s)")
@@ -0,0 +1,69 @@
+import threading
+import time
+import traceback
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from utils.gmail_polling import claim_due_accounts, poll_account
+
+
+class Command(BaseCommand):
+    help = "Sync poll-mode email accounts (no working Pub/Sub) on their adaptive interval"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, default=5, help='Due accounts claimed per query')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to sleep when no account is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no account is due')
+
+    def handle(self, *args, **options):
+        self.stop_event = threading.Event()
+        workers = max(1, options['workers'])
+        print(f"📥 Starting {workers} Gmail polling worker(s)...")
+
+        threads = [
+            threading.Thread(
+                target=self._worker_loop,
+                args=(options['batch_size'], options['poll_interval'], options['once']),
+                name=f"gmail-poller-{i + 1}"
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("🛑 Stopping pollers after their current account...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        print("✅ Gmail polling workers stopped")
+
+    def _worker_loop(self, batch_size, poll_interval, once):
+        name = threading.current_thread().name
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    accounts = claim_due_accounts(batch_size)
+                except Exception as e:
+                    print(f"❌ [{name}] Failed to claim accounts: {e}")
+                    print(f"Traceback: {traceback.format_exc()}")
+                    accounts = []
+
+                if not accounts:
+                    if once:
+                        break
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                started = time.monotonic()
+                for account in accounts:
+                    poll_account(account)
+                print(f"📬 [{name}] {len(accounts)} account(s) polled in {time.monotonic() - started:.2f}s")
+        finally:
+            connection.close()
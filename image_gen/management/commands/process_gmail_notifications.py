@@ -0,0 +1,76 @@
+import threading
+import time
+import traceback
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from utils.gmail_queue import claim_notifications, process_notifications
+from utils.setup_tasks import claim_setup_tasks, run_setup_task
+
+
+class Command(BaseCommand):
+    help = "Drain queued Gmail push notifications and email setup tasks with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, default=10, help='Notifications claimed per query')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stop_event = threading.Event()
+        workers = max(1, options['workers'])
+        print(f"📥 Starting {workers} Gmail notification worker(s)...")
+
+        threads = [
+            threading.Thread(
+                target=self._worker_loop,
+                args=(options['batch_size'], options['poll_interval'], options['once']),
+                name=f"gmail-worker-{i + 1}"
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("🛑 Stopping workers after their current notification...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        print("✅ Gmail notification workers stopped")
+
+    def _worker_loop(self, batch_size, poll_interval, once):
+        name = threading.current_thread().name
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    # Account setups first: a user is waiting on those
+                    setup_tasks = claim_setup_tasks(1)
+                    notifications = [] if setup_tasks else claim_notifications(batch_size)
+                except Exception as e:
+                    print(f"❌ [{name}] Failed to claim work: {e}")
+                    print(f"Traceback: {traceback.format_exc()}")
+                    setup_tasks = notifications = []
+
+                for task in setup_tasks:
+                    run_setup_task(task)
+
+                if not notifications:
+                    if setup_tasks:
+                        continue
+                    if once:
+                        break
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                started = time.monotonic()
+                process_notifications(notifications)
+                print(f"📬 [{name}] {len(notifications)} notification(s) handled in {time.monotonic() - started:.2f}s")
+        finally:
+            connection.close()
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+from image_gen.models import EmailAccount
+from utils.gmail_watch import pubsub_topic, renew_watch
+from utils.gmail_polling import switch_to_polling
+
+
+class Command(BaseCommand):
+    help = "Renew Gmail watches that expire within a horizon, spreading the calls evenly over a window"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-hours', type=float, default=24, help='Renew watches expiring within this many hours')
+        parser.add_argument('--spread-minutes', type=float, default=30, help='Spread the renewals of one run evenly over this window')
+        parser.add_argument('--jitter-seconds', type=float, default=5, help='Random delay added to every renewal slot')
+        parser.add_argument('--workers', type=int, default=8, help='Renewals in flight at once')
+        parser.add_argument('--batch-size', type=int, default=500, help='Max accounts renewed per run (soonest expiry first)')
+        parser.add_argument('--loop', action='store_true', help='Keep running, starting a new run every --interval-minutes')
+        parser.add_argument('--interval-minutes', type=float, default=60, help='Time between runs with --loop')
+
+    def handle(self, *args, **options):
+        self.stop_event = threading.Event()
+        try:
+            while True:
+                started = time.monotonic()
+                self._run(options)
+                if not options['loop']:
+                    break
+                remaining = options['interval_minutes'] * 60 - (time.monotonic() - started)
+                if remaining > 0 and self.stop_event.wait(remaining):
+                    break
+        except KeyboardInterrupt:
+            print("🛑 Stopping watch renewal...")
+            self.stop_event.set()
+
+    def _run(self, options):
+        close_old_connections()
+        horizon = timezone.now() + timedelta(hours=options['horizon_hours'])
+        accounts = list(
+            EmailAccount.objects.filter(is_active=True, is_automated=True, sync_mode='push')
+            .filter(Q(watch_expiration__isnull=True) | Q(watch_expiration__lte=horizon))
+            .order_by('watch_expiration')[:options['batch_size']]
+        )
+        if not accounts:
+            print("✅ No Gmail watches due for renewal")
+            return
+
+        topic_name = pubsub_topic()
+        # Evenly spaced slots over the window (plus jitter) so renewals never hit Gmail all at once
+        spread = options['spread_minutes'] * 60
+        step = spread / len(accounts)
+        start = time.monotonic()
+        schedule = [
+            (start + i * step + random.uniform(0, options['jitter_seconds']), account)
+            for i, account in enumerate(accounts)
+        ]
+        print(f"🔁 Renewing {len(accounts)} Gmail watch(es) over {spread / 60:.0f} minute(s), one every {step:.2f}s")
+
+        results = {'renewed': 0, 'failed': 0}
+        lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers']), thread_name_prefix='watch-renewal') as executor:
+            for slot, account in schedule:
+                # Submit at the slot time; the pool bounds how many calls are in flight
+                if self.stop_event.wait(max(0, slot - time.monotonic())):
+                    break
+                executor.submit(self._renew, account, topic_name, results, lock)
+
+        print(f"✅ Watch renewal finished: {results['renewed']} renewed, {results['failed']} failed")
+
+    def _renew(self, account, topic_name, results, lock):
+        try:
+            renew_watch(account, topic_name)
+            print(f"✅ Renewed Gmail watch for {account.email} until {account.watch_expiration}")
+            outcome = 'renewed'
+        except HttpError as e:
+            print(f"❌ Failed to renew Gmail watch for {account.email}: {e}")
+            if e.resp.status == 403:
+                # Pub/Sub permission lost: without a watch the account would stop syncing
+                switch_to_polling(account)
+            outcome = 'failed'
+        except Exception as e:
+            print(f"❌ Failed to renew Gmail watch for {account.email}: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            outcome = 'failed'
+        finally:
+            connection.close()
+        with lock:
+            results[outcome] += 1
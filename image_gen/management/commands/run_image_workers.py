@@ -0,0 +1,122 @@
+import os
+import signal
+import threading
+import time
+import traceback
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from utils.image_generation import run_image_generation_job
+from utils.image_jobs import (
+    IMAGE_JOB_HEARTBEAT_SECONDS, claim_image_jobs, extend_leases, release_lease, worker_name
+)
+
+
+class Command(BaseCommand):
+    help = "Run queued image generation jobs on a fixed pool of worker threads, with leases kept alive by a heartbeat"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=int(os.getenv('IMAGE_WORKER_CONCURRENCY', '4')),
+            help='Jobs generated at once by this process'
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stop_event = threading.Event()
+        self.heartbeat_stop = threading.Event()  # Set only once no job is in flight
+        self.worker_id = worker_name()
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        workers = max(1, options['workers'])
+
+        # Deploys stop containers with SIGTERM: finish the current jobs, claim no new ones.
+        # Jobs cut off anyway are requeued once their lease expires.
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        print(f"🎨 Starting {workers} image worker(s) as {self.worker_id}...")
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='image-heartbeat', daemon=True)
+        heartbeat.start()
+        threads = [
+            threading.Thread(
+                target=self._worker_loop,
+                args=(options['poll_interval'], options['once']),
+                name=f"image-worker-{i + 1}"
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("🛑 Stopping image workers after their current job...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.stop_event.set()
+        self.heartbeat_stop.set()
+        print("✅ Image workers stopped")
+
+    def _worker_loop(self, poll_interval, once):
+        name = threading.current_thread().name
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    job_ids = claim_image_jobs(self.worker_id, 1)
+                except Exception as e:
+                    print(f"❌ [{name}] Failed to claim image jobs: {e}")
+                    print(f"Traceback: {traceback.format_exc()}")
+                    job_ids = []
+
+                if not job_ids:
+                    if once:
+                        break
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                for job_id in job_ids:
+                    self._run(name, job_id)
+        finally:
+            connection.close()
+
+    def _run(self, name, job_id):
+        with self.in_flight_lock:
+            self.in_flight.add(job_id)
+        started = time.monotonic()
+        try:
+            run_image_generation_job(job_id)
+        except Exception as e:
+            print(f"❌ [{name}] Image job {job_id} crashed: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.discard(job_id)
+            try:
+                release_lease(self.worker_id, job_id)
+            except Exception as e:
+                print(f"⚠️ [{name}] Failed to release lease of image job {job_id}: {e}")
+        print(f"🎨 [{name}] Image job {job_id} handled in {time.monotonic() - started:.1f}s")
+
+    def _heartbeat_loop(self):
+        """Extend the leases of all jobs in flight with one query every IMAGE_JOB_HEARTBEAT_SECONDS"""
+        try:
+            while not self.heartbeat_stop.wait(IMAGE_JOB_HEARTBEAT_SECONDS):
+                with self.in_flight_lock:
+                    job_ids = list(self.in_flight)
+                if not job_ids:
+                    continue
+                try:
+                    close_old_connections()
+                    extended = extend_leases(self.worker_id, job_ids)
+                    if extended < len(job_ids):
+                        print(f"⚠️ {len(job_ids) - extended} image job lease(s) lost (finished or taken over)")
+                except Exception as e:
+                    print(f"❌ Image job heartbeat failed: {e}")
+        finally:
+            connection.close()
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from image_gen.models import EmailAccount, ProcessedEmail
+from utils.email_search import search_body_text, update_search_vectors
+from utils.google_clients import google_clients
+
+
+class Command(BaseCommand):
+    help = "Fill the full-text search index for processed emails saved before it existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows updated per UPDATE')
+        parser.add_argument('--all', action='store_true', help='Recompute every row, not only unindexed ones')
+        parser.add_argument(
+            '--with-bodies', action='store_true',
+            help='Download the saved email text from Drive for rows without body_text before indexing'
+        )
+
+    def handle(self, *args, **options):
+        if options['with_bodies']:
+            self._fetch_bodies()
+
+        rows = ProcessedEmail.objects.all()
+        if not options['all']:
+            rows = rows.filter(search_vector__isnull=True)
+        pks = list(rows.order_by('pk').values_list('pk', flat=True))
+        print(f"🔎 Indexing {len(pks)} processed email(s)...")
+
+        batch_size = max(1, options['batch_size'])
+        for start in range(0, len(pks), batch_size):
+            update_search_vectors(ProcessedEmail.objects.filter(pk__in=pks[start:start + batch_size]))
+            print(f"   {min(start + batch_size, len(pks))}/{len(pks)}")
+
+        print("✅ Search index up to date")
+
+    def _fetch_bodies(self):
+        """Older rows have no body_text; the body is in the .txt file saved to Drive"""
+        missing = ProcessedEmail.objects.filter(body_text='', drive_file_id__isnull=False)
+        for email_account in EmailAccount.objects.filter(processed_emails__in=missing).distinct():
+            try:
+                drive_service = google_clients.get(email_account).drive
+            except Exception as e:
+                print(f"❌ Skipping bodies for {email_account.email}: {e}")
+                continue
+
+            fetched = 0
+            for processed_email in missing.filter(email_account=email_account).only('pk', 'drive_file_id'):
+                try:
+                    content = drive_service.files().get_media(fileId=processed_email.drive_file_id).execute()
+                except Exception as e:
+                    print(f"⚠️ Could not download {processed_email.drive_file_id}: {e}")
+                    continue
+                # Stored as "From/To/Subject/Date" lines, a blank line, then the body
+                text = content.decode('utf-8', errors='replace').split('\n\n', 1)[-1]
+                ProcessedEmail.objects.filter(pk=processed_email.pk).update(
+                    body_text=search_body_text(text), search_vector=None
+                )
+                fetched += 1
+            print(f"📄 Fetched {fetched} email body text(s) for {email_account.email}")
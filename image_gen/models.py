@@ -1,5 +1,8 @@
 from image_gen.db_models.user import Users
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 import uuid
 
 class ImageGenerationJob(models.Model):
@@ -19,17 +22,40 @@ class ImageGenerationJob(models.Model):
     dimensions = models.CharField(max_length=20, null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
     note = models.TextField(null=True, blank=True)
+    media_base_url = models.CharField(max_length=500, null=True, blank=True)  # Absolute MEDIA_URL of the request that queued the job
+    worker_id = models.CharField(max_length=255, null=True, blank=True)  # run_image_workers process holding the lease
+    lease_until = models.DateTimeField(null=True, blank=True)  # Extended by the worker's heartbeat; requeued once it passes
+    attempts = models.IntegerField(default=0)  # Times claimed by a worker
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='image_job_claim_idx'),
+        ]
 
     def __str__(self):
         return f"Job {self.job_id} - {self.status} - User: {self.user.email if self.user else 'No User'}"
 
 
+class ReferenceAsset(models.Model):
+    """Reference image bytes, stored once per content under MEDIA_ROOT and shared by every job that uses them"""
+    sha256 = models.CharField(max_length=64, primary_key=True)  # Hex SHA-256 of the file content
+    file_path = models.CharField(max_length=500)  # default_storage path, reference_assets/<2 hex>/<sha256><ext>
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    normalized_path = models.CharField(max_length=500, null=True, blank=True)  # RGB JPEG form sent to Veo, made on first use
+    provider_handles = models.JSONField(default=dict, blank=True)  # Provider -> ID of the copy uploaded there, e.g. {'heygen': image_key}
+    last_used_at = models.DateTimeField(default=timezone.now)  # Touched by every upload of these bytes; --prune spares recent assets
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reference asset {self.sha256[:12]} ({self.size} bytes)"
+
+
 class ReferenceImage(models.Model):
     job = models.ForeignKey(ImageGenerationJob, on_delete=models.CASCADE, related_name='reference_images')
-    image_data = models.TextField()  # Base64 encoded image data
+    asset = models.ForeignKey(ReferenceAsset, on_delete=models.PROTECT, null=True, blank=True, related_name='image_references')
+    image_data = models.TextField(null=True, blank=True)  # Legacy base64 data, moved to `asset` by migrate_reference_images
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -66,7 +92,8 @@ class VideoGenerationJob(models.Model):
 
 class VideoReferenceImage(models.Model):
     job = models.ForeignKey(VideoGenerationJob, on_delete=models.CASCADE, related_name='reference_images')
-    image_data = models.TextField()  # Base64 encoded image data
+    asset = models.ForeignKey(ReferenceAsset, on_delete=models.PROTECT, null=True, blank=True, related_name='video_references')
+    image_data = models.TextField(null=True, blank=True)  # Legacy base64 data, moved to `asset` by migrate_reference_images
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
     reference_type = models.CharField(max_length=50, default='asset')  # 'asset' or other types
@@ -110,7 +137,8 @@ class AvatarGenerationJob(models.Model):
 
 class AvatarReferenceImage(models.Model):
     job = models.ForeignKey(AvatarGenerationJob, on_delete=models.CASCADE, related_name='reference_images')
-    image_data = models.TextField()  # Base64 encoded image data
+    asset = models.ForeignKey(ReferenceAsset, on_delete=models.PROTECT, null=True, blank=True, related_name='avatar_references')
+    image_data = models.TextField(null=True, blank=True)  # Legacy base64 data, moved to `asset` by migrate_reference_images
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -128,12 +156,25 @@ class EmailAccount(models.Model):
     watch_expiration = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     is_automated = models.BooleanField(default=False)
+    sync_lease_until = models.DateTimeField(null=True, blank=True)  # Set while a worker is syncing this account
+    sync_lease_owner = models.CharField(max_length=100, null=True, blank=True)  # Token of the sync holding the lease
+    invoice_keywords = models.JSONField(default=list, blank=True)  # Custom keywords on top of the defaults
+    invoice_domains = models.JSONField(default=list, blank=True)  # Custom sender domains on top of the defaults
+    backfill_history_id = models.CharField(max_length=255, null=True, blank=True)  # Set while a backfill is running; becomes watch_history_id when it finishes
+    backfill_page_token = models.CharField(max_length=512, null=True, blank=True)  # Backfill checkpoint (next messages.list page)
+    sync_mode = models.CharField(max_length=10, default='push')  # push (Gmail watch + Pub/Sub) or poll (poll_gmail_accounts)
+    next_poll_at = models.DateTimeField(null=True, blank=True)  # Poll mode: when the next sync is due
+    poll_interval_seconds = models.IntegerField(null=True, blank=True)  # Poll mode: current adaptive interval
+    last_invoice_at = models.DateTimeField(null=True, blank=True)  # Last sync that saved an invoice
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'email']
+        indexes = [
+            models.Index(fields=['sync_mode', 'next_poll_at'], name='email_account_poll_idx'),
+        ]
 
     def __str__(self):
         return f"{self.email} - {self.user.email}"
@@ -150,10 +191,109 @@ class ProcessedEmail(models.Model):
     drive_folder_name = models.CharField(max_length=50)  # Month name like "November"
     attachments = models.JSONField(default=list, blank=True)  # Store attachment info: [{"filename": "...", "file_id": "...", "mime_type": "..."}]
     is_invoice = models.BooleanField(default=True)
+    body_text = models.TextField(blank=True, default='')  # Extracted body (truncated), indexed for search
+    search_vector = SearchVectorField(null=True, blank=True)  # Set by utils.email_search after insert
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-received_date']
+        indexes = [
+            # Keyset pagination of an account's emails, newest first (ProcessedEmailListView)
+            models.Index(fields=['email_account', '-received_date', '-email_id'], name='processed_email_keyset_idx'),
+            # The same across accounts: with several accounts (email_account IN (...)) the index above can't
+            # return rows in order, so Postgres walks this one and filters on the account instead of sorting
+            models.Index(fields=['-received_date', '-email_id'], name='processed_email_recent_idx'),
+            GinIndex(fields=['search_vector'], name='processed_email_search_idx'),
+        ]
+
+    def __str__(self):
+        return f"Email {self.gmail_message_id} - {self.subject[:50]}"
+
+class GmailPushNotification(models.Model):
+    notification_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    email_address = models.EmailField()
+    history_id = models.CharField(max_length=255, null=True, blank=True)
+    pubsub_message_id = models.CharField(max_length=255, unique=True, null=True, blank=True)  # Pub/Sub redelivers with the same ID
+    status = models.CharField(max_length=20, default='queued')  # queued, processing, completed, failed
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # Not claimable before this time (retry backoff)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='gmail_notif_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"Push {self.email_address} - history {self.history_id} - {self.status}"
+
+
+class DriveFolder(models.Model):
+    email_account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='drive_folders')
+    path = models.CharField(max_length=255)  # Folder names joined with "/", e.g. "Adam Pearson Invoice/2025/November"
+    folder_id = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['email_account', 'path']
+
+    def __str__(self):
+        return f"{self.path} - {self.folder_id}"
+
+
+class EmailSetupTask(models.Model):
+    task_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    email_account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='setup_tasks')
+    stage = models.CharField(max_length=10, default='watch')  # watch (Gmail watch, retried on 403), sync (initial sync/backfill)
+    status = models.CharField(max_length=20, default='queued')  # queued, running, completed, failed
+    sync_mode = models.CharField(max_length=10, null=True, blank=True)  # push or poll, once the watch stage is done
+    watch_attempts = models.IntegerField(default=0)
+    start_history_id = models.CharField(max_length=255, null=True, blank=True)  # Account's history ID before setup; the initial sync starts here
+    processed_count = models.IntegerField(default=0)  # Invoices saved by the initial sync so far
+    available_at = models.DateTimeField(default=timezone.now)  # Not claimable before this time (retry backoff)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='email_setup_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"Setup {self.email_account.email} - {self.stage} - {self.status}"
+
+class EmailOutboxEntry(models.Model):
+    """Side effects of saving one invoice email, recorded as each one completes so a retry resumes at the next step"""
+    entry_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    email_account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='outbox_entries')
+    gmail_message_id = models.CharField(max_length=255)
+    subject = models.CharField(max_length=500, blank=True, default='')
+    status = models.CharField(max_length=20, default='pending')  # pending, completed, failed
+    email_file_id = models.CharField(max_length=255, null=True, blank=True)  # Drive copy of the email text
+    attachments = models.JSONField(default=list, blank=True)  # Uploaded so far: [{"key": "...", "filename": "...", "file_id": "...", "mime_type": "..."}]
+    recorded_at = models.DateTimeField(null=True, blank=True)  # ProcessedEmail created
+    archived_at = models.DateTimeField(null=True, blank=True)  # Marked read and removed from INBOX
+    attempts = models.IntegerField(default=0)  # Resume rounds after the first attempt
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        unique_together = ['email_account', 'gmail_message_id']
+        indexes = [
+            models.Index(fields=['email_account', 'status'], name='email_outbox_status_idx'),
+        ]
 
     def __str__(self):
-        return f"Email {self.gmail_message_id} - {self.subject[:50]}"
\ No newline at end of file
+        return f"Outbox {self.gmail_message_id} - {self.status}"
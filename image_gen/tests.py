@@ -1,3 +1,693 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from image_gen.db_models.user import Users
+from image_gen.models import (
+    DriveFolder, EmailAccount, EmailOutboxEntry, EmailSetupTask, GmailPushNotification, ImageGenerationJob,
+    ProcessedEmail, ReferenceAsset, ReferenceImage
+)
+from image_gen.views.email_automation_view import EmailAutomationService, _decode_cursor
+from utils import gmail_polling, gmail_queue, parallel_transfers, processed_emails, reference_assets, setup_tasks
+from utils.attachment_stream import spool_base64_field
+from utils.drive_folders import DriveFolderResolver
+from utils.email_parsing import ParsedMessage, extract_body_text
+from utils.fake_google import FakeGoogle
+from utils.gmail_queue import (
+    SyncLeaseLost, acquire_sync_lease, claim_notifications, enqueue_notification, extend_sync_lease,
+    process_account_notifications, release_sync_lease
+)
+from utils.gmail_watch import GmailWatchPermissionError, renew_watch
+from utils.google_clients import GoogleClientFactory, google_clients
+from utils.image_generation import ImageJobSpec
+from utils.image_jobs import IMAGE_JOB_LEASE_SECONDS, claim_image_jobs, extend_leases
+from utils.invoice_classifier import DEFAULT_CLASSIFIER, InvoiceClassifier, classifier_for_account
+from utils.job_progress import JobProgressReporter
+from utils.jwt_utils import create_jwt_token
 
-# Create your tests here.
+
+class ProcessedEmailBloomFilterTests(TestCase):
+    def setUp(self):
+        processed_emails._filters.clear()
+        user = Users.objects.create(email='owner@example.com', password='x')
+        # Stored exactly as the client sent it
+        self.email_account = EmailAccount.objects.create(user=user, email='Billing@Acme.com', credentials={})
+        ProcessedEmail.objects.create(
+            email_account=self.email_account,
+            gmail_message_id='saved-1',
+            subject='Invoice',
+            sender='vendor@example.com',
+            received_date=timezone.now(),
+            drive_folder_name='November'
+        )
+
+    def tearDown(self):
+        processed_emails._filters.clear()
+
+    @mock.patch.object(processed_emails, 'BLOOM_FILTER_ENABLED', True)
+    def test_mixed_case_address_filters_saved_messages(self):
+        self.assertEqual(
+            processed_emails.unprocessed_message_ids(self.email_account, ['saved-1', 'new-1']),
+            ['new-1']
+        )
+        self.assertIn('saved-1', processed_emails._mailbox_filter(self.email_account).bloom)
+
+    @mock.patch.object(processed_emails, 'BLOOM_FILTER_ENABLED', True)
+    def test_refresh_counts_each_row_once_and_is_rate_limited(self):
+        mailbox_filter = processed_emails._mailbox_filter(self.email_account)
+        processed_emails.unprocessed_message_ids(self.email_account, ['saved-1'])
+        # Within BLOOM_REFRESH_SECONDS: only the confirming lookup of the bloom hit
+        with self.assertNumQueries(1):
+            processed_emails.unprocessed_message_ids(self.email_account, ['saved-1', 'new-1'])
+
+        # The overlap window re-reads saved-1 on every refresh without counting it again
+        for _ in range(3):
+            mailbox_filter.refresh()
+        self.assertEqual(mailbox_filter.bloom.count, 1)
+
+        processed_emails.remember_processed(self.email_account, 'saved-2')
+        ProcessedEmail.objects.create(
+            email_account=self.email_account,
+            gmail_message_id='saved-2',
+            subject='Invoice',
+            sender='vendor@example.com',
+            received_date=timezone.now(),
+            drive_folder_name='November'
+        )
+        mailbox_filter.refresh()
+        mailbox_filter.refresh()
+        self.assertEqual(mailbox_filter.bloom.count, 2)
+
+
+class SyncLeaseTests(TestCase):
+    def setUp(self):
+        user = Users.objects.create(email='owner@example.com', password='x')
+        self.email_account = EmailAccount.objects.create(user=user, email='billing@acme.com', credentials={})
+
+    def test_expired_lease_taken_over(self):
+        first = EmailAccount.objects.get(pk=self.email_account.pk)
+        second = EmailAccount.objects.get(pk=self.email_account.pk)
+        self.assertTrue(acquire_sync_lease(first))
+        self.assertFalse(acquire_sync_lease(second))
+
+        # The first sync outlives its lease without extending it
+        EmailAccount.objects.filter(pk=first.pk).update(sync_lease_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(acquire_sync_lease(second))
+
+        with self.assertRaises(SyncLeaseLost):
+            extend_sync_lease(first)
+        release_sync_lease(first)
+        self.email_account.refresh_from_db()
+        self.assertEqual(self.email_account.sync_lease_owner, second.sync_lease_owner)
+        self.assertIsNotNone(self.email_account.sync_lease_until)
+
+        release_sync_lease(second)
+        self.email_account.refresh_from_db()
+        self.assertIsNone(self.email_account.sync_lease_until)
+
+
+class ReferenceAssetTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_prune_spares_recently_used_assets(self):
+        asset = reference_assets.store_reference_asset(b'product shot', 'image/png')
+        self.assertEqual(reference_assets.prune_unused_assets(), 0)
+
+        ReferenceAsset.objects.filter(pk=asset.pk).update(last_used_at=timezone.now() - timedelta(days=1))
+        # Uploaded again: the view is about to create its reference row
+        reference_assets.store_reference_asset(b'product shot', 'image/png')
+        self.assertEqual(reference_assets.prune_unused_assets(), 0)
+        job = ImageGenerationJob.objects.create(prompt='x', style='realistic', quality='standard')
+        ReferenceImage.objects.create(job=job, asset=asset, filename='a.png', content_type='image/png')
+
+        ReferenceImage.objects.all().delete()
+        ReferenceAsset.objects.filter(pk=asset.pk).update(last_used_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(reference_assets.prune_unused_assets(), 1)
+        self.assertFalse(default_storage.exists(asset.file_path))
+
+    def test_same_bytes_stored_once(self):
+        first = reference_assets.store_reference_asset(b'product shot', 'image/png')
+        second = reference_assets.store_reference_asset(b'product shot', 'image/jpeg')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(ReferenceAsset.objects.count(), 1)
+        self.assertEqual(reference_assets.read_reference_asset(second), b'product shot')
+
+    def test_normalised_jpeg_and_provider_handles_reused(self):
+        png = io.BytesIO()
+        Image.new('RGBA', (4, 4), (255, 0, 0, 128)).save(png, format='PNG')
+        asset = reference_assets.store_reference_asset(png.getvalue(), 'image/png')
+
+        jpeg = reference_assets.normalized_jpeg_bytes(asset)
+        self.assertEqual(Image.open(io.BytesIO(jpeg)).mode, 'RGB')
+        stored = ReferenceAsset.objects.get(pk=asset.pk)
+        with mock.patch.object(reference_assets.Image, 'open', side_effect=AssertionError('converted twice')):
+            self.assertEqual(reference_assets.normalized_jpeg_bytes(stored), jpeg)
+
+        reference_assets.remember_provider_handle(asset, 'heygen', 'image_key_1')
+        self.assertEqual(ReferenceAsset.objects.get(pk=asset.pk).provider_handles, {'heygen': 'image_key_1'})
+        reference_assets.forget_provider_handle(asset, 'heygen')
+        self.assertEqual(ReferenceAsset.objects.get(pk=asset.pk).provider_handles, {})
+
+    def test_losing_concurrent_upload_deletes_its_file(self):
+        get_or_create = ReferenceAsset.objects.get_or_create
+
+        def winner_first(sha256, defaults):
+            # The other upload saved its file and row while this one was writing
+            winner_path = default_storage.save('reference_assets/winner.png', ContentFile(b'product shot'))
+            ReferenceAsset.objects.create(sha256=sha256, **{**defaults, 'file_path': winner_path})
+            return get_or_create(sha256=sha256, defaults=defaults)
+
+        with mock.patch.object(ReferenceAsset.objects, 'get_or_create', side_effect=winner_first):
+            asset = reference_assets.store_reference_asset(b'product shot', 'image/png')
+
+        self.assertEqual(asset.file_path, 'reference_assets/winner.png')
+        self.assertTrue(default_storage.exists(asset.file_path))
+        self.assertFalse(default_storage.exists(reference_assets._asset_path(asset.sha256, 'image/png')))
+
+
+class AttachmentStreamTests(TestCase):
+    def chunks(self, body, size):
+        return (body[offset:offset + size] for offset in range(0, len(body), size))
+
+    def test_decodes_field_split_across_chunks(self):
+        content = bytes(range(256)) * 3 + b'tail'
+        body = json.dumps({'size': len(content), 'data': base64.urlsafe_b64encode(content).decode().rstrip('=')}).encode()
+        # Sizes that split the key, the padding-free tail and the 4-character groups at every offset
+        for size in (1, 3, 5, 7, 64, len(body)):
+            with self.subTest(size=size):
+                spool = spool_base64_field(self.chunks(body, size))
+                self.assertEqual(spool.read(), content)
+
+    def test_missing_and_truncated_field(self):
+        self.assertIsNone(spool_base64_field(self.chunks(b'{"size": 0}', 4)))
+        with self.assertRaises(ValueError):
+            spool_base64_field(self.chunks(b'{"data": "QUJD', 4))
+
+
+class DriveFolderResolverTests(TestCase):
+    def setUp(self):
+        user = Users.objects.create(email='owner@example.com', password='x')
+        self.email_account = EmailAccount.objects.create(user=user, email='billing@acme.com', credentials={})
+        self.google = FakeGoogle()
+        self.drive = self.google.drive(self.email_account.email)
+
+    def test_creates_each_folder_once(self):
+        resolver = DriveFolderResolver()
+        november = resolver.get_folder_id(self.drive, self.email_account, ['Invoices', 2025, 'November'])
+        december = resolver.get_folder_id(self.drive, self.email_account, ['Invoices', 2025, 'December'])
+        self.assertNotEqual(november, december)
+        self.assertEqual(len(self.drive.files_by_id), 4)
+
+        # A second process has no LRU entries but finds the stored IDs
+        self.google.stats.reset()
+        self.assertEqual(DriveFolderResolver().get_folder_id(self.drive, self.email_account, ['Invoices', '2025', 'November']), november)
+        self.assertEqual(self.google.stats.api_calls, 0)
+
+    def test_invalidate_recreates_missing_folder(self):
+        resolver = DriveFolderResolver()
+        resolver.get_folder_id(self.drive, self.email_account, ['Invoices', 2025, 'November'])
+        resolver.invalidate(self.email_account, ['Invoices', 2025, 'November'])
+        self.assertFalse(DriveFolder.objects.filter(path='Invoices/2025/November').exists())
+        resolver.get_folder_id(self.drive, self.email_account, ['Invoices', 2025, 'November'])
+        # Found again by name in Drive, not created a second time
+        self.assertEqual(len(self.drive.files_by_id), 3)
+
+
+class InvoiceTriageTests(TestCase):
+    def metadata_message(self, subject, snippet, labels):
+        return ParsedMessage({
+            'id': 'm1',
+            'snippet': snippet,
+            'labelIds': labels,
+            'payload': {'headers': [{'name': 'Subject', 'value': subject}, {'name': 'From', 'value': 'news@shop.example'}]}
+        })
+
+    def test_undecided_promotion_is_escalated_by_default(self):
+        service = EmailAutomationService()
+        promotion = self.metadata_message('Your order', 'Thanks for shopping with us', ['INBOX', 'CATEGORY_PROMOTIONS'])
+        self.assertIsNone(service._triage_invoice_metadata(promotion))
+        self.assertTrue(service._triage_invoice_metadata(
+            self.metadata_message('Invoice #42', '', ['INBOX', 'CATEGORY_PROMOTIONS'])
+        ))
+
+        with mock.patch.object(EmailAutomationService, 'TRIAGE_SKIP_LABELS', frozenset({'CATEGORY_PROMOTIONS'})):
+            self.assertFalse(service._triage_invoice_metadata(promotion))
+
+
+def create_email_account(email='billing@acme.com', **fields):
+    user = Users.objects.create(email=f'owner-{Users.objects.count()}@example.com', password='x')
+    return EmailAccount.objects.create(user=user, email=email, credentials={}, **fields)
+
+
+class GmailNotificationQueueTests(TestCase):
+    def setUp(self):
+        self.email_account = create_email_account(is_automated=True, watch_history_id='100')
+        process_new_emails = mock.patch.object(EmailAutomationService, 'process_new_emails', return_value=0)
+        self.process_new_emails = process_new_emails.start()
+        self.addCleanup(process_new_emails.stop)
+
+    def test_claim_skips_redeliveries_and_deferred_and_reclaims_stale(self):
+        enqueue_notification('billing@acme.com', 101, pubsub_message_id='p1')
+        enqueue_notification('billing@acme.com', 101, pubsub_message_id='p1')  # Pub/Sub redelivery
+        enqueue_notification('billing@acme.com', 102, pubsub_message_id='p2')
+        GmailPushNotification.objects.filter(pubsub_message_id='p2').update(available_at=timezone.now() + timedelta(minutes=1))
+
+        claimed = claim_notifications(10)
+        self.assertEqual([n.pubsub_message_id for n in claimed], ['p1'])
+        self.assertEqual(claim_notifications(10), [])
+
+        # Its worker died: the notification goes stale and is claimed again
+        GmailPushNotification.objects.filter(pubsub_message_id='p1').update(
+            started_at=timezone.now() - timedelta(seconds=gmail_queue.STALE_AFTER_SECONDS + 1)
+        )
+        self.assertEqual([n.pubsub_message_id for n in claim_notifications(10)], ['p1'])
+        self.assertEqual(GmailPushNotification.objects.get(pubsub_message_id='p1').attempts, 2)
+
+    def test_account_notifications_coalesce_into_one_sync(self):
+        for history_id in (101, 105, 103):
+            enqueue_notification('billing@acme.com', history_id, pubsub_message_id=f'p{history_id}')
+        primary = claim_notifications(1)
+        process_account_notifications('billing@acme.com', primary)
+
+        self.process_new_emails.assert_called_once_with(mock.ANY, '100')
+        self.assertEqual(GmailPushNotification.objects.filter(status='completed').count(), 3)
+
+    def test_notifications_already_synced_past_are_skipped(self):
+        EmailAccount.objects.filter(pk=self.email_account.pk).update(watch_history_id='200')
+        enqueue_notification('billing@acme.com', 150, pubsub_message_id='p1')
+        process_account_notifications('billing@acme.com', claim_notifications(10))
+        self.process_new_emails.assert_not_called()
+        self.assertEqual(GmailPushNotification.objects.get().status, 'completed')
+
+    def test_notifications_deferred_while_account_syncs(self):
+        enqueue_notification('billing@acme.com', 101, pubsub_message_id='p1')
+        other_sync = EmailAccount.objects.get(pk=self.email_account.pk)
+        self.assertTrue(acquire_sync_lease(other_sync))
+
+        process_account_notifications('billing@acme.com', claim_notifications(10))
+        self.process_new_emails.assert_not_called()
+        notification = GmailPushNotification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ('queued', 0))
+        self.assertGreater(notification.available_at, timezone.now())
+
+    @mock.patch.object(gmail_queue, 'MAX_ATTEMPTS', 2)
+    def test_failed_sync_is_retried_with_backoff_then_failed(self):
+        self.process_new_emails.side_effect = RuntimeError('Gmail is down')
+        enqueue_notification('billing@acme.com', 101, pubsub_message_id='p1')
+
+        process_account_notifications('billing@acme.com', claim_notifications(10))
+        notification = GmailPushNotification.objects.get()
+        self.assertEqual((notification.status, notification.error_message), ('queued', 'Gmail is down'))
+        self.assertGreater(notification.available_at, timezone.now())
+        # The lease is released for the retry
+        self.assertIsNone(EmailAccount.objects.get(pk=self.email_account.pk).sync_lease_until)
+
+        GmailPushNotification.objects.update(available_at=timezone.now())
+        process_account_notifications('billing@acme.com', claim_notifications(10))
+        self.assertEqual(GmailPushNotification.objects.get().status, 'failed')
+
+
+class EmailPipelineTests(TestCase):
+    """process_new_emails end to end against utils.fake_google"""
+
+    def setUp(self):
+        self.google = FakeGoogle()
+        google_clients.override(self.google.client_class())
+        self.addCleanup(google_clients.override)
+        self.mailbox = self.google.mailbox('billing@acme.com')
+        self.drive = self.google.drive('billing@acme.com')
+        self.email_account = create_email_account(is_automated=True, watch_history_id=str(self.mailbox.history_id))
+        self.service = EmailAutomationService()
+        # The search vector is a Postgres expression
+        search_vectors = mock.patch('image_gen.views.email_automation_view.update_search_vectors')
+        search_vectors.start()
+        self.addCleanup(search_vectors.stop)
+        quiet_stdout = mock.patch('sys.stdout', io.StringIO())
+        quiet_stdout.start()
+        self.addCleanup(quiet_stdout.stop)
+
+    def add_invoice(self, number, attachments=(('invoice.pdf', 'application/pdf', 2048),)):
+        self.mailbox.add_message(f'Invoice #{number}', 'Amount due: 10 EUR', attachments=attachments)
+
+    def drive_files(self, mime_type=None):
+        return [f for f in self.drive.files_by_id.values() if mime_type is None or f['mimeType'] == mime_type]
+
+    def test_history_sync_saves_and_archives_invoices_with_batched_calls(self):
+        for number in range(3):
+            self.add_invoice(number)
+        self.mailbox.add_message('Lunch on Friday?', 'See you there', sender='friend@mail.example.com')
+
+        self.assertEqual(self.service.process_new_emails(self.email_account, self.email_account.watch_history_id), 3)
+        self.assertEqual(ProcessedEmail.objects.count(), 3)
+        self.assertEqual(len(self.drive_files('text/plain')), 3)
+        self.assertEqual(len(self.drive_files('application/pdf')), 3)
+        inbox = [m['id'] for m in self.mailbox.messages.values() if 'INBOX' in m['labelIds']]
+        self.assertEqual(inbox, [list(self.mailbox.messages)[-1]])
+        self.assertEqual(self.email_account.watch_history_id, str(self.mailbox.history_id))
+
+        # All four triaged on metadata; the invoices and the undecided message fetched in full
+        stats = self.google.stats.snapshot()
+        self.assertEqual(stats['calls']['gmail.users.messages.get.metadata'], 4)
+        self.assertEqual(stats['calls']['gmail.users.messages.get.full'], 4)
+        self.assertEqual(stats['calls']['gmail.users.messages.modify'], 3)
+
+        # Each of those three steps is one batch round trip, however many messages it covers
+        self.google.stats.reset()
+        for number in range(3, 13):
+            self.add_invoice(number, attachments=())
+        self.service.process_new_emails(self.email_account, self.email_account.watch_history_id)
+        gmail_requests = self.google.stats.snapshot()['http_requests'] - 2 * 10  # Resumable upload per email text
+        self.assertEqual(gmail_requests, 1 + 3)  # history.list and the three batches
+
+    @mock.patch.object(EmailAutomationService, 'BACKFILL_PAGE_SIZE', 2)
+    @mock.patch.object(EmailAutomationService, 'BACKFILL_PAGES_PER_RUN', 1)
+    def test_expired_history_starts_checkpointed_backfill(self):
+        for number in range(5):
+            self.add_invoice(number, attachments=())
+        expired_history_id = str(self.mailbox.first_history_id - 1)
+
+        self.assertEqual(self.service.process_new_emails(self.email_account, expired_history_id), 2)
+        self.email_account.refresh_from_db()
+        self.assertEqual(self.email_account.backfill_history_id, str(self.mailbox.history_id))
+        self.assertIsNotNone(self.email_account.backfill_page_token)
+
+        # Later runs continue from the checkpoint until the query is exhausted
+        while self.email_account.backfill_history_id:
+            self.service.process_new_emails(self.email_account, self.email_account.watch_history_id)
+        self.assertEqual(ProcessedEmail.objects.count(), 5)
+        self.assertEqual(self.email_account.watch_history_id, str(self.mailbox.history_id))
+        self.assertIsNone(self.email_account.backfill_page_token)
+
+    def test_interrupted_save_resumes_without_duplicate_uploads(self):
+        self.add_invoice(1)
+        # Crash after both uploads, before the ProcessedEmail row is written
+        with mock.patch.object(ProcessedEmail.objects, 'get_or_create', side_effect=RuntimeError('database went away')):
+            self.assertEqual(self.service.process_new_emails(self.email_account, self.email_account.watch_history_id), 0)
+        entry = EmailOutboxEntry.objects.get()
+        self.assertEqual(entry.status, 'pending')
+        self.assertIsNotNone(entry.email_file_id)
+        self.assertEqual(len(entry.attachments), 1)
+        self.assertFalse(ProcessedEmail.objects.exists())
+
+        self.google.stats.reset()
+        self.assertEqual(self.service.process_new_emails(self.email_account, self.email_account.watch_history_id), 1)
+        self.assertTrue(ProcessedEmail.objects.exists())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'completed')
+        self.assertEqual(len(self.drive_files('text/plain')) + len(self.drive_files('application/pdf')), 2)
+        self.assertNotIn('drive.files.create', self.google.stats.snapshot()['calls'])
+
+
+class InvoiceClassifierTests(TestCase):
+    def test_matches_subject_sender_then_body(self):
+        classifier = InvoiceClassifier()
+        self.assertTrue(classifier.is_invoice('Your INVOICE is ready', 'a@b.com', ''))
+        self.assertTrue(classifier.is_invoice('Hello', 'Payments <noreply@stripe.com>', ''))
+        self.assertFalse(classifier.is_invoice('Hello', 'friend@mail.example.com', 'See you at lunch'))
+
+        body = mock.Mock(return_value='The amount due is 10 EUR')
+        self.assertTrue(classifier.is_invoice('Hello', 'friend@mail.example.com', body))
+        classifier.is_invoice('Invoice #1', 'friend@mail.example.com', body)
+        body.assert_called_once()  # Not extracted when the subject already matched
+
+    def test_account_keywords_extend_the_defaults(self):
+        email_account = create_email_account(invoice_keywords=['Rechnung'], invoice_domains=['lexoffice'])
+        classifier = classifier_for_account(email_account)
+        self.assertTrue(classifier.is_invoice('Ihre Rechnung', 'a@b.com', ''))
+        self.assertTrue(classifier.is_invoice('Hello', 'noreply@lexoffice.de', ''))
+        self.assertTrue(classifier.is_invoice('Invoice', 'a@b.com', ''))
+        self.assertIs(classifier_for_account(create_email_account('other@acme.com')), DEFAULT_CLASSIFIER)
+
+
+class ParallelTransferTests(TestCase):
+    def test_results_in_order_failures_as_none_and_capped_per_account(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def transfer(item):
+            with lock:
+                in_flight.append(item)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(item)
+            if item == 3:
+                raise RuntimeError('upload failed')
+            return item * 10
+
+        with mock.patch('sys.stdout', io.StringIO()):
+            results = parallel_transfers.run_transfers('account-1', list(range(8)), transfer)
+        self.assertEqual(results, [0, 10, 20, None, 40, 50, 60, 70])
+        self.assertLessEqual(max(peak), parallel_transfers.PER_ACCOUNT_CONCURRENCY)
+
+
+class GoogleClientFactoryTests(TestCase):
+    def test_clients_cached_per_account_until_reauthorized(self):
+        class StubClients:
+            def __init__(self, email_account):
+                self.source = (email_account.credentials.get('refresh_token'), email_account.credentials.get('client_id'))
+                self.refreshes = 0
+
+            def ensure_fresh(self, email_account):
+                self.refreshes += 1
+
+        factory = GoogleClientFactory(StubClients)
+        email_account = create_email_account()
+        email_account.credentials = {'refresh_token': 'r1', 'client_id': 'c'}
+        clients = factory.get(email_account)
+        self.assertIs(factory.get(email_account), clients)
+        self.assertEqual(clients.refreshes, 2)
+
+        # A new grant (re-authorization) replaces the cached clients, and so does invalidate()
+        email_account.credentials = {'refresh_token': 'r2', 'client_id': 'c'}
+        reauthorized = factory.get(email_account)
+        self.assertIsNot(reauthorized, clients)
+        factory.invalidate(email_account)
+        self.assertIsNot(factory.get(email_account), reauthorized)
+
+
+@override_settings(JWT_SECRET_KEY='test-secret')
+class ProcessedEmailListTests(TestCase):
+    def setUp(self):
+        self.first = create_email_account('billing@acme.com')
+        self.user = self.first.user
+        self.second = EmailAccount.objects.create(user=self.user, email='ap@acme.com', credentials={})
+        received = datetime(2025, 11, 3, 9, 0, tzinfo=dt_timezone.utc)
+        for index in range(7):
+            ProcessedEmail.objects.create(
+                email_account=self.first if index % 2 else self.second,
+                gmail_message_id=f'm{index}',
+                subject=f'Invoice {index}',
+                sender='vendor@example.com',
+                # Pairs share a timestamp, so the cursor has to break ties on email_id
+                received_date=received + timedelta(hours=index // 2),
+                drive_folder_name='2025/November'
+            )
+        token = create_jwt_token({'uid': str(self.user.uid)})
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def get_page(self, **params):
+        response = self.client.get('/api/v1/processed-emails/', params, **self.headers)
+        return response.json()
+
+    def test_cursor_walks_every_row_once_newest_first(self):
+        seen = []
+        params = {'limit': 3}
+        while True:
+            page = self.get_page(**params)
+            seen += [email['gmail_message_id'] for email in page['data']]
+            if not page['meta']['has_more']:
+                break
+            params['cursor'] = page['meta']['next_cursor']
+
+        expected = list(
+            ProcessedEmail.objects.order_by('-received_date', '-email_id').values_list('gmail_message_id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 7)
+
+    def test_invalid_cursor_is_rejected(self):
+        page = self.get_page(cursor='not-a-cursor')
+        self.assertEqual(page['meta']['message'], 'Invalid cursor')
+        with self.assertRaises(ValueError):
+            _decode_cursor('bm90IGpzb24')
+
+
+class GmailWatchTests(TestCase):
+    def setUp(self):
+        self.google = FakeGoogle()
+        google_clients.override(self.google.client_class())
+        self.addCleanup(google_clients.override)
+
+    def test_renewal_stores_expiration_and_queues_a_catch_up(self):
+        mailbox = self.google.mailbox('billing@acme.com')
+        email_account = create_email_account(is_automated=True, watch_history_id=str(mailbox.history_id))
+        renew_watch(email_account, 'projects/p/topics/gmail-notifs')
+        email_account.refresh_from_db()
+        self.assertGreater(email_account.watch_expiration, timezone.now() + timedelta(days=6))
+        self.assertFalse(GmailPushNotification.objects.exists())
+
+        # Mail arrived that no push delivered: the renewal queues a sync up to the new history ID
+        mailbox.add_message('Invoice #1', 'Amount due')
+        renew_watch(email_account, 'projects/p/topics/gmail-notifs')
+        self.assertEqual(GmailPushNotification.objects.get().history_id, str(mailbox.history_id))
+        self.assertEqual(email_account.watch_history_id, str(mailbox.history_id - 1))
+
+
+class GmailPollingTests(TestCase):
+    def test_interval_backs_off_while_quiet(self):
+        self.assertEqual(gmail_polling.next_poll_interval(None, 0), 2 * gmail_polling.POLL_MIN_INTERVAL_SECONDS)
+        self.assertEqual(gmail_polling.next_poll_interval(gmail_polling.POLL_MAX_INTERVAL_SECONDS, 0), gmail_polling.POLL_MAX_INTERVAL_SECONDS)
+        self.assertEqual(gmail_polling.next_poll_interval(gmail_polling.POLL_MAX_INTERVAL_SECONDS, 2), gmail_polling.POLL_MIN_INTERVAL_SECONDS)
+
+    @mock.patch.object(EmailAutomationService, 'process_new_emails', return_value=0)
+    def test_due_accounts_claimed_once_and_rescheduled(self, process_new_emails):
+        email_account = create_email_account(is_automated=True)
+        with mock.patch('sys.stdout', io.StringIO()):
+            gmail_polling.switch_to_polling(email_account)
+        EmailAccount.objects.filter(pk=email_account.pk).update(next_poll_at=timezone.now())
+
+        claimed = gmail_polling.claim_due_accounts()
+        self.assertEqual(claimed, [email_account])
+        self.assertEqual(gmail_polling.claim_due_accounts(), [])
+
+        with mock.patch('sys.stdout', io.StringIO()):
+            gmail_polling.poll_account(claimed[0])
+        process_new_emails.assert_called_once()
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.poll_interval_seconds, 2 * gmail_polling.POLL_MIN_INTERVAL_SECONDS)
+        self.assertIsNone(email_account.sync_lease_until)
+
+
+class EmailSetupTaskTests(TestCase):
+    def setUp(self):
+        self.email_account = create_email_account()
+        EmailSetupTask.objects.create(email_account=self.email_account, start_history_id='100')
+        quiet_stdout = mock.patch('sys.stdout', io.StringIO())
+        quiet_stdout.start()
+        self.addCleanup(quiet_stdout.stop)
+
+    @mock.patch.object(setup_tasks, 'WATCH_MAX_ATTEMPTS', 2)
+    @mock.patch.object(EmailAutomationService, 'process_new_emails', return_value=3)
+    @mock.patch.object(EmailAutomationService, 'setup_gmail_watch', side_effect=GmailWatchPermissionError('403'))
+    def test_watch_403_retried_then_falls_back_to_polling(self, setup_gmail_watch, process_new_emails):
+        setup_tasks.run_setup_task(setup_tasks.claim_setup_tasks()[0])
+        task = EmailSetupTask.objects.get()
+        self.assertEqual((task.status, task.stage, task.watch_attempts), ('queued', 'watch', 1))
+        self.assertEqual(setup_tasks.claim_setup_tasks(), [])  # Backing off
+
+        EmailSetupTask.objects.update(available_at=timezone.now())
+        setup_tasks.run_setup_task(setup_tasks.claim_setup_tasks()[0])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.sync_mode, task.processed_count), ('completed', 'poll', 3))
+        process_new_emails.assert_called_once_with(mock.ANY, '100')
+        self.email_account.refresh_from_db()
+        self.assertEqual((self.email_account.sync_mode, self.email_account.is_automated), ('poll', True))
+
+
+class EmailParsingTests(TestCase):
+    def encode(self, text):
+        return base64.urlsafe_b64encode(text.encode()).decode()
+
+    def test_prefers_plain_text_and_caps_length(self):
+        payload = {'mimeType': 'multipart/alternative', 'parts': [
+            {'mimeType': 'text/html', 'body': {'data': self.encode('<p>Invoice <b>due</b></p>')}},
+            {'mimeType': 'text/plain', 'body': {'data': self.encode('Invoice due ' + 'x' * 100)}},
+            {'mimeType': 'application/pdf', 'filename': 'a.pdf', 'body': {'attachmentId': 'a1'}},
+        ]}
+        self.assertEqual(extract_body_text(payload), 'Invoice due ' + 'x' * 100)
+        self.assertEqual(extract_body_text(payload, max_chars=11), 'Invoice due')
+
+    def test_html_only_body_becomes_text(self):
+        markup = '<style>p {}</style><p>Amount&nbsp;due:</p>\n\n\n<p>10 &euro;</p>'
+        payload = {'mimeType': 'text/html', 'body': {'data': self.encode(markup)}}
+        self.assertEqual(extract_body_text(payload), 'Amount\xa0due:\n\n10 \u20ac')
+
+    def test_parsed_message_headers_and_date(self):
+        parsed = ParsedMessage({'id': 'm1', 'payload': {'headers': [
+            {'name': 'SUBJECT', 'value': 'Invoice'},
+            {'name': 'Subject', 'value': 'Ignored duplicate'},
+            {'name': 'Date', 'value': 'Mon, 3 Nov 2025 09:00:00 +0100 (CET)'},
+        ]}})
+        self.assertEqual(parsed.subject, 'Invoice')
+        self.assertEqual(parsed.date, datetime(2025, 11, 3, 8, 0, tzinfo=dt_timezone.utc))
+        self.assertIsNone(ParsedMessage({'payload': {'headers': [{'name': 'Date', 'value': 'soon'}]}}).date)
+
+
+class ImageJobQueueTests(TestCase):
+    def test_claim_lease_and_reclaim_after_worker_death(self):
+        job = ImageGenerationJob.objects.create(prompt='x', style='realistic', quality='standard')
+        self.assertEqual(claim_image_jobs('worker-a', limit=5), [job.pk])
+        self.assertEqual(claim_image_jobs('worker-b', limit=5), [])
+        self.assertEqual(extend_leases('worker-a', [job.pk]), 1)
+        self.assertEqual(extend_leases('worker-b', [job.pk]), 0)
+
+        # worker-a died: once the lease runs out another worker takes the job
+        ImageGenerationJob.objects.filter(pk=job.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_image_jobs('worker-b'), [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.worker_id, job.attempts), ('worker-b', 2))
+        self.assertGreater(job.lease_until, timezone.now() + timedelta(seconds=IMAGE_JOB_LEASE_SECONDS - 60))
+
+    @mock.patch('utils.image_jobs.IMAGE_JOB_MAX_ATTEMPTS', 1)
+    def test_job_interrupted_too_often_is_given_up(self):
+        job = ImageGenerationJob.objects.create(prompt='x', style='realistic', quality='standard')
+        claim_image_jobs('worker-a')
+        ImageGenerationJob.objects.filter(pk=job.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        with mock.patch('sys.stdout', io.StringIO()):
+            self.assertEqual(claim_image_jobs('worker-b'), [])
+        self.assertEqual(ImageGenerationJob.objects.get(pk=job.pk).status, 'error')
+
+
+class ImageJobSpecTests(TestCase):
+    def test_spec_survives_json_and_holds_asset_paths(self):
+        job = ImageGenerationJob.objects.create(
+            prompt='A red bicycle', style='realistic', quality='high', media_base_url='https://api.example.com/media'
+        )
+        legacy = ReferenceImage.objects.create(
+            job=job, filename='a.png', content_type='image/png', image_data=base64.b64encode(b'png bytes').decode()
+        )
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root, PUBLIC_MEDIA_BASE_URL=None):
+            spec = ImageJobSpec.from_job(job)
+        self.assertEqual(spec.media_base_url, 'https://api.example.com/media/')
+        self.assertEqual(ImageJobSpec.from_dict(json.loads(json.dumps(spec.to_dict()))), spec)
+        # The base64 row was moved to the asset store on the way
+        legacy.refresh_from_db()
+        self.assertEqual(spec.reference_images[0]['file_path'], legacy.asset.file_path)
+        self.assertIsNone(legacy.image_data)
+
+
+class JobProgressReporterTests(TestCase):
+    def test_progress_writes_coalesced_status_written_at_once(self):
+        job = ImageGenerationJob.objects.create(prompt='x', style='realistic', quality='standard')
+        reporter = JobProgressReporter(job, min_interval=3600)
+        self.assertTrue(reporter.update(10))
+        with self.assertNumQueries(0):
+            self.assertFalse(reporter.update(30))
+            self.assertFalse(reporter.update(50))
+        self.assertEqual(ImageGenerationJob.objects.get(pk=job.pk).progress, 10)
+
+        # A status change goes out at once, with the progress held back
+        with self.assertNumQueries(1):
+            self.assertTrue(reporter.update(status='completed', completed_at=timezone.now()))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), ('completed', 50))
+        self.assertIsNotNone(job.completed_at)
@@ -1,6 +1,5 @@
 import os
 import uuid
-import base64
 import warnings
 import threading
 import requests
@@ -19,6 +18,10 @@ from dotenv import load_dotenv
 
 from utils.response import ResponseInfo
 from utils.jwt_utils import verify_jwt_token
+from utils.reference_assets import (
+    ensure_reference_asset, forget_provider_handle, read_reference_asset, remember_provider_handle,
+    store_uploaded_reference
+)
 from image_gen.models import AvatarGenerationJob, AvatarReferenceImage
 from image_gen.db_models.user import Users
 
@@ -558,6 +561,69 @@ def check_avatar_generation_status(job_id, generation_id, api_key):
         pass
 
 
+# Key of HeyGen image_keys in ReferenceAsset.provider_handles
+HEYGEN_PROVIDER = 'heygen'
+
+
+def _heygen_image_key(ref_img, api_key):
+    """Upload a reference image to HeyGen, once per asset. Returns (asset, image_key)."""
+    asset = ensure_reference_asset(ref_img)
+    image_key = asset.provider_handles.get(HEYGEN_PROVIDER)
+    if image_key:
+        print(f"♻️ Reusing HeyGen image_key of reference asset {asset.sha256[:12]}: {image_key}")
+        return asset, image_key
+    
+    try:
+        file_content = read_reference_asset(asset)
+    except Exception as e:
+        raise Exception(f"Failed to read reference image: {str(e)}")
+    
+    # Use correct HeyGen upload endpoint: https://upload.heygen.com/v1/asset
+    upload_url = "https://upload.heygen.com/v1/asset"
+    
+    # Determine Content-Type from image content type
+    content_type = ref_img.content_type or asset.content_type
+    if not content_type or not content_type.startswith('image/'):
+        content_type = 'image/jpeg'
+    
+    upload_headers = {
+        'Content-Type': content_type,
+        'x-api-key': api_key
+    }
+    
+    # Upload image to HeyGen (using data parameter with file content)
+    try:
+        print(f"📤 Uploading image to HeyGen: {upload_url}")
+        upload_response = requests.post(
+            upload_url, 
+            headers=upload_headers, 
+            data=file_content, 
+            timeout=30
+        )
+    except Exception as e:
+        raise Exception(f"Error uploading image to HeyGen: {str(e)}")
+    
+    if upload_response.status_code != 200:
+        raise Exception(f"Failed to upload image: {upload_response.status_code} - {upload_response.text[:500]}")
+    
+    upload_data = upload_response.json()
+    print(f"📥 Upload response: {upload_data}")
+    
+    # Extract image_key from response
+    image_key = (
+        upload_data.get('image_key') or
+        upload_data.get('data', {}).get('image_key') or
+        upload_data.get('data', {}).get('key')
+    )
+    if not image_key:
+        raise Exception(f"Upload succeeded but no image_key found in response: {upload_data}")
+    
+    print(f"✅ Image uploaded successfully!")
+    print(f"🔑 Received image_key: {image_key}")
+    remember_provider_handle(asset, HEYGEN_PROVIDER, image_key)
+    return asset, image_key
+
+
 class AvatarGenerationView(APIView):
     parser_classes = [MultiPartParser, FormParser]
     
@@ -739,10 +805,8 @@ class AvatarGenerationView(APIView):
                     try:
                         if not file.content_type.startswith('image/'):
                             continue
-                        file_content = file.read()
-                        base64_image = base64.b64encode(file_content).decode('utf-8')
                         reference_images.append({
-                            "image": base64_image,
+                            "asset": store_uploaded_reference(file),
                             "image_type": file.content_type,
                             "filename": file.name
                         })
@@ -804,7 +868,7 @@ class AvatarGenerationView(APIView):
             for ref_img in reference_images:
                 AvatarReferenceImage.objects.create(
                     job=job,
-                    image_data=ref_img["image"],
+                    asset=ref_img["asset"],
                     filename=ref_img.get("filename", "reference.jpg"),
                     content_type=ref_img.get("image_type", "image/jpeg")
                 )
@@ -867,9 +931,9 @@ class AvatarGenerationView(APIView):
             
             # Get reference images from database (same pattern as image_generation_view)
             reference_images = []
-            for ref_img in job.reference_images.all():
+            for ref_img in job.reference_images.select_related('asset'):
                 reference_images.append({
-                    "image": ref_img.image_data,
+                    "reference": ref_img,
                     "filename": ref_img.filename,
                     "content_type": ref_img.content_type
                 })
@@ -878,85 +942,18 @@ class AvatarGenerationView(APIView):
             job.save()
             
             # Determine which endpoint and payload to use based on reference image presence
+            reference_asset = None
             if reference_images:
                 # Step 1: Upload reference image to HeyGen to get image_key
                 print(f"🖼️  Found {len(reference_images)} reference image(s) - uploading to HeyGen first...")
                 reference_image = reference_images[0]
                 image_name = reference_image['filename'] or "reference.jpg"
                 
-                # Decode base64 image data
-                try:
-                    file_content = base64.b64decode(reference_image["image"])
-                except Exception as e:
-                    error_msg = f"Failed to decode reference image: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    job.status = "error"
-                    job.progress = 0
-                    job.completed_at = timezone.now()
-                    job.error_message = error_msg
-                    job.save()
-                    return
-                
-                # Use correct HeyGen upload endpoint: https://upload.heygen.com/v1/asset
-                upload_url = "https://upload.heygen.com/v1/asset"
-                
-                # Determine Content-Type from image content type
-                content_type = reference_image.get('content_type', 'image/jpeg')
-                if not content_type or not content_type.startswith('image/'):
-                    content_type = 'image/jpeg'
-                
-                upload_headers = {
-                    'Content-Type': content_type,
-                    'x-api-key': api_key
-                }
-                
-                # Upload image to HeyGen (using data parameter with file content)
+                # Uploaded once per asset: later jobs with the same image reuse its image_key
                 try:
-                    print(f"📤 Uploading image to HeyGen: {upload_url}")
-                    upload_response = requests.post(
-                        upload_url, 
-                        headers=upload_headers, 
-                        data=file_content, 
-                        timeout=30
-                    )
-                    
-                    if upload_response.status_code == 200:
-                        upload_data = upload_response.json()
-                        print(f"📥 Upload response: {upload_data}")
-                        
-                        # Extract image_key from response
-                        image_key = (
-                            upload_data.get('image_key') or
-                            upload_data.get('data', {}).get('image_key') or
-                            upload_data.get('data', {}).get('key')
-                        )
-                        
-                        if image_key:
-                            print(f"✅ Image uploaded successfully!")
-                            print(f"🔑 Received image_key: {image_key}")
-                            job.image_key = image_key
-                            job.save()
-                        else:
-                            error_msg = f"Upload succeeded but no image_key found in response: {upload_data}"
-                            print(f"❌ {error_msg}")
-                            job.status = "error"
-                            job.progress = 0
-                            job.completed_at = timezone.now()
-                            job.error_message = error_msg
-                            job.save()
-                            return
-                    else:
-                        error_msg = f"Failed to upload image: {upload_response.status_code} - {upload_response.text[:500]}"
-                        print(f"❌ {error_msg}")
-                        job.status = "error"
-                        job.progress = 0
-                        job.completed_at = timezone.now()
-                        job.error_message = error_msg
-                        job.save()
-                        return
-                        
+                    reference_asset, image_key = _heygen_image_key(reference_image["reference"], api_key)
                 except Exception as e:
-                    error_msg = f"Error uploading image to HeyGen: {str(e)}"
+                    error_msg = str(e)
                     print(f"❌ {error_msg}")
                     job.status = "error"
                     job.progress = 0
@@ -964,6 +961,8 @@ class AvatarGenerationView(APIView):
                     job.error_message = error_msg
                     job.save()
                     return
+                job.image_key = image_key
+                job.save()
                 
                 # Step 2: Use avatar_group/create endpoint with the uploaded image_key
                 print(f"📝 Using reference image: {image_name}")
@@ -1046,6 +1045,9 @@ class AvatarGenerationView(APIView):
                 return
             
             if create_response.status_code != 200:
+                if reference_asset is not None:
+                    # The reused image_key may have expired at HeyGen: upload the image again next time
+                    forget_provider_handle(reference_asset, HEYGEN_PROVIDER)
                 error_msg = f"Failed to create avatar: {create_response.status_code} - {create_response.text[:500]}"
                 print(f"❌ {error_msg}")
                 print(f"💡 Used URL: {create_avatar_url}")
@@ -2286,9 +2288,9 @@ class AvatarRetryJobView(APIView):
             
             # Get reference images from database (same pattern as main method)
             reference_images = []
-            for ref_img in job.reference_images.all():
+            for ref_img in job.reference_images.select_related('asset'):
                 reference_images.append({
-                    "image": ref_img.image_data,
+                    "reference": ref_img,
                     "filename": ref_img.filename,
                     "content_type": ref_img.content_type
                 })
@@ -2297,85 +2299,18 @@ class AvatarRetryJobView(APIView):
             job.save()
             
             # Determine which endpoint and payload to use based on reference image presence
+            reference_asset = None
             if reference_images:
                 # Step 1: Upload reference image to HeyGen to get image_key
                 print(f"🖼️  Found {len(reference_images)} reference image(s) - uploading to HeyGen first...")
                 reference_image = reference_images[0]
                 image_name = reference_image['filename'] or "reference.jpg"
                 
-                # Decode base64 image data
-                try:
-                    file_content = base64.b64decode(reference_image["image"])
-                except Exception as e:
-                    error_msg = f"Failed to decode reference image: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    job.status = "error"
-                    job.progress = 0
-                    job.completed_at = timezone.now()
-                    job.error_message = error_msg
-                    job.save()
-                    return
-                
-                # Use correct HeyGen upload endpoint: https://upload.heygen.com/v1/asset
-                upload_url = "https://upload.heygen.com/v1/asset"
-                
-                # Determine Content-Type from image content type
-                content_type = reference_image.get('content_type', 'image/jpeg')
-                if not content_type or not content_type.startswith('image/'):
-                    content_type = 'image/jpeg'
-                
-                upload_headers = {
-                    'Content-Type': content_type,
-                    'x-api-key': api_key
-                }
-                
-                # Upload image to HeyGen (using data parameter with file content)
+                # Uploaded once per asset: later jobs with the same image reuse its image_key
                 try:
-                    print(f"📤 Uploading image to HeyGen: {upload_url}")
-                    upload_response = requests.post(
-                        upload_url, 
-                        headers=upload_headers, 
-                        data=file_content, 
-                        timeout=30
-                    )
-                    
-                    if upload_response.status_code == 200:
-                        upload_data = upload_response.json()
-                        print(f"📥 Upload response: {upload_data}")
-                        
-                        # Extract image_key from response
-                        image_key = (
-                            upload_data.get('image_key') or
-                            upload_data.get('data', {}).get('image_key') or
-                            upload_data.get('data', {}).get('key')
-                        )
-                        
-                        if image_key:
-                            print(f"✅ Image uploaded successfully!")
-                            print(f"🔑 Received image_key: {image_key}")
-                            job.image_key = image_key
-                            job.save()
-                        else:
-                            error_msg = f"Upload succeeded but no image_key found in response: {upload_data}"
-                            print(f"❌ {error_msg}")
-                            job.status = "error"
-                            job.progress = 0
-                            job.completed_at = timezone.now()
-                            job.error_message = error_msg
-                            job.save()
-                            return
-                    else:
-                        error_msg = f"Failed to upload image: {upload_response.status_code} - {upload_response.text[:500]}"
-                        print(f"❌ {error_msg}")
-                        job.status = "error"
-                        job.progress = 0
-                        job.completed_at = timezone.now()
-                        job.error_message = error_msg
-                        job.save()
-                        return
-                        
+                    reference_asset, image_key = _heygen_image_key(reference_image["reference"], api_key)
                 except Exception as e:
-                    error_msg = f"Error uploading image to HeyGen: {str(e)}"
+                    error_msg = str(e)
                     print(f"❌ {error_msg}")
                     job.status = "error"
                     job.progress = 0
@@ -2383,6 +2318,8 @@ class AvatarRetryJobView(APIView):
                     job.error_message = error_msg
                     job.save()
                     return
+                job.image_key = image_key
+                job.save()
                 
                 # Step 2: Use avatar_group/create endpoint with the uploaded image_key
                 print(f"📝 Using reference image: {image_name}")
@@ -2465,6 +2402,9 @@ class AvatarRetryJobView(APIView):
                 return
             
             if create_response.status_code != 200:
+                if reference_asset is not None:
+                    # The reused image_key may have expired at HeyGen: upload the image again next time
+                    forget_provider_handle(reference_asset, HEYGEN_PROVIDER)
                 error_msg = f"Failed to create avatar: {create_response.status_code} - {create_response.text[:500]}"
                 print(f"❌ {error_msg}")
                 print(f"💡 Used URL: {create_avatar_url}")
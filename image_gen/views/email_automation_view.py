@@ -4,23 +4,41 @@ import base64
 import re
 import traceback
 import html
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime
 from io import BytesIO
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import Q
+from django.urls import reverse
+from django.core.exceptions import ValidationError
 from rest_framework.views import APIView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.http import HttpResponse, JsonResponse
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google.auth.exceptions import RefreshError
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload
 from utils.decorators import user_token_auth
 from utils.response import ResponseView
-from utils.constant import SUCCESS, FAIL
+from utils.constant import SUCCESS, FAIL, HTTP_ACCEPTED
+from utils.gmail_queue import enqueue_notification, extend_sync_lease
+from utils.invoice_classifier import DEFAULT_CLASSIFIER, classifier_for_account
+from utils.drive_folders import drive_folders, INVOICE_ROOT_FOLDER
+from utils.parallel_transfers import run_transfers
+from utils.attachment_stream import stream_response, spool_base64_field, chunked_media
+from utils.email_parsing import ParsedMessage
+from utils.google_clients import google_clients
+from utils.rate_limit import gmail_rate_limiter
+from utils.processed_emails import unprocessed_message_ids, remember_processed
+from utils.gmail_watch import GmailWatchPermissionError, pubsub_topic, watch_request_body, watch_expiration
+from utils.email_search import search_body_text, update_search_vectors, search_processed_emails
+from utils.email_outbox import (
+    EMAIL_FILE_KEY, attachment_key, drive_app_properties, find_drive_copies, open_outbox_entry,
+    save_step, claim_unfinished_entries, record_outbox_error, mark_archived
+)
 from image_gen.db_models.user import Users
-from image_gen.models import EmailAccount, ProcessedEmail
+from image_gen.models import EmailAccount, ProcessedEmail, EmailSetupTask
 
 
 class EmailAutomationView(APIView):
@@ -97,6 +115,18 @@ class EmailAutomationView(APIView):
                     code=FAIL
                 )
             
+            # Optional custom invoice keywords/sender domains (used on top of the defaults)
+            custom_lists = {}
+            for field in ('invoice_keywords', 'invoice_domains'):
+                if field in data:
+                    values = data.get(field) or []
+                    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                        return ResponseView.error_response_without_data(
+                            message=f"{field} must be a list of strings",
+                            code=FAIL
+                        )
+                    custom_lists[field] = [value.strip().lower() for value in values if value.strip()]
+            
             # Check if account already exists
             try:
                 email_account, created = EmailAccount.objects.get_or_create(
@@ -104,7 +134,8 @@ class EmailAutomationView(APIView):
                     email=email,
                     defaults={
                         'credentials': credentials_json,
-                        'is_active': True
+                        'is_active': True,
+                        **custom_lists
                     }
                 )
                 
@@ -112,7 +143,9 @@ class EmailAutomationView(APIView):
                     # Update credentials if account exists
                     email_account.credentials = credentials_json
                     email_account.is_active = True
-                    email_account.save()
+                    for field, values in custom_lists.items():
+                        setattr(email_account, field, values)
+                    email_account.save(update_fields=['credentials', 'is_active', 'updated_at', *custom_lists])
             except Exception as db_error:
                 print(f"Database error: {db_error}")
                 print(f"Traceback: {traceback.format_exc()}")
@@ -121,122 +154,33 @@ class EmailAutomationView(APIView):
                     code=FAIL
                 )
             
-            # Set up Gmail watch
-            try:
-                print(f"Setting up Gmail watch for {email}...")
-                watch_result = self._setup_gmail_watch(email, credentials_json)
-                print(f"Gmail watch setup successful: {watch_result}")
-                
-                # Store the OLD history ID before updating (to process emails since last check)
-                old_history_id = email_account.watch_history_id
-                
-                # Update with NEW history ID from watch response
-                email_account.watch_history_id = watch_result.get('historyId')
-                email_account.watch_expiration = timezone.now() + timedelta(days=7)
-                email_account.is_automated = True
-                email_account.save()
-                
-                # Process existing emails immediately after setting up watch
-                # Use the OLD history ID to get emails that arrived since last processing
-                # This ensures we process emails that arrived between the last check and now
-                print(f"\n🔄 Processing existing emails immediately...")
-                print(f"   Old history ID: {old_history_id}")
-                print(f"   New history ID: {email_account.watch_history_id}")
-                
-                try:
-                    service = EmailAutomationService()
-                    # Use OLD history ID to get emails since last processing
-                    # If old_history_id is None, it will process all unread emails
-                    service.process_new_emails(
-                        email_account,
-                        old_history_id  # Use OLD history ID, not the new one!
-                    )
-                    print(f"✅ Immediate email processing completed")
-                except Exception as process_error:
-                    # Don't fail the whole setup if immediate processing fails
-                    print(f"⚠️ Immediate email processing failed (but watch is set up): {process_error}")
-                    print(f"   Traceback: {traceback.format_exc()}")
-                    print(f"   Emails will still be processed via webhook when new emails arrive")
-                
-                # Reload account to get updated history ID after processing
-                email_account.refresh_from_db()
-                
-                return ResponseView.success_response_data(
-                    data={
-                        'email': email,
-                        'watch_history_id': email_account.watch_history_id,
-                        'expiration': email_account.watch_expiration.isoformat()
-                    },
-                    message="Email automation set up successfully. Existing emails processed.",
-                    code=SUCCESS
-                )
-            except ValueError as e:
-                error_msg = str(e)
-                print(f"Gmail watch setup ValueError: {error_msg}")
-                print(f"Traceback: {traceback.format_exc()}")
-                return ResponseView.error_response_without_data(
-                    message=error_msg,
-                    code=FAIL
-                )
-            except HttpError as e:
-                error_details = e.error_details if hasattr(e, 'error_details') else str(e)
-                error_code = e.resp.status if hasattr(e, 'resp') else 'Unknown'
-                
-                # Check for specific permission errors
-                error_msg = str(error_details)
-                if 'not authorized' in error_msg.lower() or 'forbidden' in error_msg.lower() or error_code == 403:
-                    # Use the email from the request (this is the authenticated Gmail account)
-                    authenticated_email = email if email else "the authenticated user"
-                    
-                    # Get project ID from env for the error message
-                    project_id_for_error = os.getenv('GOOGLE_CLOUD_PROJECT_ID', 'automationspecialist')
-                    project_number_for_error = os.getenv('GOOGLE_CLOUD_PROJECT_NUMBER', '37019452145')
-                    gmail_service_account_for_error = f"service-{project_number_for_error}@gcp-sa-gmail.iam.gserviceaccount.com"
-                    
-                    detailed_msg = (
-                        f"⚠️ Gmail API Permission Error (403 Forbidden)\n\n"
-                        f"❌ Gmail watch setup failed due to missing Pub/Sub permissions.\n\n"
-                        f"🔑 CRITICAL: Gmail Watch uses a SERVICE ACCOUNT, NOT your user email!\n"
-                        f"   The identity that needs permission is:\n"
-                        f"   {gmail_service_account_for_error}\n\n"
-                        f"🔍 FIX THIS NOW:\n\n"
-                        f"1️⃣ GRANT PERMISSION TO GMAIL SERVICE ACCOUNT:\n"
-                        f"   • Topic Level: https://console.cloud.google.com/cloudpubsub/topic/detail/gmail-notifs?project={project_id_for_error}\n"
-                        f"     → PERMISSIONS tab → ADD PRINCIPAL\n"
-                        f"     → Principal: {gmail_service_account_for_error}\n"
-                        f"     → Role: Pub/Sub Publisher\n"
-                        f"     → SAVE\n\n"
-                        f"   • Project Level: https://console.cloud.google.com/iam-admin/iam?project={project_id_for_error}\n"
-                        f"     → GRANT ACCESS\n"
-                        f"     → New principals: {gmail_service_account_for_error}\n"
-                        f"     → Role: Pub/Sub Publisher\n"
-                        f"     → SAVE\n\n"
-                        f"2️⃣ WAIT 5-10 MINUTES for permission propagation\n\n"
-                        f"3️⃣ TRY AGAIN\n\n"
-                        f"📋 SUMMARY:\n"
-                        f"   • Service Account: {gmail_service_account_for_error}\n"
-                        f"   • Permission needed: Pub/Sub Publisher\n"
-                        f"   • Grant at: Topic level AND Project level\n"
-                        f"   • Wait: 5-10 minutes after granting\n"
+            # The Gmail watch (with its permission retries) and the initial sync run in the
+            # background (utils.setup_tasks); the client follows progress on the status endpoint
+            EmailSetupTask.objects.filter(email_account=email_account, status='queued').update(
+                status='failed',
+                error_message="Superseded by a newer setup request",
+                completed_at=timezone.now()
+            )
+            task = EmailSetupTask.objects.create(
+                email_account=email_account,
+                start_history_id=email_account.watch_history_id
+            )
+            print(f"📥 Queued setup task {task.task_id} for {email}")
+            
+            return ResponseView.success_response_data(
+                data={
+                    'email': email,
+                    'task_id': str(task.task_id),
+                    'stage': task.stage,
+                    'status': task.status,
+                    'status_url': request.build_absolute_uri(
+                        reverse('email-automation-setup-status', args=[task.task_id])
                     )
-                else:
-                    detailed_msg = f"Gmail API error (Code {error_code}): {error_msg}"
-                
-                print(f"Gmail watch setup HttpError: {detailed_msg}")
-                print(f"Traceback: {traceback.format_exc()}")
-                return ResponseView.error_response_without_data(
-                    message=detailed_msg,
-                    code=FAIL
-                )
-            except Exception as e:
-                error_msg = str(e)
-                error_type = type(e).__name__
-                print(f"Gmail watch setup error ({error_type}): {error_msg}")
-                print(f"Full traceback: {traceback.format_exc()}")
-                return ResponseView.error_response_without_data(
-                    message=f"Failed to set up Gmail watch: {error_msg}",
-                    code=FAIL
-                )
+                },
+                message="Email automation setup started. Check the status endpoint for progress.",
+                code=SUCCESS,
+                http_status=HTTP_ACCEPTED
+            )
                 
         except Exception as e:
             error_type = type(e).__name__
@@ -257,56 +201,161 @@ class EmailAutomationView(APIView):
                 message=f"Internal server error: {error_msg} (Type: {error_type})",
                 code=FAIL
             )
+
+
+class EmailSetupTaskStatusView(APIView):
+    """Progress of a background email automation setup"""
     
-    def _setup_gmail_watch(self, email, credentials_json):
-        """Set up Gmail watch for push notifications"""
-        print(f"_setup_gmail_watch called for {email}")
-        
-        # Handle different credential formats
-        if isinstance(credentials_json, dict):
-            # If it's a dict with credential JWT, we need OAuth2 tokens
-            # For production: implement OAuth2 flow to exchange JWT for access/refresh tokens
-            if 'credential' in credentials_json:
-                # This is a Google Sign-In credential - need OAuth2 flow
-                raise ValueError(
-                    "Google Sign-In credential provided. Please use OAuth2 flow with scopes: "
-                    "https://www.googleapis.com/auth/gmail.readonly, "
-                    "https://www.googleapis.com/auth/gmail.modify, "
-                    "https://www.googleapis.com/auth/drive.file"
+    @user_token_auth
+    def get(self, request, task_id):
+        try:
+            user = request.auth_user
+            if not user:
+                return ResponseView.error_response_without_data(
+                    "Authentication required",
+                    code=FAIL
                 )
             
-            # Assume it's proper OAuth2 credentials
             try:
-                print("Creating credentials from authorized user info...")
-                creds = Credentials.from_authorized_user_info(credentials_json)
-                print("Credentials created successfully")
-            except Exception as cred_error:
-                print(f"Error creating credentials: {cred_error}")
-                print(f"Credentials keys: {list(credentials_json.keys()) if isinstance(credentials_json, dict) else 'N/A'}")
-                print(f"Traceback: {traceback.format_exc()}")
-                raise ValueError(f"Invalid credentials format: {str(cred_error)}")
-        else:
-            raise ValueError("Invalid credentials format - expected a dictionary")
+                task = EmailSetupTask.objects.select_related('email_account').get(
+                    task_id=task_id,
+                    email_account__user=user
+                )
+            except (EmailSetupTask.DoesNotExist, ValidationError):
+                return ResponseView.error_response_without_data(
+                    "Setup task not found or access denied",
+                    code=FAIL
+                )
+            
+            email_account = task.email_account
+            return ResponseView.success_response_data(
+                data={
+                    "task_id": str(task.task_id),
+                    "email": email_account.email,
+                    "stage": task.stage,
+                    "status": task.status,
+                    "sync_mode": task.sync_mode,
+                    "watch_attempts": task.watch_attempts,
+                    "processed_count": task.processed_count,
+                    "backfill_in_progress": bool(email_account.backfill_history_id),
+                    "watch_expiration": email_account.watch_expiration.isoformat() if email_account.watch_expiration else None,
+                    "error_message": task.error_message,
+                    "created_at": task.created_at.isoformat() if task.created_at else None,
+                    "started_at": task.started_at.isoformat() if task.started_at else None,
+                    "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+                },
+                message="Setup task status retrieved successfully",
+                code=SUCCESS
+            )
+            
+        except Exception as e:
+            print(f"❌ Error in EmailSetupTaskStatusView: {str(e)}")
+            print(traceback.format_exc())
+            return ResponseView.error_response_without_data(
+                f"Error retrieving setup task status: {str(e)}",
+                code=FAIL
+            )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GmailPushWebhookView(APIView):
+    """Receive Gmail push notifications from Pub/Sub and queue them for the workers"""
+    
+    def post(self, request):
+        print("📬 GMAIL PUSH WEBHOOK RECEIVED")
         
-        # Refresh token if expired
-        if creds.expired and creds.refresh_token:
-            print("Credentials expired, refreshing...")
+        try:
+            # Pub/Sub sends data in specific format
+            envelope = json.loads(request.body)
+            
+            # Decode the message (Google uses base64url encoding, not standard base64)
+            # base64url is URL-safe base64 encoding (uses - and _ instead of + and /)
+            message_data_encoded = envelope['message']['data']
+            
+            # Add padding if needed (base64 requires length to be multiple of 4)
+            padding = len(message_data_encoded) % 4
+            if padding:
+                message_data_encoded += '=' * (4 - padding)
+            message_data = base64.urlsafe_b64decode(message_data_encoded).decode('utf-8')
+            data = json.loads(message_data)
+            
+            # Extract email address and historyId
+            email_address = data.get('emailAddress')
+            history_id = data.get('historyId')
+            message_id = envelope.get('message', {}).get('messageId')  # Pub/Sub message ID for deduplication
+            
+            print(f"📧 Email address: {email_address}, 📜 History ID: {history_id}, 📨 Pub/Sub Message ID: {message_id}")
+            
+            if not email_address:
+                print("❌ No email address in notification")
+                return HttpResponse(status=400)
+            
+            # Persist the notification and acknowledge immediately.
+            # The sync itself runs in the process_gmail_notifications workers.
             try:
-                creds.refresh(Request())
-                print("Credentials refreshed successfully")
-            except Exception as refresh_error:
-                print(f"Error refreshing credentials: {refresh_error}")
-                raise ValueError(f"Failed to refresh credentials: {str(refresh_error)}")
+                enqueue_notification(email_address, history_id, message_id)
+            except Exception as queue_error:
+                # Not persisted - let Pub/Sub redeliver instead of losing the notification
+                print(f"❌ Failed to queue notification: {queue_error}")
+                return HttpResponse(status=503)
+            
+            print("✅ Notification queued")
+            return HttpResponse(status=200)
+            
+        except Exception as e:
+            print(f"❌ GmailPushWebhookView error: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            # Return 200 to Pub/Sub even on error to prevent retries
+            return HttpResponse(status=200)
+
+
+class EmailAutomationService:
+    """Service class for email automation logic"""
+    
+    # Gmail allows up to 100 calls per batch request but recommends at most 50
+    BATCH_SIZE = 50
+    
+    # History page size (Gmail maximum is 500)
+    HISTORY_PAGE_SIZE = int(os.getenv('GMAIL_HISTORY_PAGE_SIZE', '500'))
+    
+    # Backfill when there is no usable history ID. Use broader query to catch all emails, not
+    # just unread ones (in case email was already read but not processed).
+    BACKFILL_QUERY = os.getenv('GMAIL_BACKFILL_QUERY', 'in:inbox')
+    BACKFILL_PAGE_SIZE = int(os.getenv('GMAIL_BACKFILL_PAGE_SIZE', '100'))
+    BACKFILL_PAGES_PER_RUN = int(os.getenv('GMAIL_BACKFILL_PAGES_PER_RUN', '5'))
+    
+    # Opt-in: Gmail labels (e.g. CATEGORY_PROMOTIONS,CATEGORY_SOCIAL) that reject a message during
+    # metadata triage unless its subject, sender or snippet already matched. Empty by default, so
+    # triage only accepts or escalates and every undecided message has its body scanned.
+    TRIAGE_SKIP_LABELS = frozenset(
+        label.strip()
+        for label in os.getenv('INVOICE_TRIAGE_SKIP_LABELS', '').split(',')
+        if label.strip()
+    )
+    
+    def setup_gmail_watch(self, email_account):
+        """Call users().watch once for the account. Returns the watch response.
         
-        # Build Gmail service
+        Raises GmailWatchPermissionError when Gmail may not publish to the Pub/Sub topic
+        (the setup task retries that later) and ValueError for other failures.
+        """
+        email = email_account.email
+        credentials_json = email_account.credentials
+        print(f"setup_gmail_watch called for {email}")
+        
+        # Get the (cached) Gmail service; credentials are refreshed if they are about to expire
         try:
-            print("Building Gmail service...")
-            service = build('gmail', 'v1', credentials=creds)
-            print("Gmail service built successfully")
-        except Exception as build_error:
-            print(f"Error building Gmail service: {build_error}")
+            print("Loading Gmail service...")
+            service = google_clients.get(email_account).gmail
+            print("Gmail service ready")
+        except RefreshError as refresh_error:
+            print(f"Error refreshing credentials: {refresh_error}")
+            raise ValueError(f"Failed to refresh credentials: {str(refresh_error)}")
+        except Exception as cred_error:
+            print(f"Error creating credentials: {cred_error}")
+            print(f"Credentials keys: {list(credentials_json.keys())}")
             print(f"Traceback: {traceback.format_exc()}")
-            raise ValueError(f"Failed to build Gmail service: {str(build_error)}")
+            raise ValueError(f"Invalid credentials format: {str(cred_error)}")
         
         # Get the authenticated user's email from Gmail API
         try:
@@ -314,50 +363,21 @@ class EmailAutomationView(APIView):
             profile = service.users().getProfile(userId='me').execute()
             authenticated_email = profile.get('emailAddress', '')
             print(f"✓ Authenticated Gmail account: {authenticated_email}")
-            print(f"  (This is the email that needs Pub/Sub Publisher permission)")
         except Exception as profile_error:
             print(f"⚠ Could not fetch user profile: {profile_error}")
             authenticated_email = email  # Fallback to provided email
             print(f"  Using provided email: {authenticated_email}")
         
-        # Get Pub/Sub topic name from environment
-        project_id = os.getenv('GOOGLE_CLOUD_PROJECT_ID')
-        project_number = os.getenv('GOOGLE_CLOUD_PROJECT_NUMBER', '37019452145')  # Default to known project number
-        topic_name = os.getenv('GMAIL_PUBSUB_TOPIC')
-        
         # Gmail Watch API uses a special Gmail service account, NOT the user's email
         # Format: service-{project-number}@gcp-sa-gmail.iam.gserviceaccount.com
+        project_id = os.getenv('GOOGLE_CLOUD_PROJECT_ID')
+        project_number = os.getenv('GOOGLE_CLOUD_PROJECT_NUMBER', '37019452145')  # Default to known project number
         gmail_service_account = f"service-{project_number}@gcp-sa-gmail.iam.gserviceaccount.com"
         
-        print(f"Project ID: {project_id}")
-        print(f"Project Number: {project_number}")
-        print(f"Topic name from env: {topic_name}")
-        print(f"Authenticated Gmail user: {authenticated_email}")
-        print(f"🔑 Gmail Service Account (needs Pub/Sub Publisher permission): {gmail_service_account}")
-        
-        if not project_id:
-            raise ValueError("GOOGLE_CLOUD_PROJECT_ID not configured. Set it in your .env file.")
-        
-        # Construct topic name if not provided
-        if not topic_name:
-            topic_name = f'projects/{project_id}/topics/gmail-notifs'
-        elif not topic_name.startswith('projects/'):
-            # If just topic ID is provided, construct full path
-            topic_name = f'projects/{project_id}/topics/{topic_name}'
-        
-        print(f"Using topic name: {topic_name}")
-        
-        # Set up Gmail watch (following Google Cloud documentation)
-        request_body = {
-            'labelIds': ['INBOX'],
-            'topicName': topic_name,
-            'labelFilterBehavior': 'INCLUDE'  # Include only messages with these labels
-        }
+        topic_name = pubsub_topic()
+        request_body = watch_request_body(topic_name)
         
         print(f"Calling Gmail watch API with body: {request_body}")
-        print(f"🔑 CRITICAL: Gmail Watch uses a SERVICE ACCOUNT, not the user's email!")
-        print(f"⚠️ The Gmail Service Account '{gmail_service_account}' MUST have 'Pub/Sub Publisher' role")
-        print(f"⚠️ Permission should be granted at BOTH topic level AND project level")
         print(f"📋 Debug Info:")
         print(f"   - Authenticated Gmail user: {authenticated_email} (this is NOT the identity that needs permission)")
         print(f"   - Gmail Service Account: {gmail_service_account} (THIS needs Pub/Sub Publisher permission)")
@@ -367,63 +387,18 @@ class EmailAutomationView(APIView):
         print(f"   - Client ID: {credentials_json.get('client_id', 'N/A')[:50]}...")
         print(f"   - Scopes: {credentials_json.get('scopes', [])}")
         
-        # Retry mechanism with delay (in case of propagation delay)
-        max_retries = 5  # Increased retries
-        retry_delay = 5  # Start with 5 seconds
-        
-        last_error = None
-        for attempt in range(1, max_retries + 1):
-            try:
-                print(f"Attempt {attempt}/{max_retries} to set up Gmail watch...")
-                response = service.users().watch(userId='me', body=request_body).execute()
-                print(f"✅ Gmail watch response: {response}")
-                # Response contains: historyId and expiration (timestamp in milliseconds)
-                # Store these for later use (watch renewal, history tracking)
-                if 'historyId' in response:
-                    print(f"   History ID: {response['historyId']}")
-                if 'expiration' in response:
-                    # Convert milliseconds to datetime
-                    expiration_timestamp = int(response['expiration']) / 1000  # Convert to seconds
-                    expiration_dt = datetime.fromtimestamp(expiration_timestamp)
-                    print(f"   Watch expiration: {expiration_dt}")
-                    print(f"   ⚠️ IMPORTANT: Watch must be renewed before expiration (recommended: once per day)")
-                    print(f"   ⚠️ Watch must be renewed at least every 7 days to continue receiving notifications")
-                return response
-            except HttpError as e:
-                error_details = e.error_details if hasattr(e, 'error_details') else str(e)
-                error_code = e.resp.status if hasattr(e, 'resp') else 'Unknown'
-                last_error = e
-                
-                # If it's a permission error and we have retries left, wait and retry
-                if ('not authorized' in str(error_details).lower() or 'forbidden' in str(error_details).lower() or error_code == 403) and attempt < max_retries:
-                    print(f"⚠️ Permission error on attempt {attempt}/{max_retries}")
-                    print(f"   Error: {error_details}")
-                    print(f"   Waiting {retry_delay} seconds before retry (permissions may still be propagating)...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay = min(retry_delay * 1.5, 30)  # Exponential backoff, max 30 seconds
-                    continue
-                else:
-                    # All retries exhausted or non-403 error, break and handle below
-                    break
-            except Exception as e:
-                # Non-HttpError exception, re-raise immediately
-                print(f"Unexpected error calling Gmail watch: {e}")
-                print(f"Traceback: {traceback.format_exc()}")
-                raise
-        
-        # If we get here, all retries failed
-        if last_error:
-            error_details = last_error.error_details if hasattr(last_error, 'error_details') else str(last_error)
-            error_code = last_error.resp.status if hasattr(last_error, 'resp') else 'Unknown'
-            print(f"Gmail API HttpError after {max_retries} attempts: {error_details}")
+        try:
+            response = service.users().watch(userId='me', body=request_body).execute()
+        except HttpError as e:
+            error_details = e.error_details if hasattr(e, 'error_details') else str(e)
+            error_code = e.resp.status if hasattr(e, 'resp') else 'Unknown'
+            print(f"Gmail API HttpError: {error_details}")
             print(f"Error code: {error_code}")
-            print(f"🔑 CRITICAL: The Gmail Service Account '{gmail_service_account}' needs 'Pub/Sub Publisher' permission")
-            print(f"   NOT the user email '{authenticated_email}'!")
-            print(f"Topic that needs permission: {topic_name}")
             
-            # Enhanced error message with correct service account
-            if error_code == 403:
+            if 'not authorized' in str(error_details).lower() or 'forbidden' in str(error_details).lower() or error_code == 403:
+                print(f"🔑 CRITICAL: The Gmail Service Account '{gmail_service_account}' needs 'Pub/Sub Publisher' permission")
+                print(f"   NOT the user email '{authenticated_email}'!")
+                print(f"Topic that needs permission: {topic_name}")
                 detailed_msg = (
                     f"⚠️ Gmail API Permission Error (403 Forbidden)\n\n"
                     f"❌ Gmail watch setup failed due to missing Pub/Sub permissions.\n\n"
@@ -451,240 +426,264 @@ class EmailAutomationView(APIView):
                     f"   • Grant at: Topic level AND Project level\n"
                     f"   • Wait: 5-10 minutes after granting\n"
                 )
-                raise ValueError(detailed_msg)
-            else:
-                raise ValueError(f"Gmail API error: {error_details}")
-
-
-@method_decorator(csrf_exempt, name='dispatch')
-class GmailPushWebhookView(APIView):
-    """Receive Gmail push notifications from Pub/Sub"""
+                raise GmailWatchPermissionError(detailed_msg)
+            raise ValueError(f"Gmail API error (Code {error_code}): {error_details}")
+        
+        print(f"✅ Gmail watch response: {response}")
+        # Response contains: historyId and expiration (timestamp in milliseconds)
+        if 'historyId' in response:
+            print(f"   History ID: {response['historyId']}")
+        if 'expiration' in response:
+            print(f"   Watch expiration: {watch_expiration(response)}")
+            print(f"   Renewed before expiry by the renew_gmail_watches command")
+        return response
     
-    def post(self, request):
-        print("\n" + "=" * 80)
-        print("📬 GMAIL PUSH WEBHOOK RECEIVED")
-        print("=" * 80)
-        print(f"Request method: {request.method}")
-        print(f"Request path: {request.path}")
-        print(f"Request headers: {dict(request.headers)}")
-        print(f"Request body length: {len(request.body) if request.body else 0}")
+    def process_new_emails(self, email_account, history_id=None):
+        """Process new emails and save invoice-related ones to Drive. Returns the number of invoices saved.
         
+        With a history_id, every page of the Gmail history since that ID is processed. Without one,
+        or when the history has expired, a backfill over GMAIL_BACKFILL_QUERY is started. A backfill
+        processes at most BACKFILL_PAGES_PER_RUN pages per call and continues from its checkpoint on
+        the next call.
+        """
         try:
-            # Pub/Sub sends data in specific format
-            envelope = json.loads(request.body)
-            print(f"Envelope keys: {list(envelope.keys())}")
-            print(f"Message keys: {list(envelope.get('message', {}).keys())}")
-            
-            # Verify the message came from Pub/Sub (optional but recommended)
-            # You can add verification logic here
-            
-            # Decode the message (Google uses base64url encoding, not standard base64)
-            # base64url is URL-safe base64 encoding (uses - and _ instead of + and /)
-            message_data_encoded = envelope['message']['data']
-            print(f"Encoded message data (first 50 chars): {message_data_encoded[:50]}...")
-            
-            # Add padding if needed (base64 requires length to be multiple of 4)
-            padding = len(message_data_encoded) % 4
-            if padding:
-                message_data_encoded += '=' * (4 - padding)
-            message_data = base64.urlsafe_b64decode(message_data_encoded).decode('utf-8')
-            print(f"Decoded message data: {message_data}")
-            
-            data = json.loads(message_data)
-            print(f"Parsed data: {data}")
-            
-            # Extract email address and historyId
-            email_address = data.get('emailAddress')
-            history_id = data.get('historyId')
-            message_id = envelope.get('message', {}).get('messageId')  # Pub/Sub message ID for deduplication
-            
-            print(f"📧 Email address: {email_address}")
-            print(f"📜 History ID: {history_id}")
-            print(f"📨 Pub/Sub Message ID: {message_id}")
-            
-            if not email_address:
-                print("❌ No email address in notification")
-                return HttpResponse(status=400)
-            
-            # Get email account
-            email_account = EmailAccount.objects.filter(
-                email=email_address,
-                is_active=True,
-                is_automated=True
-            ).first()
-            
-            if not email_account:
-                print(f"⚠️ Email account not found or not automated: {email_address}")
-                return HttpResponse(status=200)  # Account not found, but return 200 to Pub/Sub
-            
-            print(f"✅ Found email account: {email_account.email}")
-            print(f"   Current watch_history_id: {email_account.watch_history_id}")
-            print(f"   New history_id from notification: {history_id}")
-            
-            # Skip if notification's history_id is same or older than stored history_id
-            # This prevents processing duplicate notifications or notifications for changes we've already processed
-            if email_account.watch_history_id and history_id:
+            # Cached per account; refreshed tokens are written back only when they change
+            clients = google_clients.get(email_account)
+            gmail_service = clients.gmail
+            drive_service = clients.drive
+            limiter = gmail_rate_limiter(email_account.pk)
+            
+            # Default keywords plus the account's custom ones, compiled once and cached
+            classifier = classifier_for_account(email_account)
+            
+            # First finish the invoice saves an earlier run left halfway (see utils.email_outbox)
+            resumed_count = self._resume_outbox(gmail_service, drive_service, email_account, limiter)
+            
+            if email_account.backfill_history_id:
+                print(f"⏩ Resuming backfill for {email_account.email}")
+                processed_count = self._run_backfill(gmail_service, drive_service, email_account, classifier, limiter)
+            elif history_id:
+                # Get history to find new messages since the stored history_id
+                print(f"🔍 Querying Gmail history API from history_id: {history_id}")
                 try:
-                    stored_history_id_int = int(email_account.watch_history_id)
-                    notification_history_id_int = int(history_id)
+                    message_ids, latest_history_id = self._list_history_message_ids(gmail_service, history_id, limiter)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    # historyId is too old - Gmail only keeps about a week of history
+                    print(f"❌ History expired for history_id {history_id}, starting backfill")
+                    self._start_backfill(gmail_service, email_account, limiter)
+                    processed_count = self._run_backfill(gmail_service, drive_service, email_account, classifier, limiter)
+                else:
+                    print(f"📬 Total message(s) to process: {len(message_ids)}")
+                    processed_count = self._process_message_ids(
+                        message_ids, gmail_service, drive_service, email_account, classifier, limiter
+                    )
                     
-                    if notification_history_id_int <= stored_history_id_int:
-                        print(f"⏭️  Skipping notification: history_id ({history_id}) is same or older than stored ({email_account.watch_history_id})")
-                        print(f"   This notification is for changes we've already processed.")
-                        return HttpResponse(status=200)  # Return 200 to acknowledge receipt
-                except (ValueError, TypeError):
-                    # If history IDs can't be compared as integers, proceed with processing
-                    pass
-            
-            # Process new emails
-            # Use the STORED watch_history_id as starting point, not the notification's history_id
-            # The notification's history_id is the current state, but we need to query from the last known state
-            print("🔄 Starting to process new emails...")
-            print(f"   Using stored history_id ({email_account.watch_history_id}) as starting point")
-            EmailAutomationService().process_new_emails(
-                email_account, 
-                email_account.watch_history_id  # Use STORED history ID, not notification's history ID!
-            )
+                    # Update history ID after processing
+                    if latest_history_id and str(latest_history_id) != str(email_account.watch_history_id):
+                        email_account.watch_history_id = latest_history_id
+                        email_account.save(update_fields=['watch_history_id', 'updated_at'])
+                        print(f"✅ Updated history ID to: {latest_history_id}")
+            else:
+                print(f"⚠️ No history_id provided. Starting backfill with query: '{self.BACKFILL_QUERY}'")
+                self._start_backfill(gmail_service, email_account, limiter)
+                processed_count = self._run_backfill(gmail_service, drive_service, email_account, classifier, limiter)
             
-            print("✅ Email processing completed successfully")
-            print("=" * 80 + "\n")
-            return HttpResponse(status=200)
+            processed_count += resumed_count
+            if processed_count:
+                email_account.last_invoice_at = timezone.now()
+                email_account.save(update_fields=['last_invoice_at', 'updated_at'])
             
+            print(f"✅ Processed {processed_count} invoice email(s)")
+            return processed_count
+                    
         except Exception as e:
-            print(f"❌ GmailPushWebhookView error: {e}")
+            print(f"❌ Error in process_new_emails: {e}")
             print(f"Traceback: {traceback.format_exc()}")
-            # Return 200 to Pub/Sub even on error to prevent retries
-            return HttpResponse(status=200)
-
-
-class EmailAutomationService:
-    """Service class for email automation logic"""
+            raise
     
-    def process_new_emails(self, email_account, history_id=None):
-        """Process new emails and save invoice-related ones to Drive"""
-        try:
-            creds = Credentials.from_authorized_user_info(email_account.credentials)
-            
-            if creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-                # Update stored credentials
-                email_account.credentials = json.loads(creds.to_json())
-                email_account.save()
+    def _resume_outbox(self, gmail_service, drive_service, email_account, limiter):
+        """Redo only the missing steps of unfinished invoice saves. Returns the number of invoices saved."""
+        entries = claim_unfinished_entries(email_account)
+        if not entries:
+            return 0
+        print(f"♻️ Resuming {len(entries)} unfinished invoice save(s) for {email_account.email}")
+        
+        # Messages not recorded yet are fetched again; recorded ones only need archiving
+        unrecorded = [entry.gmail_message_id for entry in entries if not entry.recorded_at]
+        messages = {}
+        for chunk_start in range(0, len(unrecorded), self.BATCH_SIZE):
+            chunk = unrecorded[chunk_start:chunk_start + self.BATCH_SIZE]
+            limiter.acquire(len(chunk))
+            messages.update(self._batch_get_messages(gmail_service, chunk, format='full'))
+        
+        saved_count = 0
+        to_archive = {}
+        for entry in entries:
+            if not entry.recorded_at:
+                message = messages.get(entry.gmail_message_id)
+                if message is None:
+                    record_outbox_error(email_account, entry.gmail_message_id, "Message could not be fetched")
+                    continue
+                try:
+                    self._save_to_drive(ParsedMessage(message), drive_service, gmail_service, email_account)
+                except Exception as e:
+                    print(f"❌ Error resuming message {entry.gmail_message_id}: {e}")
+                    continue
+                saved_count += 1
+            to_archive[entry.gmail_message_id] = entry.subject
+        
+        archive_ids = list(to_archive)
+        for chunk_start in range(0, len(archive_ids), self.BATCH_SIZE):
+            chunk = {msg_id: to_archive[msg_id] for msg_id in archive_ids[chunk_start:chunk_start + self.BATCH_SIZE]}
+            limiter.acquire(len(chunk))
+            mark_archived(email_account, self._batch_archive_messages(gmail_service, chunk))
+        return saved_count
+    
+    def _list_history_message_ids(self, gmail_service, start_history_id, limiter):
+        """Page through the whole history since start_history_id. Returns (message_ids, latest_history_id)."""
+        message_ids = []
+        latest_history_id = None
+        page_token = None
+        pages = 0
+        while True:
+            params = {
+                'userId': 'me',
+                'startHistoryId': start_history_id,
+                'historyTypes': ['messageAdded'],
+                'maxResults': self.HISTORY_PAGE_SIZE,
+            }
+            if page_token:
+                params['pageToken'] = page_token
+            limiter.acquire()
+            history = gmail_service.users().history().list(**params).execute()
+            pages += 1
+            
+            for record in history.get('history', []):
+                for msg in record.get('messagesAdded', []):
+                    message_ids.append(msg['message']['id'])
+            latest_history_id = history.get('historyId', latest_history_id)
+            
+            page_token = history.get('nextPageToken')
+            if not page_token:
+                break
+        
+        print(f"📋 History API returned {len(message_ids)} added message(s) in {pages} page(s)")
+        return message_ids, latest_history_id
+    
+    def _start_backfill(self, gmail_service, email_account, limiter):
+        """Record where incremental sync resumes once the backfill is done, and reset the checkpoint"""
+        limiter.acquire()
+        profile = gmail_service.users().getProfile(userId='me').execute()
+        email_account.backfill_history_id = profile.get('historyId')
+        email_account.backfill_page_token = None
+        email_account.save(update_fields=['backfill_history_id', 'backfill_page_token', 'updated_at'])
+        print(f"⏩ Backfill started for {email_account.email} (resumes history at {email_account.backfill_history_id})")
+    
+    def _run_backfill(self, gmail_service, drive_service, email_account, classifier, limiter):
+        """Process up to BACKFILL_PAGES_PER_RUN pages of the backfill query, checkpointing after each page"""
+        processed_count = 0
+        page_token = email_account.backfill_page_token
+        for _ in range(self.BACKFILL_PAGES_PER_RUN):
+            params = {'userId': 'me', 'q': self.BACKFILL_QUERY, 'maxResults': self.BACKFILL_PAGE_SIZE}
+            if page_token:
+                params['pageToken'] = page_token
+            limiter.acquire()
+            results = gmail_service.users().messages().list(**params).execute()
+            message_ids = [msg['id'] for msg in results.get('messages', [])]
+            print(f"📬 Backfill page found {len(message_ids)} message(s)")
+            
+            processed_count += self._process_message_ids(
+                message_ids, gmail_service, drive_service, email_account, classifier, limiter
+            )
             
-            gmail_service = build('gmail', 'v1', credentials=creds)
-            drive_service = build('drive', 'v3', credentials=creds)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                # Done: continue incremental sync from the history ID taken when the backfill started
+                email_account.watch_history_id = email_account.backfill_history_id
+                email_account.backfill_history_id = None
+                email_account.backfill_page_token = None
+                email_account.save(update_fields=['watch_history_id', 'backfill_history_id', 'backfill_page_token', 'updated_at'])
+                print(f"✅ Backfill finished for {email_account.email}, history ID set to {email_account.watch_history_id}")
+                return processed_count
+            
+            # Checkpoint: a crash or the next run resumes from the following page
+            email_account.backfill_page_token = page_token
+            email_account.save(update_fields=['backfill_page_token', 'updated_at'])
+            extend_sync_lease(email_account)
+        
+        print(f"⏸️  Backfill paused for {email_account.email} after {self.BACKFILL_PAGES_PER_RUN} page(s), will resume on the next sync")
+        return processed_count
+    
+    def _process_message_ids(self, message_ids, gmail_service, drive_service, email_account, classifier, limiter):
+        """Triage, save and archive the given messages. Returns the number of invoices saved."""
+        # Process messages in chunks. Each chunk is triaged on a metadata-only batch fetch
+        # (Subject/From headers, labels and snippet); only messages that may be invoices
+        # are fetched in full, and the invoices found are archived with one more batch request.
+        message_ids = list(dict.fromkeys(message_ids))  # Batch request IDs must be unique
+        
+        # Drop already processed messages up front with one query, before any Gmail call
+        total = len(message_ids)
+        message_ids = unprocessed_message_ids(email_account, message_ids)
+        if total != len(message_ids):
+            print(f"⏭️  Skipping {total - len(message_ids)} already processed message(s)")
+        
+        processed_count = 0
+        for chunk_start in range(0, len(message_ids), self.BATCH_SIZE):
+            # Long syncs keep their lease; stops here if another worker took the account over
+            extend_sync_lease(email_account)
+            chunk = message_ids[chunk_start:chunk_start + self.BATCH_SIZE]
+            limiter.acquire(len(chunk))
+            metadata = self._batch_get_messages(
+                gmail_service,
+                chunk,
+                format='metadata',
+                metadataHeaders=['Subject', 'From']
+            )
             
-            # Get messages since last historyId
-            # Use broader query to catch all emails, not just unread ones
-            # (in case email was already read but not processed)
-            query = "in:inbox"  # Removed "is:unread" to catch all inbox emails
+            # Stage 1: decide on headers, labels and snippet where possible
+            triage = {}
+            for msg_id in chunk:
+                message = metadata.get(msg_id)
+                if message is None:
+                    # Not found (deleted/moved) or failed to fetch - already logged
+                    continue
+                parsed = ParsedMessage(message)
+                
+                decision = self._triage_invoice_metadata(parsed, classifier)
+                if decision is False:
+                    print(f"⏭️  Skipping non-invoice email: {parsed.subject[:50]}...")
+                    continue
+                triage[msg_id] = decision
             
-            if history_id:
-                # Get history to find new messages since the stored history_id
-                print(f"🔍 Querying Gmail history API from history_id: {history_id}")
-                try:
-                    history = gmail_service.users().history().list(
-                        userId='me',
-                        startHistoryId=history_id,
-                        historyTypes=['messageAdded']
-                    ).execute()
-                    
-                    message_ids = []
-                    history_records = history.get('history', [])
-                    print(f"📋 History API returned {len(history_records)} history record(s)")
-                    
-                    for record in history_records:
-                        messages_added = record.get('messagesAdded', [])
-                        print(f"   Record has {len(messages_added)} message(s) added")
-                        for msg in messages_added:
-                            message_ids.append(msg['message']['id'])
-                    
-                    print(f"📬 Found {len(message_ids)} message(s) from history API")
-                    
-                    # If history API returns 0 messages, try fallback query
-                    if len(message_ids) == 0:
-                        print(f"⚠️ History API returned 0 messages. Trying fallback query: '{query}'")
-                        results = gmail_service.users().messages().list(
-                            userId='me',
-                            q=query,
-                            maxResults=20  # Increased from 10 to catch more emails
-                        ).execute()
-                        fallback_messages = results.get('messages', [])
-                        message_ids = [msg['id'] for msg in fallback_messages]
-                        print(f"📬 Fallback query found {len(message_ids)} message(s)")
-                except HttpError as e:
-                    # If historyId is too old, fall back to query
-                    print(f"❌ History API error: {e}")
-                    print(f"   Falling back to query: '{query}'")
-                    results = gmail_service.users().messages().list(
-                        userId='me',
-                        q=query,
-                        maxResults=20  # Increased from 10
-                    ).execute()
-                    message_ids = [msg['id'] for msg in results.get('messages', [])]
-                    print(f"📬 Fallback query found {len(message_ids)} message(s)")
-            else:
-                print(f"⚠️ No history_id provided. Using query: '{query}'")
-                results = gmail_service.users().messages().list(
-                    userId='me',
-                    q=query,
-                    maxResults=20  # Increased from 10
-                ).execute()
-                message_ids = [msg['id'] for msg in results.get('messages', [])]
-                print(f"📬 Query found {len(message_ids)} message(s)")
+            if not triage:
+                continue
             
-            print(f"📬 Total message(s) to process: {len(message_ids)}")
+            # Stage 2: full fetch for invoices (needed to save them) and undecided messages
+            limiter.acquire(len(triage))
+            messages = self._batch_get_messages(gmail_service, list(triage), format='full')
+            to_archive = {}
             
-            # Process each message
-            processed_count = 0
-            for msg_id in message_ids:
+            for msg_id, decision in triage.items():
+                message = messages.get(msg_id)
+                if message is None:
+                    continue
                 try:
-                    # Try to get the message - handle 404 errors gracefully
-                    try:
-                        message = gmail_service.users().messages().get(
-                            userId='me',
-                            id=msg_id,
-                            format='full'
-                        ).execute()
-                    except HttpError as e:
-                        if e.resp.status == 404:
-                            # Message was deleted or moved - skip it
-                            print(f"⏭️  Message {msg_id} not found (deleted/moved). Skipping.")
-                            continue
-                        else:
-                            # Re-raise other HTTP errors
-                            raise
-                    
-                    # Get subject for logging
-                    subject = self._get_email_header(message, 'Subject')
+                    # Parsed once; headers, body and date are shared by the classifier and the Drive copy
+                    parsed = ParsedMessage(message)
+                    subject = parsed.subject
                     
-                    # Check if already processed
-                    if ProcessedEmail.objects.filter(gmail_message_id=msg_id).exists():
-                        print(f"⏭️  Skipping already processed: {subject[:50]}...")
-                        continue
-                    
-                    # Check if email is invoice-related
-                    if self._is_invoice_email(message):
+                    # Check if email is invoice-related (body scan only for undecided messages)
+                    if decision or self._is_invoice_email(parsed, classifier):
                         print(f"\n🔍 Invoice email detected: {subject}")
                         self._save_to_drive(
-                            message, 
+                            parsed, 
                             drive_service,
                             gmail_service,  # Pass gmail_service for downloading attachments
-                            email_account,
-                            msg_id
+                            email_account
                         )
-                        
-                        # Mark email as read and archive it (remove from INBOX)
-                        try:
-                            gmail_service.users().messages().modify(
-                                userId='me',
-                                id=msg_id,
-                                body={'removeLabelIds': ['UNREAD', 'INBOX']}  # Mark as read and archive
-                            ).execute()
-                            print(f"✅ Email archived: {subject[:50]}...")
-                        except Exception as archive_error:
-                            print(f"⚠️ Saved to Drive but failed to archive: {archive_error}")
-                        
+                        to_archive[msg_id] = subject
                         processed_count += 1
                     else:
                         print(f"⏭️  Skipping non-invoice email: {subject[:50]}...")
@@ -692,276 +691,304 @@ class EmailAutomationService:
                     print(f"❌ Error processing message {msg_id}: {e}")
                     continue
             
-            # Update history ID after processing
-            try:
-                profile = gmail_service.users().getProfile(userId='me').execute()
-                latest_history_id = profile.get('historyId')
-                if latest_history_id and str(latest_history_id) != str(email_account.watch_history_id):
-                    email_account.watch_history_id = latest_history_id
-                    email_account.save()
-                    print(f"✅ Updated history ID to: {latest_history_id}")
-            except Exception as e:
-                print(f"⚠️ Failed to update history ID: {e}")
-            
-            print(f"✅ Processed {processed_count} invoice email(s)")
-                    
-        except Exception as e:
-            print(f"❌ Error in process_new_emails: {e}")
-            print(f"Traceback: {traceback.format_exc()}")
-            raise
+            # Mark saved emails as read and archive them (remove from INBOX)
+            if to_archive:
+                limiter.acquire(len(to_archive))
+                archived = self._batch_archive_messages(gmail_service, to_archive)
+                mark_archived(email_account, archived)
+        
+        return processed_count
     
-    def _is_invoice_email(self, message):
-        """Check if email is invoice-related"""
-        subject = ""
-        sender = ""
-        body_text = ""
+    def _batch_get_messages(self, gmail_service, message_ids, **get_kwargs):
+        """Fetch messages with a single batch request. Returns {msg_id: message} for the ones that succeeded."""
+        messages = {}
         
-        headers = message['payload'].get('headers', [])
-        for header in headers:
-            name = header['name'].lower()
-            if name == 'subject':
-                subject = header['value'].lower()
-            elif name == 'from':
-                sender = header['value'].lower()
+        def callback(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                # Message was deleted or moved - skip it
+                print(f"⏭️  Message {request_id} not found (deleted/moved). Skipping.")
+            else:
+                print(f"❌ Error processing message {request_id}: {exception}")
         
-        # Get email body
-        body_text = self._get_email_body(message)
+        batch = gmail_service.new_batch_http_request(callback=callback)
+        for msg_id in message_ids:
+            batch.add(
+                gmail_service.users().messages().get(userId='me', id=msg_id, **get_kwargs),
+                request_id=msg_id
+            )
+        batch.execute()
+        return messages
+    
+    def _batch_archive_messages(self, gmail_service, subjects_by_id):
+        """Mark messages as read and archive them with a single batch request. Returns the IDs done."""
+        archived = []
         
-        # Keywords to detect invoices
-        invoice_keywords = [
-            'invoice', 'bill', 'payment', 'receipt', 
-            'statement', 'billing', 'due', 'amount due',
-            'payment due', 'invoice #', 'invoice number',
-            'pay now', 'payment request'
-        ]
+        def callback(request_id, response, exception):
+            subject = subjects_by_id.get(request_id, '')
+            if exception is None:
+                archived.append(request_id)
+                print(f"✅ Email archived: {subject[:50]}...")
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                # Deleted in the meantime - nothing left to archive
+                archived.append(request_id)
+            else:
+                print(f"⚠️ Saved to Drive but failed to archive: {exception}")
         
-        # Check subject
-        if any(keyword in subject for keyword in invoice_keywords):
-            return True
+        batch = gmail_service.new_batch_http_request(callback=callback)
+        for msg_id in subjects_by_id:
+            batch.add(
+                gmail_service.users().messages().modify(
+                    userId='me',
+                    id=msg_id,
+                    body={'removeLabelIds': ['UNREAD', 'INBOX']}  # Mark as read and archive
+                ),
+                request_id=msg_id
+            )
+        try:
+            batch.execute()
+        except Exception as archive_error:
+            print(f"⚠️ Saved to Drive but failed to archive: {archive_error}")
+        return archived
+    
+    def _triage_invoice_metadata(self, parsed, classifier=DEFAULT_CLASSIFIER):
+        """First-stage invoice check on a format='metadata' message (a ParsedMessage).
         
-        # Check sender domain (common invoice senders)
-        invoice_domains = [
-            'quickbooks', 'xero', 'freshbooks', 'stripe', 
-            'paypal', 'square', 'invoice', 'billing'
-        ]
-        if any(domain in sender for domain in invoice_domains):
-            return True
+        Returns True if the subject, sender or snippet matches, False if the message
+        carries one of INVOICE_TRIAGE_SKIP_LABELS, and None if the body must be scanned.
+        """
+        # The snippet is the start of the body, so a match here is a body match
+        snippet = html.unescape(parsed.message.get('snippet', ''))
         
-        # Check body content
-        if any(keyword in body_text.lower() for keyword in invoice_keywords):
+        if classifier.is_invoice(parsed.subject, parsed.sender, snippet):
             return True
         
-        return False
-    
-    def _get_email_body(self, message):
-        """Extract email body text, preferring plain text over HTML"""
-        plain_text = ""
-        html_text = ""
-        payload = message.get('payload', {})
-        
-        def extract_body(part, mime_type=None):
-            """Extract body from part, distinguishing between plain text and HTML"""
-            text = ""
-            part_mime = part.get('mimeType', mime_type or '')
-            
-            if part.get('body', {}).get('data'):
-                data = part['body']['data']
-                decoded_text = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                
-                # Check if this is HTML or plain text
-                if 'text/html' in part_mime.lower():
-                    return ('', decoded_text)  # (plain_text, html_text)
-                elif 'text/plain' in part_mime.lower():
-                    return (decoded_text, '')  # (plain_text, html_text)
-                else:
-                    # If mime type not specified, try to detect
-                    if decoded_text.strip().startswith('<') and '>' in decoded_text:
-                        return ('', decoded_text)  # Likely HTML
-                    else:
-                        return (decoded_text, '')  # Likely plain text
-            
-            elif part.get('parts'):
-                plain = ""
-                html = ""
-                for subpart in part['parts']:
-                    sub_plain, sub_html = extract_body(subpart, part_mime)
-                    plain += sub_plain
-                    html += sub_html
-                return (plain, html)
-            
-            return ('', '')
-        
-        plain_text, html_text = extract_body(payload)
+        if self.TRIAGE_SKIP_LABELS.intersection(parsed.label_ids):
+            return False
         
-        # Prefer plain text, but if only HTML is available, strip HTML tags
-        if plain_text.strip():
-            return plain_text.strip()
-        elif html_text.strip():
-            # Strip HTML tags and decode HTML entities
-            # Remove HTML tags using regex
-            clean_text = re.sub(r'<[^>]+>', '', html_text)
-            # Decode HTML entities (like &nbsp;, &lt;, etc.)
-            clean_text = html.unescape(clean_text)
-            # Clean up extra whitespace
-            clean_text = re.sub(r'\n\s*\n', '\n\n', clean_text)  # Multiple newlines to double
-            clean_text = re.sub(r'[ \t]+', ' ', clean_text)  # Multiple spaces to single
-            return clean_text.strip()
-        else:
-            return ""
+        return None
+    
+    def _is_invoice_email(self, parsed, classifier=DEFAULT_CLASSIFIER):
+        """Check if email is invoice-related (subject, then sender domain, then body content)"""
+        return classifier.is_invoice(
+            parsed.subject,
+            parsed.sender,
+            lambda: parsed.body  # Only decoded if headers don't match; cached for the Drive copy
+        )
     
-    def _get_attachments(self, message, gmail_service, msg_id):
-        """Extract and download attachments from email message"""
+    def _find_attachments(self, message):
+        """List the attachments of an email message (without downloading them)"""
         attachments = []
         payload = message.get('payload', {})
         
-        def extract_attachments(part, part_id=''):
+        def extract_attachments(part):
             """Recursively extract attachments from message parts"""
             if part.get('filename') and part.get('body', {}).get('attachmentId'):
-                attachment_id = part['body']['attachmentId']
-                filename = part['filename']
-                mime_type = part.get('mimeType', 'application/octet-stream')
-                size = part.get('body', {}).get('size', 0)
-                
-                try:
-                    # Download attachment
-                    attachment = gmail_service.users().messages().attachments().get(
-                        userId='me',
-                        messageId=msg_id,
-                        id=attachment_id
-                    ).execute()
-                    
-                    # Decode attachment data
-                    file_data = base64.urlsafe_b64decode(attachment['data'])
-                    
-                    attachments.append({
-                        'filename': filename,
-                        'data': file_data,
-                        'mime_type': mime_type,
-                        'size': size
-                    })
-                    
-                    print(f"   📎 Attachment found: {filename} ({size} bytes, {mime_type})")
-                except Exception as e:
-                    print(f"   ⚠️ Failed to download attachment {filename}: {e}")
+                attachments.append({
+                    # attachmentId changes between fetches; the part ID is stable
+                    'key': attachment_key(part.get('partId', len(attachments))),
+                    'filename': part['filename'],
+                    'attachment_id': part['body']['attachmentId'],
+                    'mime_type': part.get('mimeType', 'application/octet-stream'),
+                    'size': part.get('body', {}).get('size', 0)
+                })
             
             # Recursively check nested parts
-            if part.get('parts'):
-                for i, subpart in enumerate(part['parts']):
-                    extract_attachments(subpart, f"{part_id}.{i}")
+            for subpart in part.get('parts', []):
+                extract_attachments(subpart)
         
         extract_attachments(payload)
         return attachments
     
-    def _save_to_drive(self, message, drive_service, gmail_service, email_account, msg_id):
-        """Save invoice email and attachments to Google Drive in year/month folder"""
+    def _transfer_attachment(self, attachment, gmail_service, drive_service, msg_id, folder_id):
+        """Download one attachment from Gmail and upload it to the Drive folder. Runs on the transfer pool."""
+        filename = attachment['filename']
+        mime_type = attachment['mime_type']
+        
         try:
-            # Extract email content
-            subject = self._get_email_header(message, 'Subject')
-            sender = self._get_email_header(message, 'From')
-            date = self._get_email_header(message, 'Date')
-            to_email = self._get_email_header(message, 'To')
-            body = self._get_email_body(message)
-            
-            # Extract year and month from email date
-            try:
-                if date:
-                    email_date = datetime.strptime(date, '%a, %d %b %Y %H:%M:%S %z')
-                else:
-                    email_date = datetime.now()
-            except:
-                email_date = datetime.now()
+            # Download attachment. Gmail returns the content inline as base64url JSON, so the body
+            # is streamed and decoded chunk by chunk into a spooled temp file instead of parsed.
+            file_data = spool_base64_field(stream_response(
+                gmail_service.users().messages().attachments().get(
+                    userId='me',
+                    messageId=msg_id,
+                    id=attachment['attachment_id']
+                )
+            ))
+            if file_data is None:
+                raise ValueError("attachment response has no data")
+            print(f"   📎 Attachment found: {filename} ({attachment['size']} bytes, {mime_type})")
+        except Exception as e:
+            print(f"   ⚠️ Failed to download attachment {filename}: {e}")
+            return None
+        
+        try:
+            # Create safe filename
+            safe_filename = re.sub(r'[^\w\s.-]', '', filename)
+            attachment_metadata = {
+                'name': safe_filename,
+                'parents': [folder_id],
+                'appProperties': drive_app_properties(msg_id, attachment['key'])
+            }
+            
+            # Resumable upload in ATTACHMENT_UPLOAD_CHUNK_BYTES pieces
+            attachment_file = drive_service.files().create(
+                body=attachment_metadata,
+                media_body=chunked_media(file_data, mime_type),
+                fields='id'
+            ).execute()
+            
+            print(f"      ✅ Saved: {filename} (ID: {attachment_file.get('id')})")
+            return {
+                'key': attachment['key'],
+                'filename': filename,
+                'file_id': attachment_file.get('id'),
+                'mime_type': mime_type
+            }
+        except Exception as e:
+            print(f"      ❌ Failed to save attachment {filename}: {e}")
+            return None
+        finally:
+            file_data.close()
+    
+    def _save_to_drive(self, parsed, drive_service, gmail_service, email_account):
+        """Save invoice email (a ParsedMessage) and attachments to Google Drive in year/month folder.
+        
+        Each completed step is stored on the message's EmailOutboxEntry, so a retry after a
+        failure or crash only does the steps still missing. Archiving, the last step, is
+        batched by the caller. Returns the outbox entry.
+        """
+        try:
+            # Extract email content (the body is cached if the classifier already decoded it)
+            msg_id = parsed.id
+            subject = parsed.subject
+            sender = parsed.sender
+            date = parsed.header('Date')
+            to_email = parsed.header('To')
+            
+            entry, created = open_outbox_entry(email_account, msg_id, subject)
+            if entry.recorded_at:
+                return entry
+            # Uploads of an earlier attempt may have finished without their file ID being stored
+            drive_copies = {} if created else find_drive_copies(drive_service, msg_id)
+            
+            # Extract year and month from email date (now if missing or unparseable)
+            email_date = parsed.date or timezone.now()
             
             year = email_date.year
             month_name = email_date.strftime('%B')  # November, December, etc.
             
-            # Get year/month folder
-            folder_id = self._get_or_create_month_folder(drive_service, month_name, year)
+            # Get year/month folder (cached, see utils.drive_folders)
+            folder_path = [INVOICE_ROOT_FOLDER, year, month_name]
+            folder_id = drive_folders.get_folder_id(drive_service, email_account, folder_path)
             
-            # Create email file content
-            email_content = f"""From: {sender}
+            # Step 1: email text file
+            if not entry.email_file_id:
+                entry.email_file_id = drive_copies.get(EMAIL_FILE_KEY)
+            if not entry.email_file_id:
+                # Create email file content
+                email_content = f"""From: {sender}
 To: {to_email}
 Subject: {subject}
 Date: {date}
 
-{body}
+{parsed.body}
 """
-            
-            # Create filename
-            safe_subject = re.sub(r'[^\w\s-]', '', subject)[:50]
-            filename = f"{safe_subject}_{msg_id[:10]}.txt"
-            
-            # Save email as text file
-            file_metadata = {
-                'name': filename,
-                'parents': [folder_id]
-            }
-            
-            media = MediaIoBaseUpload(
-                BytesIO(email_content.encode('utf-8')),
-                mimetype='text/plain',
-                resumable=True
-            )
-            
-            file = drive_service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-            
-            # Extract and save attachments
-            attachments = self._get_attachments(message, gmail_service, msg_id)
-            attachment_files = []
-            
-            if attachments:
-                print(f"   📎 Saving {len(attachments)} attachment(s) to Drive...")
-                for attachment in attachments:
-                    try:
-                        # Create safe filename
-                        safe_filename = re.sub(r'[^\w\s.-]', '', attachment['filename'])
-                        attachment_metadata = {
-                            'name': safe_filename,
-                            'parents': [folder_id]
-                        }
-                        
-                        attachment_media = MediaIoBaseUpload(
-                            BytesIO(attachment['data']),
-                            mimetype=attachment['mime_type'],
-                            resumable=True
-                        )
-                        
-                        attachment_file = drive_service.files().create(
-                            body=attachment_metadata,
-                            media_body=attachment_media,
-                            fields='id'
-                        ).execute()
-                        
-                        attachment_files.append({
-                            'filename': attachment['filename'],
-                            'file_id': attachment_file.get('id'),
-                            'mime_type': attachment['mime_type']
-                        })
-                        
-                        print(f"      ✅ Saved: {attachment['filename']} (ID: {attachment_file.get('id')})")
-                    except Exception as e:
-                        print(f"      ❌ Failed to save attachment {attachment['filename']}: {e}")
-            
-            # Save to database
-            try:
-                received_date = datetime.strptime(date, '%a, %d %b %Y %H:%M:%S %z') if date else timezone.now()
-            except:
-                received_date = timezone.now()
-            
-            ProcessedEmail.objects.create(
-                email_account=email_account,
+                
+                # Create filename
+                safe_subject = re.sub(r'[^\w\s-]', '', subject)[:50]
+                filename = f"{safe_subject}_{msg_id[:10]}.txt"
+                
+                # Save email as text file
+                def upload_email_file(parent_id):
+                    file_metadata = {
+                        'name': filename,
+                        'parents': [parent_id],
+                        'appProperties': drive_app_properties(msg_id, EMAIL_FILE_KEY)
+                    }
+                    
+                    media = MediaIoBaseUpload(
+                        BytesIO(email_content.encode('utf-8')),
+                        mimetype='text/plain',
+                        resumable=True
+                    )
+                    
+                    return drive_service.files().create(
+                        body=file_metadata,
+                        media_body=media,
+                        fields='id'
+                    ).execute()
+                
+                try:
+                    file = upload_email_file(folder_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    # The cached folder was deleted in Drive - resolve it again and retry once
+                    print(f"⚠️ Drive folder {'/'.join(map(str, folder_path))} not found, refreshing folder cache")
+                    drive_folders.invalidate(email_account, folder_path)
+                    folder_id = drive_folders.get_folder_id(drive_service, email_account, folder_path)
+                    file = upload_email_file(folder_id)
+                entry.email_file_id = file.get('id')
+            save_step(entry, 'email_file_id')
+            
+            # Step 2: attachments not uploaded yet, downloaded and uploaded in parallel (capped per account).
+            # Failed ones are left out.
+            attachments = self._find_attachments(parsed.message)
+            saved = {attachment['key']: attachment for attachment in entry.attachments}
+            missing = []
+            for attachment in attachments:
+                if attachment['key'] in saved:
+                    continue
+                if attachment['key'] in drive_copies:
+                    saved[attachment['key']] = {
+                        'key': attachment['key'],
+                        'filename': attachment['filename'],
+                        'file_id': drive_copies[attachment['key']],
+                        'mime_type': attachment['mime_type']
+                    }
+                else:
+                    missing.append(attachment)
+            
+            if missing:
+                print(f"   📎 Saving {len(missing)} attachment(s) to Drive...")
+                results = run_transfers(
+                    email_account.pk,
+                    missing,
+                    lambda attachment: self._transfer_attachment(
+                        attachment, gmail_service, drive_service, msg_id, folder_id
+                    )
+                )
+                saved.update((result['key'], result) for result in results if result)
+            # Keep the order of the attachments in the message
+            entry.attachments = [saved[attachment['key']] for attachment in attachments if attachment['key'] in saved]
+            save_step(entry, 'attachments')
+            attachment_files = [
+                {field: attachment[field] for field in ('filename', 'file_id', 'mime_type')}
+                for attachment in entry.attachments
+            ]
+            
+            # Step 3: save to database
+            processed_email, _ = ProcessedEmail.objects.get_or_create(
                 gmail_message_id=msg_id,
-                subject=subject,
-                sender=sender,
-                received_date=received_date,
-                drive_file_id=file.get('id'),
-                drive_folder_name=f"{year}/{month_name}",
-                attachments=attachment_files,  # Store attachment information
-                is_invoice=True
+                defaults={
+                    'email_account': email_account,
+                    'subject': subject,
+                    'sender': sender,
+                    'received_date': email_date,
+                    'drive_file_id': entry.email_file_id,
+                    'drive_folder_name': f"{year}/{month_name}",
+                    'attachments': attachment_files,  # Store attachment information
+                    'is_invoice': True,
+                    'body_text': search_body_text(parsed.body)
+                }
             )
+            update_search_vectors(ProcessedEmail.objects.filter(pk=processed_email.pk))
+            remember_processed(email_account, msg_id)
+            entry.recorded_at = timezone.now()
+            entry.error_message = None
+            save_step(entry, 'recorded_at', 'error_message')
             
             # Print success message with email subject prominently displayed
             print("\n" + "=" * 80)
@@ -969,7 +996,7 @@ Date: {date}
             print("=" * 80)
             print(f"📧 EMAIL SUBJECT: {subject}")
             print(f"📁 Drive Folder: {year}/{month_name}")
-            print(f"📄 Email File ID: {file.get('id')}")
+            print(f"📄 Email File ID: {entry.email_file_id}")
             if attachment_files:
                 print(f"📎 Attachments ({len(attachment_files)}):")
                 for att in attachment_files:
@@ -980,110 +1007,12 @@ Date: {date}
             print(f"💾 Message ID: {msg_id}")
             print(f"📅 Date: {date}")
             print("=" * 80 + "\n")
+            return entry
             
         except Exception as e:
             print(f"Error saving to Drive: {e}")
+            record_outbox_error(email_account, parsed.id, e)
             raise
-    
-    def _get_email_header(self, message, header_name):
-        """Extract email header value"""
-        headers = message['payload'].get('headers', [])
-        for header in headers:
-            if header['name'].lower() == header_name.lower():
-                return header['value']
-        return ""
-    
-    def _get_or_create_invoice_folder(self, drive_service):
-        """Get existing 'Adam Pearson Invoice' folder or create new one in root"""
-        try:
-            # Check if folder exists in root
-            # Escape single quote by doubling it for Google Drive API query
-            folder_name_escaped = "Adam Pearson Invoice".replace("'", "''")
-            query = f"name='{folder_name_escaped}' and mimeType='application/vnd.google-apps.folder' and trashed=false and 'root' in parents"
-            results = drive_service.files().list(q=query).execute()
-            
-            folders = results.get('files', [])
-            if folders:
-                return folders[0]['id']
-            
-            # Create new folder in root
-            folder_metadata = {
-                'name': "Adam Pearson Invoice",
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = drive_service.files().create(
-                body=folder_metadata,
-                fields='id'
-            ).execute()
-            
-            return folder.get('id')
-            
-        except Exception as e:
-            print(f"Error getting/creating 'Adam Pearson Invoice' folder: {e}")
-            raise
-    
-    def _get_or_create_year_folder(self, drive_service, year):
-        """Get existing year folder or create new one inside 'Adam Pearson Invoice' folder"""
-        try:
-            # First, get or create the parent "Adam Pearson Invoice" folder
-            parent_folder_id = self._get_or_create_invoice_folder(drive_service)
-            
-            # Check if year folder exists inside parent folder
-            query = f"name='{year}' and mimeType='application/vnd.google-apps.folder' and trashed=false and '{parent_folder_id}' in parents"
-            results = drive_service.files().list(q=query).execute()
-            
-            folders = results.get('files', [])
-            if folders:
-                return folders[0]['id']
-            
-            # Create new year folder inside parent folder
-            folder_metadata = {
-                'name': str(year),
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [parent_folder_id]
-            }
-            folder = drive_service.files().create(
-                body=folder_metadata,
-                fields='id'
-            ).execute()
-            
-            return folder.get('id')
-            
-        except Exception as e:
-            print(f"Error getting/creating year folder: {e}")
-            raise
-    
-    def _get_or_create_month_folder(self, drive_service, month_name, year):
-        """Get existing month folder or create new one inside year folder"""
-        try:
-            # First, get or create the year folder
-            year_folder_id = self._get_or_create_year_folder(drive_service, year)
-            
-            # Check if month folder exists inside year folder
-            query = f"name='{month_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false and '{year_folder_id}' in parents"
-            results = drive_service.files().list(q=query).execute()
-            
-            folders = results.get('files', [])
-            if folders:
-                return folders[0]['id']
-            
-            # Create new month folder inside year folder
-            folder_metadata = {
-                'name': month_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [year_folder_id]
-            }
-            folder = drive_service.files().create(
-                body=folder_metadata,
-                fields='id'
-            ).execute()
-            
-            return folder.get('id')
-            
-        except Exception as e:
-            print(f"Error getting/creating month folder: {e}")
-            raise
-
 
 class EmailAccountListView(APIView):
     """Get list of all email accounts for the current user"""
@@ -1111,6 +1040,11 @@ class EmailAccountListView(APIView):
                     "created_at": account.created_at.isoformat() if account.created_at else None,
                     "updated_at": account.updated_at.isoformat() if account.updated_at else None,
                     "watch_expiration": account.watch_expiration.isoformat() if account.watch_expiration else None,
+                    "sync_mode": account.sync_mode,
+                    "next_poll_at": account.next_poll_at.isoformat() if account.next_poll_at else None,
+                    "last_invoice_at": account.last_invoice_at.isoformat() if account.last_invoice_at else None,
+                    "invoice_keywords": account.invoice_keywords,
+                    "invoice_domains": account.invoice_domains,
                 }
                 accounts_list.append(account_data)
             
@@ -1174,7 +1108,19 @@ class EmailAccountDeleteView(APIView):
 
 
 class ProcessedEmailListView(APIView):
-    """Get list of all processed emails for the current user"""
+    """Get processed emails for the current user, newest first, one page at a time.
+    
+    Query params (all optional):
+        limit      page size (default DEFAULT_PAGE_SIZE, max MAX_PAGE_SIZE)
+        cursor     next_cursor from the previous page
+        sender     case-insensitive substring of the sender address
+        date_from  received on or after this date/datetime (ISO 8601)
+        date_to    received on or before this date/datetime (ISO 8601, a date includes the whole day)
+        folder     Drive folder name, e.g. "2025/November"
+    """
+    
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
     
     @user_token_auth
     def get(self, request):
@@ -1188,49 +1134,44 @@ class ProcessedEmailListView(APIView):
             
             # Get processed emails for all email accounts belonging to the user
             email_accounts = EmailAccount.objects.filter(user=user, is_active=True)
-            processed_emails = ProcessedEmail.objects.filter(email_account__in=email_accounts)
+            try:
+                limit = _positive_int_param(request.query_params.get('limit'), self.DEFAULT_PAGE_SIZE, self.MAX_PAGE_SIZE)
+                cursor = _decode_cursor(request.query_params.get('cursor'))
+                processed_emails = _filter_processed_emails(
+                    ProcessedEmail.objects.filter(email_account__in=email_accounts),
+                    request.query_params
+                )
+            except ValueError as e:
+                return ResponseView.error_response_without_data(str(e), code=FAIL)
             
-            emails_list = []
-            for email in processed_emails:
-                # Construct Google Drive URL
-                drive_url = None
-                if email.drive_file_id:
-                    drive_url = f"https://drive.google.com/file/d/{email.drive_file_id}/view"
-                
-                # Process attachments to include Drive URLs
-                attachments_with_urls = []
-                if email.attachments:
-                    for attachment in email.attachments:
-                        attachment_drive_url = None
-                        if attachment.get('file_id'):
-                            attachment_drive_url = f"https://drive.google.com/file/d/{attachment['file_id']}/view"
-                        attachments_with_urls.append({
-                            "filename": attachment.get('filename', 'Unknown'),
-                            "file_id": attachment.get('file_id'),
-                            "mime_type": attachment.get('mime_type', ''),
-                            "drive_url": attachment_drive_url
-                        })
-                
-                email_data = {
-                    "email_id": str(email.email_id),
-                    "gmail_message_id": email.gmail_message_id,
-                    "subject": email.subject,
-                    "sender": email.sender,
-                    "received_date": email.received_date.isoformat() if email.received_date else None,
-                    "drive_file_id": email.drive_file_id,
-                    "drive_url": drive_url,
-                    "drive_folder_name": email.drive_folder_name,
-                    "attachments": attachments_with_urls,
-                    "is_invoice": email.is_invoice,
-                    "created_at": email.created_at.isoformat() if email.created_at else None,
-                    "email_account": email.email_account.email,
-                }
-                emails_list.append(email_data)
+            # Keyset pagination: continue strictly after the last row of the previous page
+            if cursor:
+                received_date, email_id = cursor
+                processed_emails = processed_emails.filter(
+                    Q(received_date__lt=received_date) | Q(received_date=received_date, email_id__lt=email_id)
+                )
+            
+            page = list(
+                processed_emails
+                .select_related('email_account')
+                .defer('body_text', 'search_vector')
+                .order_by('-received_date', '-email_id')[:limit + 1]
+            )
+            has_more = len(page) > limit
+            page = page[:limit]
+            
+            emails_list = [_processed_email_data(email) for email in page]
+            next_cursor = _encode_cursor(page[-1]) if has_more else None
             
             return ResponseView.success_response_data(
                 data=emails_list,
                 message="Processed emails retrieved successfully",
-                code=SUCCESS
+                code=SUCCESS,
+                extras={
+                    "limit": limit,
+                    "has_more": has_more,
+                    "next_cursor": next_cursor,
+                }
             )
             
         except Exception as e:
@@ -1243,6 +1184,189 @@ class ProcessedEmailListView(APIView):
             )
 
 
+class ProcessedEmailSearchView(APIView):
+    """Full-text search over the current user's processed emails (subject, sender and body).
+
+    Query params:
+        q          search text; supports "quoted phrases", OR and -exclusions
+        page       1-based page number (default 1)
+        limit      page size (default DEFAULT_PAGE_SIZE, max MAX_PAGE_SIZE)
+        sender, date_from, date_to, folder   same filters as ProcessedEmailListView
+    Results are ordered by relevance; each row includes its "rank".
+    """
+    
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    
+    @user_token_auth
+    def get(self, request):
+        try:
+            user = request.auth_user
+            if not user:
+                return ResponseView.error_response_without_data(
+                    "Authentication required",
+                    code=FAIL
+                )
+            
+            query = (request.query_params.get('q') or '').strip()
+            if not query:
+                return ResponseView.error_response_without_data(
+                    "Search query 'q' is required",
+                    code=FAIL
+                )
+            
+            email_accounts = EmailAccount.objects.filter(user=user, is_active=True)
+            try:
+                limit = _positive_int_param(request.query_params.get('limit'), self.DEFAULT_PAGE_SIZE, self.MAX_PAGE_SIZE)
+                page_number = _positive_int_param(request.query_params.get('page'), 1, None, name='page')
+                processed_emails = _filter_processed_emails(
+                    ProcessedEmail.objects.filter(email_account__in=email_accounts),
+                    request.query_params
+                )
+            except ValueError as e:
+                return ResponseView.error_response_without_data(str(e), code=FAIL)
+            
+            offset = (page_number - 1) * limit
+            results = list(
+                search_processed_emails(processed_emails, query)
+                .select_related('email_account')
+                .defer('body_text', 'search_vector')[offset:offset + limit + 1]
+            )
+            has_more = len(results) > limit
+            results = results[:limit]
+            
+            emails_list = []
+            for email in results:
+                email_data = _processed_email_data(email)
+                email_data["rank"] = email.rank
+                emails_list.append(email_data)
+            
+            return ResponseView.success_response_data(
+                data=emails_list,
+                message="Search results retrieved successfully",
+                code=SUCCESS,
+                extras={
+                    "query": query,
+                    "page": page_number,
+                    "limit": limit,
+                    "has_more": has_more,
+                }
+            )
+            
+        except Exception as e:
+            print(f"❌ Error in ProcessedEmailSearchView: {str(e)}")
+            import traceback
+            print(traceback.format_exc())
+            return ResponseView.error_response_without_data(
+                f"Error searching processed emails: {str(e)}",
+                code=FAIL
+            )
+
+
+def _filter_processed_emails(processed_emails, query_params):
+    """Apply the optional sender / date_from / date_to / folder filters. Raises ValueError on bad dates."""
+    sender = query_params.get('sender')
+    if sender:
+        processed_emails = processed_emails.filter(sender__icontains=sender)
+    date_from = _parse_date_param(query_params.get('date_from'))
+    if date_from:
+        processed_emails = processed_emails.filter(received_date__gte=date_from)
+    date_to = _parse_date_param(query_params.get('date_to'), end_of_day=True)
+    if date_to:
+        processed_emails = processed_emails.filter(received_date__lte=date_to)
+    folder = query_params.get('folder')
+    if folder:
+        processed_emails = processed_emails.filter(drive_folder_name=folder)
+    return processed_emails
+
+
+def _processed_email_data(email):
+    """API representation of a ProcessedEmail (email_account must be loaded with select_related)"""
+    # Construct Google Drive URL
+    drive_url = None
+    if email.drive_file_id:
+        drive_url = f"https://drive.google.com/file/d/{email.drive_file_id}/view"
+    
+    # Process attachments to include Drive URLs
+    attachments_with_urls = []
+    if email.attachments:
+        for attachment in email.attachments:
+            attachment_drive_url = None
+            if attachment.get('file_id'):
+                attachment_drive_url = f"https://drive.google.com/file/d/{attachment['file_id']}/view"
+            attachments_with_urls.append({
+                "filename": attachment.get('filename', 'Unknown'),
+                "file_id": attachment.get('file_id'),
+                "mime_type": attachment.get('mime_type', ''),
+                "drive_url": attachment_drive_url
+            })
+    
+    return {
+        "email_id": str(email.email_id),
+        "gmail_message_id": email.gmail_message_id,
+        "subject": email.subject,
+        "sender": email.sender,
+        "received_date": email.received_date.isoformat() if email.received_date else None,
+        "drive_file_id": email.drive_file_id,
+        "drive_url": drive_url,
+        "drive_folder_name": email.drive_folder_name,
+        "attachments": attachments_with_urls,
+        "is_invoice": email.is_invoice,
+        "created_at": email.created_at.isoformat() if email.created_at else None,
+        "email_account": email.email_account.email,
+    }
+
+
+def _positive_int_param(value, default, maximum, name='limit'):
+    """Positive integer query param, capped at maximum (if given)"""
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if number < 1:
+        raise ValueError(f"{name} must be at least 1")
+    return min(number, maximum) if maximum else number
+
+
+def _encode_cursor(email):
+    """Opaque cursor pointing just after this email in (-received_date, -email_id) order"""
+    raw = json.dumps([email.received_date.isoformat(), str(email.email_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        received_date, email_id = json.loads(raw)
+        received_date = datetime.fromisoformat(received_date)
+        email_id = uuid.UUID(email_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return received_date, email_id
+
+
+def _parse_date_param(value, end_of_day=False):
+    """Parse an ISO date or datetime query param into an aware datetime"""
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day:
+        parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    elif parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class ProcessedEmailDeleteView(APIView):
     """Delete a processed email"""
     
@@ -3,7 +3,6 @@ import uuid
 import time
 import threading
 import warnings
-import base64
 import openai
 import csv
 import json
@@ -23,6 +22,8 @@ from io import BytesIO
 
 from utils.response import ResponseInfo
 from utils.jwt_utils import verify_jwt_token
+from utils.job_progress import JobProgressReporter
+from utils.reference_assets import ensure_reference_asset, normalized_jpeg_bytes, store_reference_asset
 from image_gen.models import VideoGenerationJob, VideoReferenceImage
 from image_gen.db_models.user import Users
 
@@ -474,13 +475,11 @@ def generate_video_with_veo(job_id, prompt, duration):
         
         # Update job status to processing
         job = VideoGenerationJob.objects.get(job_id=job_id)
-        job.status = 'processing'
-        job.started_at = datetime.now()
-        job.progress = 10
-        job.save()
+        progress = JobProgressReporter(job)
+        progress.update(10, status='processing', started_at=datetime.now())
         
         # Get reference images if any
-        reference_images = VideoReferenceImage.objects.filter(job=job)
+        reference_images = VideoReferenceImage.objects.filter(job=job).select_related('asset')
         ref_count = reference_images.count()
         print(f"📸 Reference images count: {ref_count}/3 (max allowed by Veo 3.1)")
         
@@ -499,45 +498,14 @@ def generate_video_with_veo(job_id, prompt, duration):
                 try:
                     print(f"  📸 Processing reference image {idx}: {ref_img.filename}")
                     
-                    # Decode base64 image data
+                    # RGB JPEG form of the asset: converted on its first use, then reused by every job
                     try:
-                        image_data_bytes = base64.b64decode(ref_img.image_data)
-                        print(f"     - Decoded image data size: {len(image_data_bytes)} bytes")
-                    except Exception as decode_error:
-                        print(f"     - Base64 decode error: {str(decode_error)}")
-                        print(f"     - Image data length: {len(ref_img.image_data) if ref_img.image_data else 0}")
-                        print(f"     - First 100 chars of image_data: {ref_img.image_data[:100] if ref_img.image_data else 'None'}")
-                        raise Exception(f"Failed to decode base64 image data: {str(decode_error)}")
+                        jpeg_bytes = normalized_jpeg_bytes(ensure_reference_asset(ref_img))
+                    except Exception as read_error:
+                        print(f"     - Read/convert error: {str(read_error)}")
+                        raise Exception(f"Failed to prepare reference image: {str(read_error)}")
                     
-                    # Load image with PIL
-                    try:
-                        pil_image = Image.open(BytesIO(image_data_bytes))
-                    except Exception as pil_error:
-                        print(f"     - PIL open error: {str(pil_error)}")
-                        print(f"     - Decoded bytes first 20: {image_data_bytes[:20]}")
-                        raise Exception(f"Failed to open image with PIL: {str(pil_error)}")
-                    
-                    # Convert to RGB mode if necessary
-                    if pil_image.mode not in ('RGB', 'RGBA'):
-                        print(f"     - Converting from {pil_image.mode} to RGB mode")
-                        pil_image = pil_image.convert('RGB')
-                    
-                    print(f"     - Size: {pil_image.size}, Mode: {pil_image.mode}")
-                    
-                    # Convert image to JPEG bytes for Veo 3.1
-                    output = BytesIO()
-                    if pil_image.mode == 'RGBA':
-                        # Convert RGBA to RGB for JPEG
-                        rgb_image = Image.new('RGB', pil_image.size, (255, 255, 255))
-                        rgb_image.paste(pil_image, mask=pil_image.split()[3])
-                        rgb_image.save(output, format='JPEG', quality=95)
-                    else:
-                        pil_image.save(output, format='JPEG', quality=95)
-                    
-                    # Get the JPEG bytes
-                    jpeg_bytes = output.getvalue()
-                    
-                    print(f"     - Converted to JPEG (size: {len(jpeg_bytes)} bytes)")
+                    print(f"     - JPEG size: {len(jpeg_bytes)} bytes")
                     
                     # Create Image object with raw bytes (not base64)
                     # The types.Image expects raw bytes, not base64 encoded
@@ -586,8 +554,7 @@ def generate_video_with_veo(job_id, prompt, duration):
             )
         
         # Update progress
-        job.progress = 30
-        job.save()
+        progress.update(30)
         
         # Poll the operation status until the video is ready
         print(f"⏳ Waiting for video generation to complete...")
@@ -596,14 +563,12 @@ def generate_video_with_veo(job_id, prompt, duration):
             time.sleep(10)
             operation = client.operations.get(operation)
             
-            # Update progress (gradual increase)
+            # Update progress (gradual increase, written at most every JOB_PROGRESS_MIN_INTERVAL seconds)
             if job.progress < 80:
-                job.progress += 10
-                job.save()
+                progress.update(job.progress + 10)
         
         # Update progress to 90%
-        job.progress = 90
-        job.save()
+        progress.update(90)
         
         print(f"✅ Video generation completed, downloading...")
         
@@ -662,12 +627,13 @@ def generate_video_with_veo(job_id, prompt, duration):
         print(f"💾 Video saved: {video_path} (size: {len(video_content)} bytes)")
         
         # Update job with completion details
-        job.status = 'completed'
-        job.completed_at = datetime.now()
-        job.progress = 100
-        job.video_file_path = video_path
-        job.video_url = f"{settings.MEDIA_URL}{video_path}"
-        job.save()
+        progress.update(
+            100,
+            status='completed',
+            completed_at=datetime.now(),
+            video_file_path=video_path,
+            video_url=f"{settings.MEDIA_URL}{video_path}"
+        )
         
         print(f"✅ Video generation completed successfully for job {job_id}")
         
@@ -681,7 +647,7 @@ def generate_video_with_veo(job_id, prompt, duration):
         job.status = 'failed'
         job.error_message = str(e)
         job.completed_at = datetime.now()
-        job.save()
+        job.save(update_fields=['status', 'error_message', 'completed_at'])
 
 
 def extend_video_with_veo(job_id, prompt, source_veo_metadata):
@@ -701,10 +667,8 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
         
         # Update job status to processing
         job = VideoGenerationJob.objects.get(job_id=job_id)
-        job.status = 'processing'
-        job.started_at = datetime.now()
-        job.progress = 10
-        job.save()
+        progress = JobProgressReporter(job)
+        progress.update(10, status='processing', started_at=datetime.now())
         
         if not source_veo_metadata:
             raise Exception("No Veo metadata found for source video. Please regenerate the video before extending.")
@@ -734,8 +698,7 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
         )
         
         # Update progress
-        job.progress = 30
-        job.save()
+        progress.update(30)
         
         print(f"🎬 Calling Veo 3.1 API for video extension...")
         print(f"   - Prompt: {prompt[:100]}...")
@@ -747,8 +710,7 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
         )
         
         # Update progress
-        job.progress = 40
-        job.save()
+        progress.update(40)
         
         # Poll the operation status until the video is ready
         print(f"⏳ Waiting for video extension to complete...")
@@ -757,14 +719,12 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
             time.sleep(10)
             operation = client.operations.get(operation)
             
-            # Update progress (gradual increase)
+            # Update progress (gradual increase, written at most every JOB_PROGRESS_MIN_INTERVAL seconds)
             if job.progress < 80:
-                job.progress += 10
-                job.save()
+                progress.update(job.progress + 10)
         
         # Update progress to 90%
-        job.progress = 90
-        job.save()
+        progress.update(90)
         
         print(f"✅ Video extension completed, downloading...")
         
@@ -821,12 +781,13 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
         print(f"💾 Extended video saved: {video_path} (size: {len(video_content)} bytes)")
         
         # Update job with completion details
-        job.status = 'completed'
-        job.completed_at = datetime.now()
-        job.progress = 100
-        job.video_file_path = video_path
-        job.video_url = f"{settings.MEDIA_URL}{video_path}"
-        job.save()
+        progress.update(
+            100,
+            status='completed',
+            completed_at=datetime.now(),
+            video_file_path=video_path,
+            video_url=f"{settings.MEDIA_URL}{video_path}"
+        )
         
         print(f"✅ Video extension completed successfully for job {job_id}")
         
@@ -840,7 +801,7 @@ def extend_video_with_veo(job_id, prompt, source_veo_metadata):
         job.status = 'failed'
         job.error_message = str(e)
         job.completed_at = datetime.now()
-        job.save()
+        job.save(update_fields=['status', 'error_message', 'completed_at'])
 
 
 class VideoGenerationView(APIView):
@@ -950,7 +911,7 @@ class VideoGenerationView(APIView):
                 reference_image_count += 1
                 image_file = request.FILES[key]
                 
-                # Read and encode image
+                # Read image
                 image_data = image_file.read()
                 
                 # Validate that it's a valid image before storing
@@ -966,16 +927,10 @@ class VideoGenerationView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                # Re-read the file since verify() consumed it
-                image_file.seek(0)
-                image_data = image_file.read()
-                
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-                
-                # Store reference image
+                # Store reference image (identical bytes share one asset)
                 VideoReferenceImage.objects.create(
                     job=job,
-                    image_data=image_base64,
+                    asset=store_reference_asset(image_data, image_file.content_type),
                     filename=image_file.name,
                     content_type=image_file.content_type,
                     reference_type='asset'  # Default to 'asset' as per Google's example
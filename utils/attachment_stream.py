@@ -0,0 +1,95 @@
+import base64
+import os
+import tempfile
+import threading
+from google.auth.transport.requests import AuthorizedSession
+from googleapiclient.http import MediaIoBaseUpload
+
+# Decoded attachment bytes kept in memory before spilling to a temp file
+SPOOL_MAX_BYTES = int(os.getenv('ATTACHMENT_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+# Resumable upload chunk size (Drive requires a multiple of 256 KB)
+UPLOAD_CHUNK_BYTES = max(1, int(os.getenv('ATTACHMENT_UPLOAD_CHUNK_BYTES', str(4 * 1024 * 1024))) // (256 * 1024)) * 256 * 1024
+# Response bytes read from the socket per step while downloading an attachment
+DOWNLOAD_CHUNK_BYTES = int(os.getenv('ATTACHMENT_DOWNLOAD_CHUNK_BYTES', str(256 * 1024)))
+# Seconds to wait for the next bytes of an attachment download before giving up
+DOWNLOAD_TIMEOUT_SECONDS = int(os.getenv('ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS', '120'))
+
+_local = threading.local()
+
+
+def _session(credentials):
+    """This thread's AuthorizedSession for the credentials (requests sessions aren't thread-safe)"""
+    cached = getattr(_local, 'session', None)
+    if cached is None or cached[0] is not credentials:
+        _local.session = (credentials, AuthorizedSession(credentials))
+    return _local.session[1]
+
+
+def stream_response(request, chunk_size=DOWNLOAD_CHUNK_BYTES):
+    """Send a googleapiclient GET request and yield the response body in chunk_size pieces as it arrives.
+
+    httplib2 (what request.execute() uses) reads the whole body into memory first, so the
+    request is sent with a streaming AuthorizedSession on the same credentials instead.
+    """
+    if hasattr(request, 'stream'):
+        # utils.fake_google requests serve their body themselves
+        yield from request.stream(chunk_size)
+        return
+
+    response = _session(request.http.credentials).get(
+        request.uri, headers=request.headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS
+    )
+    try:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size)
+    finally:
+        response.close()
+
+
+def spool_base64_field(chunks, field=b'data'):
+    """Decode a base64url JSON string field of a body arriving in chunks into a spooled temp file.
+
+    Besides the spool's own SPOOL_MAX_BYTES, only the body up to the field's value and one
+    chunk at a time are held in memory. Returns the file positioned at the start, or None
+    if the field is missing.
+    """
+    key = b'"' + field + b'"'
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        key_at = head.find(key)
+        colon = head.find(b':', key_at + len(key)) if key_at >= 0 else -1
+        quote = head.find(b'"', colon + 1) if colon >= 0 else -1
+        if quote >= 0:
+            break
+    else:
+        return None
+
+    pending = head[quote + 1:]
+    del head
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        while True:
+            end = pending.find(b'"')  # base64url never contains quotes or escapes
+            if end >= 0:
+                tail = pending[:end]
+                spool.write(base64.urlsafe_b64decode(tail + b'=' * (-len(tail) % 4)))
+                break
+            # Decode whole 4-character groups; the rest waits for the next chunk
+            usable = len(pending) - len(pending) % 4
+            spool.write(base64.urlsafe_b64decode(pending[:usable]))
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError(f"response ended inside the {field.decode()} field")
+            pending = pending[usable:] + chunk
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def chunked_media(fileobj, mimetype):
+    """Resumable upload that reads UPLOAD_CHUNK_BYTES from fileobj per request"""
+    return MediaIoBaseUpload(fileobj, mimetype=mimetype, chunksize=UPLOAD_CHUNK_BYTES, resumable=True)
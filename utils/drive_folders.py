@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from django.db import connection, transaction
+from image_gen.models import DriveFolder
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+INVOICE_ROOT_FOLDER = "Adam Pearson Invoice"
+
+
+def _lock_folder_path(account_id, path):
+    """Transaction-scoped advisory lock on one folder path of an account (Postgres only;
+    other databases serialize writes on their own)"""
+    if connection.vendor != 'postgresql':
+        return
+    # Stable across processes, unlike hash()
+    key = int.from_bytes(hashlib.blake2b(f"drive-folder:{account_id}:{path}".encode(), digest_size=8).digest(), 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+
+
+class DriveFolderResolver:
+    """Resolve Drive folder paths to folder IDs, creating missing folders.
+
+    Lookups go through an in-process LRU, then the DriveFolder table, and only then
+    to Drive. Cached IDs are not re-checked up front: callers that get a 404 when
+    using a folder call invalidate() and resolve again. Creating a folder is
+    serialized per (account, path) with a Postgres advisory lock, so concurrent
+    workers never create the same folder twice. Nothing else waits on that lock
+    while Drive is called (the EmailAccount row stays unlocked).
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_folder_id(self, drive_service, email_account, parts):
+        """Folder ID for the path given as a list of folder names, starting below My Drive"""
+        path = '/'.join(str(part) for part in parts)
+        folder_id = self._cache_get(email_account.pk, path)
+        if folder_id:
+            return folder_id
+        return self._resolve_uncached(drive_service, email_account, [str(part) for part in parts])
+
+    def invalidate(self, email_account, parts):
+        """Forget the path, its ancestors and its descendants (a 404 doesn't tell which level is gone)"""
+        parts = [str(part) for part in parts]
+        paths = {'/'.join(parts[:i]) for i in range(1, len(parts) + 1)}
+        path = '/'.join(parts)
+        with self._lock:
+            for key in list(self._cache):
+                if key[0] == email_account.pk and (key[1] in paths or key[1].startswith(path + '/')):
+                    del self._cache[key]
+        DriveFolder.objects.filter(email_account_id=email_account.pk, path__in=paths).delete()
+        DriveFolder.objects.filter(email_account_id=email_account.pk, path__startswith=path + '/').delete()
+
+    def _resolve_uncached(self, drive_service, email_account, parts):
+        path = '/'.join(parts)
+        folder = DriveFolder.objects.filter(email_account_id=email_account.pk, path=path).only('folder_id').first()
+        if folder:
+            self._cache_put(email_account.pk, path, folder.folder_id)
+            return folder.folder_id
+
+        parent_id = self._resolve_uncached(drive_service, email_account, parts[:-1]) if len(parts) > 1 else 'root'
+        with transaction.atomic():
+            # Serialize creation of this path, then re-check in case another worker just created it
+            _lock_folder_path(email_account.pk, path)
+            folder = DriveFolder.objects.filter(email_account_id=email_account.pk, path=path).only('folder_id').first()
+            if folder:
+                folder_id = folder.folder_id
+            else:
+                folder_id = self._find_or_create_folder(drive_service, parts[-1], parent_id)
+                DriveFolder.objects.update_or_create(
+                    email_account_id=email_account.pk,
+                    path=path,
+                    defaults={'folder_id': folder_id}
+                )
+        self._cache_put(email_account.pk, path, folder_id)
+        return folder_id
+
+    def _find_or_create_folder(self, drive_service, name, parent_id):
+        """Get existing folder by name inside parent_id or create a new one"""
+        try:
+            # Escape single quote by doubling it for Google Drive API query
+            name_escaped = name.replace("'", "''")
+            query = f"name='{name_escaped}' and mimeType='{FOLDER_MIME_TYPE}' and trashed=false and '{parent_id}' in parents"
+            results = drive_service.files().list(q=query, fields='files(id)').execute()
+
+            folders = results.get('files', [])
+            if folders:
+                return folders[0]['id']
+
+            folder_metadata = {
+                'name': name,
+                'mimeType': FOLDER_MIME_TYPE
+            }
+            if parent_id != 'root':
+                folder_metadata['parents'] = [parent_id]
+            folder = drive_service.files().create(
+                body=folder_metadata,
+                fields='id'
+            ).execute()
+
+            print(f"📁 Created Drive folder '{name}' (ID: {folder.get('id')})")
+            return folder.get('id')
+
+        except Exception as e:
+            print(f"Error getting/creating '{name}' folder: {e}")
+            raise
+
+    def _cache_get(self, account_id, path):
+        with self._lock:
+            key = (account_id, path)
+            folder_id = self._cache.get(key)
+            if folder_id:
+                self._cache.move_to_end(key)
+            return folder_id
+
+    def _cache_put(self, account_id, path, folder_id):
+        with self._lock:
+            self._cache[(account_id, path)] = folder_id
+            self._cache.move_to_end((account_id, path))
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+
+drive_folders = DriveFolderResolver(max_size=int(os.getenv('DRIVE_FOLDER_CACHE_SIZE', '1024')))
@@ -0,0 +1,102 @@
+import os
+from django.db.models import F
+from django.utils import timezone
+from image_gen.models import EmailOutboxEntry
+
+# Unfinished entries are resumed on every sync of their account, up to OUTBOX_MAX_ATTEMPTS rounds
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+# Max unfinished entries resumed per sync
+OUTBOX_RESUME_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_RESUME_BATCH_SIZE', '50'))
+
+# Drive files saved for a message are tagged with these appProperties, so an upload whose
+# file ID was lost (crash before it was stored) is found again instead of repeated
+MESSAGE_ID_PROPERTY = 'gmailMessageId'
+OUTBOX_KEY_PROPERTY = 'outboxKey'
+EMAIL_FILE_KEY = 'email'
+
+
+def attachment_key(part_id):
+    return f'attachment:{part_id}'
+
+
+def drive_app_properties(gmail_message_id, key):
+    return {MESSAGE_ID_PROPERTY: gmail_message_id, OUTBOX_KEY_PROPERTY: key}
+
+
+def find_drive_copies(drive_service, gmail_message_id):
+    """Files already saved to Drive for a message, as {outbox key: file ID}"""
+    query = (
+        f"appProperties has {{ key='{MESSAGE_ID_PROPERTY}' and value='{gmail_message_id}' }}"
+        " and trashed=false"
+    )
+    copies = {}
+    page_token = None
+    while True:
+        params = {'q': query, 'fields': 'nextPageToken, files(id, appProperties)', 'pageSize': 100}
+        if page_token:
+            params['pageToken'] = page_token
+        results = drive_service.files().list(**params).execute()
+        for file in results.get('files', []):
+            key = file.get('appProperties', {}).get(OUTBOX_KEY_PROPERTY)
+            if key:
+                copies.setdefault(key, file['id'])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return copies
+
+
+def open_outbox_entry(email_account, gmail_message_id, subject=''):
+    """Outbox entry for saving a message. Returns (entry, created); an existing entry may have steps done."""
+    return EmailOutboxEntry.objects.get_or_create(
+        email_account=email_account,
+        gmail_message_id=gmail_message_id,
+        defaults={'subject': subject[:500]}
+    )
+
+
+def save_step(entry, *fields):
+    """Persist the fields of a completed step"""
+    entry.save(update_fields=[*fields, 'updated_at'])
+
+
+def claim_unfinished_entries(email_account, limit=OUTBOX_RESUME_BATCH_SIZE):
+    """Pending entries of the account, oldest first, with a resume round counted for each.
+
+    Entries that already used OUTBOX_MAX_ATTEMPTS rounds are marked failed instead.
+    Callers hold the account's sync lease, so no other worker resumes the same entries.
+    """
+    pending = EmailOutboxEntry.objects.filter(email_account=email_account, status='pending')
+    exhausted = pending.filter(attempts__gte=OUTBOX_MAX_ATTEMPTS).update(
+        status='failed',
+        updated_at=timezone.now()
+    )
+    if exhausted:
+        print(f"❌ Gave up on {exhausted} unfinished invoice save(s) for {email_account.email} after {OUTBOX_MAX_ATTEMPTS} attempts")
+
+    entries = list(pending.order_by('created_at')[:limit])
+    if entries:
+        EmailOutboxEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now()
+        )
+    return entries
+
+
+def record_outbox_error(email_account, gmail_message_id, error):
+    EmailOutboxEntry.objects.filter(
+        email_account=email_account,
+        gmail_message_id=gmail_message_id,
+        status='pending'
+    ).update(error_message=str(error), updated_at=timezone.now())
+
+
+def mark_archived(email_account, gmail_message_ids):
+    """Archiving is the last step: the entries are complete"""
+    if not gmail_message_ids:
+        return
+    now = timezone.now()
+    EmailOutboxEntry.objects.filter(
+        email_account=email_account,
+        gmail_message_id__in=list(gmail_message_ids),
+        recorded_at__isnull=False
+    ).update(status='completed', archived_at=now, completed_at=now, error_message=None, updated_at=now)
@@ -0,0 +1,156 @@
+import base64
+import html
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+# Max characters of body text extracted per email (used for classification, the Drive copy and search)
+BODY_MAX_CHARS = int(os.getenv('EMAIL_BODY_MAX_CHARS', '500000'))
+
+# One pass removes script/style blocks, comments and tags
+_HTML_MARKUP = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[^>]+>', re.IGNORECASE | re.DOTALL)
+_BLANK_LINES = re.compile(r'\n\s*\n')
+_SPACES = re.compile(r'[ \t]+')
+
+
+def _decode_part_data(data, max_chars):
+    """Decode a base64url part body, reading only as much as max_chars characters can need"""
+    # A character is at most 4 UTF-8 bytes; 3 bytes take 4 base64 characters
+    limit = -(-4 * max_chars // 3) * 4
+    if len(data) > limit:
+        data = data[:limit]
+    data += '=' * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')[:max_chars]
+
+
+def extract_body_parts(payload, max_chars=BODY_MAX_CHARS):
+    """Walk a Gmail message payload once and return (plain_text, html_text), each capped at max_chars.
+
+    Parts are visited in document order without recursion. Parts whose MIME type is
+    known and not text (attachments, inline images) are skipped without decoding,
+    and the walk stops as soon as max_chars of plain text are collected since plain
+    text is preferred over HTML.
+    """
+    plain, plain_chars = [], 0
+    markup, markup_chars = [], 0
+    stack = [(payload, '')]
+    while stack and plain_chars < max_chars:
+        part, inherited_mime = stack.pop()
+        part_mime = part.get('mimeType', inherited_mime or '')
+        mime = part_mime.lower()
+        data = part.get('body', {}).get('data')
+
+        if data:
+            if 'text/html' in mime:
+                if markup_chars < max_chars:
+                    text = _decode_part_data(data, max_chars - markup_chars)
+                    markup.append(text)
+                    markup_chars += len(text)
+            elif 'text/' in mime:
+                text = _decode_part_data(data, max_chars - plain_chars)
+                plain.append(text)
+                plain_chars += len(text)
+            elif not mime:
+                # No type given: sniff for HTML
+                text = _decode_part_data(data, max_chars)
+                if text.strip().startswith('<') and '>' in text:
+                    if markup_chars < max_chars:
+                        markup.append(text[:max_chars - markup_chars])
+                        markup_chars += len(markup[-1])
+                else:
+                    plain.append(text[:max_chars - plain_chars])
+                    plain_chars += len(plain[-1])
+        elif part.get('parts'):
+            stack.extend((subpart, part_mime) for subpart in reversed(part['parts']))
+
+    return ''.join(plain), ''.join(markup)
+
+
+def html_to_text(markup):
+    """Plain text from HTML: drop markup, decode entities, collapse whitespace"""
+    text = _HTML_MARKUP.sub('', markup)
+    if '&' in text:
+        text = html.unescape(text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    text = _SPACES.sub(' ', text)
+    return text.strip()
+
+
+def extract_body_text(payload, max_chars=BODY_MAX_CHARS):
+    """Body text of a Gmail message payload, preferring plain text over HTML"""
+    plain_text, html_text = extract_body_parts(payload, max_chars)
+    if plain_text.strip():
+        return plain_text.strip()
+    if html_text.strip():
+        return html_to_text(html_text)
+    return ''
+
+
+def parse_email_date(value):
+    """Aware datetime from an RFC 2822 Date header, or None if it is missing or unparseable"""
+    if not value:
+        return None
+    try:
+        # Fast path for the common exact format
+        return datetime.strptime(value, '%a, %d %b %Y %H:%M:%S %z')
+    except ValueError:
+        pass
+    try:
+        # Handles the variations: no weekday, "(UTC)" comments, obsolete zone names
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+_UNSET = object()
+
+
+class ParsedMessage:
+    """A Gmail API message parsed once for the invoice pipeline.
+
+    Headers are indexed by lowercase name (first occurrence wins); the body and the
+    Date header are decoded on first use and cached.
+    """
+
+    __slots__ = ('id', 'message', 'headers', '_body', '_date')
+
+    def __init__(self, message):
+        self.id = message.get('id')
+        self.message = message
+        headers = {}
+        for header in message.get('payload', {}).get('headers', []):
+            headers.setdefault(header['name'].lower(), header['value'])
+        self.headers = headers
+        self._body = None
+        self._date = _UNSET
+
+    def header(self, name):
+        return self.headers.get(name.lower(), '')
+
+    @property
+    def subject(self):
+        return self.headers.get('subject', '')
+
+    @property
+    def sender(self):
+        return self.headers.get('from', '')
+
+    @property
+    def label_ids(self):
+        return self.message.get('labelIds', [])
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = extract_body_text(self.message.get('payload', {}))
+        return self._body
+
+    @property
+    def date(self):
+        if self._date is _UNSET:
+            self._date = parse_email_date(self.headers.get('date'))
+        return self._date
@@ -0,0 +1,40 @@
+import os
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Func, Value
+
+# Text search configuration for subjects and bodies
+SEARCH_CONFIG = os.getenv('EMAIL_SEARCH_CONFIG', 'english')
+# Body text kept per email for the search index (a tsvector is limited to 1 MB)
+SEARCH_BODY_MAX_CHARS = int(os.getenv('EMAIL_SEARCH_BODY_MAX_CHARS', '100000'))
+
+# Subject ranks above sender, sender above body. The sender is indexed both as whole addresses
+# and split on "@" and "." so "stripe" finds billing@stripe.com.
+SEARCH_VECTOR = (
+    SearchVector('subject', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('sender', weight='B', config='simple')
+    + SearchVector(
+        Func(F('sender'), Value('@.'), Value('  '), function='translate'), weight='B', config=SEARCH_CONFIG
+    )
+    + SearchVector('body_text', weight='C', config=SEARCH_CONFIG)
+)
+
+
+def search_body_text(body):
+    """Body text as stored on ProcessedEmail.body_text"""
+    return (body or '')[:SEARCH_BODY_MAX_CHARS]
+
+
+def update_search_vectors(queryset):
+    """Recompute search_vector for the given ProcessedEmail rows in one UPDATE"""
+    return queryset.update(search_vector=SEARCH_VECTOR)
+
+
+def search_processed_emails(queryset, query):
+    """Rows matching a web-style query (quoted phrases, OR, -exclusions), best match first"""
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    return (
+        queryset
+        .filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank', '-received_date', '-email_id')
+    )
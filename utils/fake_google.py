@@ -0,0 +1,463 @@
+import base64
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import format_datetime
+import httplib2
+from googleapiclient.errors import HttpError
+from utils.google_clients import credential_source
+
+# In-process stand-ins for the Gmail, Drive and Pub/Sub APIs used by the email pipeline,
+# for benchmarks (see the benchmark_email_pipeline command). They implement only the calls
+# the pipeline makes, with the same request/execute/batch surface as googleapiclient, a
+# fixed latency per HTTP round trip and counters of the calls made.
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+def _http_error(status, reason):
+    return HttpError(httplib2.Response({'status': status}), json.dumps({'error': {'message': reason}}).encode())
+
+
+class FakeGoogleStats:
+    """Thread-safe counters: API calls by method, and HTTP round trips (a batch is one)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.http_requests = 0
+
+    def record(self, method, http_requests=1):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.http_requests += http_requests
+
+    def record_batch(self):
+        with self._lock:
+            self.http_requests += 1
+
+    @property
+    def api_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def snapshot(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'api_calls': sum(self.calls.values()), 'http_requests': self.http_requests}
+
+
+class FakeRequest:
+    """One API call. Like googleapiclient's HttpRequest, postproc turns the raw body into the result."""
+
+    def __init__(self, google, method, handler, http_requests=1):
+        self.google = google
+        self.method = method
+        self.handler = handler
+        self.http_requests = http_requests
+        self.postproc = None
+
+    def execute(self, http=None, num_retries=0):
+        self.google.sleep()
+        return self.run()
+
+    def run(self):
+        self.google.stats.record(self.method, self.http_requests)
+        result = self.handler()
+        if self.postproc is not None:
+            return self.postproc(None, json.dumps(result).encode())
+        return result
+
+    def stream(self, chunk_size):
+        """The raw JSON body in chunk_size pieces (see utils.attachment_stream.stream_response)"""
+        self.google.sleep()
+        self.google.stats.record(self.method, self.http_requests)
+        body = json.dumps(self.handler()).encode()
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
+
+
+class FakeBatchRequest:
+    """Batch of requests sent as one HTTP round trip; the callback gets each result or HttpError"""
+
+    def __init__(self, google, callback):
+        self.google = google
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self.requests.append((str(request_id or len(self.requests)), request, callback))
+
+    def execute(self, http=None):
+        self.google.sleep()
+        self.google.stats.record_batch()
+        for request_id, request, callback in self.requests:
+            request.http_requests = 0  # Part of the batch round trip
+            try:
+                response, exception = request.run(), None
+            except HttpError as e:
+                response, exception = None, e
+            (callback or self.callback)(request_id, response, exception)
+
+
+class FakeMailbox:
+    """Gmail mailbox: messages, attachments and the history of added messages"""
+
+    def __init__(self, google, email_address, history_id=1000, id_prefix=0):
+        self.google = google
+        self.email_address = email_address
+        self.id_prefix = id_prefix  # Keeps message IDs unique across mailboxes, like Gmail's
+        self.messages = {}  # id -> message resource (format='full'), in insertion order
+        self.attachments = {}  # attachment ID -> size in bytes
+        self.history = []  # (history ID, message ID)
+        self.history_id = history_id
+        self.first_history_id = history_id
+        self._lock = threading.Lock()
+
+    def add_message(self, subject, body, sender='billing@example.com', labels=('INBOX', 'UNREAD'),
+                    attachments=(), received=None):
+        """Add a message; attachments are (filename, mime_type, size) and hold `size` filler bytes"""
+        with self._lock:
+            self.history_id += 1
+            msg_id = f'{self.id_prefix:04x}{self.history_id:012x}'
+            received = received or datetime.now(dt_timezone.utc)
+            parts = [{
+                'partId': '0',
+                'mimeType': 'text/plain',
+                'filename': '',
+                'body': {'data': base64.urlsafe_b64encode(body.encode()).decode().rstrip('='), 'size': len(body)}
+            }]
+            for index, (filename, mime_type, size) in enumerate(attachments, start=1):
+                attachment_id = f'{msg_id}-{index}'
+                self.attachments[attachment_id] = size
+                parts.append({
+                    'partId': str(index),
+                    'mimeType': mime_type,
+                    'filename': filename,
+                    'body': {'attachmentId': attachment_id, 'size': size}
+                })
+            self.messages[msg_id] = {
+                'id': msg_id,
+                'threadId': msg_id,
+                'labelIds': list(labels),
+                'snippet': body[:200],
+                'historyId': str(self.history_id),
+                'payload': {
+                    'partId': '',
+                    'mimeType': 'multipart/mixed',
+                    'headers': [
+                        {'name': 'From', 'value': sender},
+                        {'name': 'To', 'value': self.email_address},
+                        {'name': 'Subject', 'value': subject},
+                        {'name': 'Date', 'value': format_datetime(received)},
+                    ],
+                    'parts': parts
+                }
+            }
+            self.history.append((self.history_id, msg_id))
+            return msg_id
+
+    def users(self):
+        return _GmailUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self.google, callback)
+
+
+class _GmailUsers:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        self.google = mailbox.google
+
+    def messages(self):
+        return _GmailMessages(self.mailbox)
+
+    def history(self):
+        return _GmailHistory(self.mailbox)
+
+    def getProfile(self, userId):
+        return FakeRequest(self.google, 'gmail.users.getProfile', lambda: {
+            'emailAddress': self.mailbox.email_address,
+            'messagesTotal': len(self.mailbox.messages),
+            'historyId': str(self.mailbox.history_id)
+        })
+
+    def watch(self, userId, body):
+        expiration = datetime.now(dt_timezone.utc) + timedelta(days=7)
+        return FakeRequest(self.google, 'gmail.users.watch', lambda: {
+            'historyId': str(self.mailbox.history_id),
+            'expiration': str(int(expiration.timestamp() * 1000))
+        })
+
+    def stop(self, userId):
+        return FakeRequest(self.google, 'gmail.users.stop', lambda: {})
+
+
+class _GmailHistory:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def list(self, userId, startHistoryId, historyTypes=None, maxResults=100, pageToken=None, **kwargs):
+        mailbox = self.mailbox
+
+        def handler():
+            if int(startHistoryId) < mailbox.first_history_id:
+                raise _http_error(404, 'Requested entity was not found.')
+            records = [
+                {'id': str(history_id), 'messagesAdded': [{'message': {'id': msg_id}}]}
+                for history_id, msg_id in mailbox.history
+                if history_id > int(startHistoryId)
+            ]
+            start = int(pageToken or 0)
+            response = {'history': records[start:start + maxResults], 'historyId': str(mailbox.history_id)}
+            if start + maxResults < len(records):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+
+        return FakeRequest(mailbox.google, 'gmail.users.history.list', handler)
+
+
+class _GmailMessages:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        self.google = mailbox.google
+
+    def attachments(self):
+        return _GmailAttachments(self.mailbox)
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        mailbox = self.mailbox
+
+        def handler():
+            # Only in:inbox is supported; the page token is the last ID of the previous page,
+            # so archiving listed messages doesn't shift later pages
+            ids = [msg_id for msg_id, message in mailbox.messages.items() if 'INBOX' in message['labelIds']]
+            if pageToken:
+                ids = [msg_id for msg_id in ids if msg_id > pageToken]
+            response = {'messages': [{'id': msg_id, 'threadId': msg_id} for msg_id in ids[:maxResults]]}
+            if len(ids) > maxResults:
+                response['nextPageToken'] = ids[maxResults - 1]
+            return response
+
+        return FakeRequest(self.google, 'gmail.users.messages.list', handler)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        mailbox = self.mailbox
+
+        def handler():
+            message = mailbox.messages.get(id)
+            if message is None:
+                raise _http_error(404, 'Requested entity was not found.')
+            if format == 'metadata':
+                wanted = {name.lower() for name in metadataHeaders or []}
+                headers = message['payload']['headers']
+                return {
+                    'id': message['id'],
+                    'threadId': message['threadId'],
+                    'labelIds': list(message['labelIds']),
+                    'snippet': message['snippet'],
+                    'historyId': message['historyId'],
+                    'payload': {
+                        'mimeType': message['payload']['mimeType'],
+                        'headers': [header for header in headers if not wanted or header['name'].lower() in wanted]
+                    }
+                }
+            return json.loads(json.dumps(message))  # Callers get their own copy, like a decoded response
+
+        return FakeRequest(self.google, f'gmail.users.messages.get.{format}', handler)
+
+    def modify(self, userId, id, body):
+        mailbox = self.mailbox
+
+        def handler():
+            with mailbox._lock:
+                message = mailbox.messages.get(id)
+                if message is None:
+                    raise _http_error(404, 'Requested entity was not found.')
+                labels = [label for label in message['labelIds'] if label not in body.get('removeLabelIds', [])]
+                labels += [label for label in body.get('addLabelIds', []) if label not in labels]
+                message['labelIds'] = labels
+                return {'id': id, 'labelIds': list(labels)}
+
+        return FakeRequest(self.google, 'gmail.users.messages.modify', handler)
+
+
+class _GmailAttachments:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def get(self, userId, messageId, id):
+        mailbox = self.mailbox
+
+        def handler():
+            size = mailbox.attachments.get(id)
+            if size is None:
+                raise _http_error(404, 'Requested entity was not found.')
+            data = base64.urlsafe_b64encode(b'\0' * size).decode()
+            return {'attachmentId': id, 'size': size, 'data': data}
+
+        return FakeRequest(mailbox.google, 'gmail.users.messages.attachments.get', handler)
+
+
+class FakeDrive:
+    """Drive with file create (simple and resumable uploads) and list by folder name or appProperties"""
+
+    _NAME = re.compile(r"name='((?:[^']|'')*)'")
+    _PARENT = re.compile(r"'([^']+)' in parents")
+    _APP_PROPERTY = re.compile(r"appProperties has \{ key='([^']+)' and value='([^']*)' \}")
+
+    def __init__(self, google):
+        self.google = google
+        self.files_by_id = {}
+        self.bytes_uploaded = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def files(self):
+        return _DriveFiles(self)
+
+    def _match(self, file, query):
+        name = self._NAME.search(query)
+        if name and file['name'] != name.group(1).replace("''", "'"):
+            return False
+        parent = self._PARENT.search(query)
+        if parent and parent.group(1) not in file['parents']:
+            return False
+        if f"mimeType='{FOLDER_MIME_TYPE}'" in query and file['mimeType'] != FOLDER_MIME_TYPE:
+            return False
+        for key, value in self._APP_PROPERTY.findall(query):
+            if file['appProperties'].get(key) != value:
+                return False
+        return True
+
+
+class _DriveFiles:
+    def __init__(self, drive):
+        self.drive = drive
+        self.google = drive.google
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        drive = self.drive
+        body = body or {}
+        size = media_body.size() if media_body is not None else 0
+        http_requests = 1
+        if media_body is not None and media_body.resumable():
+            # Session start plus one request per chunk
+            chunk_size = media_body.chunksize()
+            http_requests = 1 + max(1, math.ceil(size / chunk_size) if chunk_size > 0 else 1)
+
+        def handler():
+            if media_body is not None:
+                # Read the content the way the upload would, without keeping it
+                chunk_size = media_body.chunksize() if media_body.chunksize() > 0 else size
+                for offset in range(0, size, max(1, chunk_size)):
+                    media_body.getbytes(offset, min(chunk_size, size - offset))
+            with drive._lock:
+                drive._next_id += 1
+                file_id = f'file{drive._next_id:08d}'
+                drive.files_by_id[file_id] = {
+                    'id': file_id,
+                    'name': body.get('name', 'Untitled'),
+                    'mimeType': body.get('mimeType') or (media_body.mimetype() if media_body is not None else ''),
+                    'parents': list(body.get('parents') or ['root']),
+                    'appProperties': dict(body.get('appProperties') or {}),
+                    'size': size,
+                    'trashed': False
+                }
+                drive.bytes_uploaded += size
+            return {'id': file_id}
+
+        return FakeRequest(self.google, 'drive.files.create', handler, http_requests)
+
+    def list(self, q='', fields=None, pageSize=100, pageToken=None, **kwargs):
+        drive = self.drive
+
+        def handler():
+            with drive._lock:
+                matches = [
+                    {'id': file['id'], 'name': file['name'], 'appProperties': dict(file['appProperties'])}
+                    for file in drive.files_by_id.values()
+                    if not file['trashed'] and drive._match(file, q or '')
+                ]
+            start = int(pageToken or 0)
+            response = {'files': matches[start:start + pageSize]}
+            if start + pageSize < len(matches):
+                response['nextPageToken'] = str(start + pageSize)
+            return response
+
+        return FakeRequest(self.google, 'drive.files.list', handler)
+
+
+class FakePubSub:
+    """Builds the push requests Pub/Sub sends to GmailPushWebhookView"""
+
+    def __init__(self):
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def push_envelope(self, mailbox):
+        with self._lock:
+            self._next_id += 1
+            message_id = str(self._next_id)
+        data = json.dumps({'emailAddress': mailbox.email_address, 'historyId': mailbox.history_id})
+        return {
+            'message': {
+                'data': base64.urlsafe_b64encode(data.encode()).decode(),
+                'messageId': message_id,
+                'publishTime': datetime.now(dt_timezone.utc).isoformat()
+            },
+            'subscription': 'projects/fake/subscriptions/gmail-push'
+        }
+
+
+class FakeGoogle:
+    """Fake Google backend: one mailbox per email address, a shared Drive and Pub/Sub.
+
+    Install it with google_clients.override(fake.client_class()) and restore with
+    google_clients.override(). latency is slept once per HTTP round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.stats = FakeGoogleStats()
+        self.mailboxes = {}
+        self.drives = {}
+        self.pubsub = FakePubSub()
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def mailbox(self, email_address):
+        with self._lock:
+            key = email_address.lower()
+            if key not in self.mailboxes:
+                self.mailboxes[key] = FakeMailbox(self, email_address, id_prefix=len(self.mailboxes) + 1)
+                self.drives[key] = FakeDrive(self)
+            return self.mailboxes[key]
+
+    def drive(self, email_address):
+        self.mailbox(email_address)
+        return self.drives[email_address.lower()]
+
+    def client_class(self):
+        """GoogleClients stand-in bound to this backend, for GoogleClientFactory.override"""
+        google = self
+
+        class FakeGoogleClients:
+            def __init__(self, email_account):
+                self.source = credential_source(email_account.credentials)
+                self.gmail = google.mailbox(email_account.email)
+                self.drive = google.drive(email_account.email)
+
+            def ensure_fresh(self, email_account):
+                pass
+
+        return FakeGoogleClients
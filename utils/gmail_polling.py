@@ -0,0 +1,95 @@
+import os
+import traceback
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from image_gen.models import EmailAccount
+from utils.gmail_queue import SYNC_LEASE_SECONDS, acquire_sync_lease, release_sync_lease
+
+# Poll-mode accounts are synced again after POLL_MIN_INTERVAL_SECONDS when the last sync saved an
+# invoice; every quiet sync multiplies the interval by POLL_BACKOFF_FACTOR, up to POLL_MAX_INTERVAL_SECONDS
+POLL_MIN_INTERVAL_SECONDS = int(os.getenv('GMAIL_POLL_MIN_INTERVAL_SECONDS', '60'))
+POLL_MAX_INTERVAL_SECONDS = int(os.getenv('GMAIL_POLL_MAX_INTERVAL_SECONDS', '1800'))
+POLL_BACKOFF_FACTOR = float(os.getenv('GMAIL_POLL_BACKOFF_FACTOR', '2'))
+
+
+def next_poll_interval(previous_interval, processed_count):
+    """Short after invoice activity, growing geometrically while the mailbox stays quiet"""
+    if processed_count:
+        return POLL_MIN_INTERVAL_SECONDS
+    previous_interval = previous_interval or POLL_MIN_INTERVAL_SECONDS
+    return int(min(POLL_MAX_INTERVAL_SECONDS, max(POLL_MIN_INTERVAL_SECONDS, previous_interval * POLL_BACKOFF_FACTOR)))
+
+
+def switch_to_polling(email_account):
+    """Sync the account by polling from now on (used when its Gmail watch can't be set up or renewed)"""
+    updates = {
+        'sync_mode': 'poll',
+        'watch_expiration': None,
+        'poll_interval_seconds': POLL_MIN_INTERVAL_SECONDS,
+        'next_poll_at': timezone.now() + timedelta(seconds=POLL_MIN_INTERVAL_SECONDS),
+    }
+    EmailAccount.objects.filter(pk=email_account.pk).update(**updates)
+    for field, value in updates.items():
+        setattr(email_account, field, value)
+    print(f"🔁 {email_account.email} switched to polling every {POLL_MIN_INTERVAL_SECONDS}s+")
+
+
+def claim_due_accounts(batch_size=10):
+    """Claim poll-mode accounts whose next poll is due with SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Claimed accounts get next_poll_at pushed past the sync lease, so a dead poller's
+    accounts are picked up again once that expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        accounts = list(
+            EmailAccount.objects.select_for_update(skip_locked=True).filter(
+                Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now),
+                sync_mode='poll',
+                is_active=True,
+                is_automated=True
+            ).order_by(F('next_poll_at').asc(nulls_first=True))[:batch_size]
+        )
+        if accounts:
+            EmailAccount.objects.filter(pk__in=[a.pk for a in accounts]).update(
+                next_poll_at=now + timedelta(seconds=SYNC_LEASE_SECONDS)
+            )
+    return accounts
+
+
+def poll_account(email_account):
+    """Run one incremental sync for a poll-mode account and schedule the next one"""
+    # Imported here to avoid a circular import (the views module is loaded by the URL conf)
+    from image_gen.views.email_automation_view import EmailAutomationService
+
+    interval = email_account.poll_interval_seconds or POLL_MIN_INTERVAL_SECONDS
+    if not acquire_sync_lease(email_account):
+        # Another sync (e.g. the setup view) is running; it covers this poll
+        print(f"⏳ Sync already in flight for {email_account.email}, polling again in {POLL_MIN_INTERVAL_SECONDS}s")
+        _schedule(email_account, interval, POLL_MIN_INTERVAL_SECONDS)
+        return
+
+    processed_count = 0
+    try:
+        processed_count = EmailAutomationService().process_new_emails(
+            email_account,
+            email_account.watch_history_id
+        )
+    except Exception as e:
+        print(f"❌ Error polling {email_account.email}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+    finally:
+        release_sync_lease(email_account)
+
+    interval = next_poll_interval(interval, processed_count)
+    _schedule(email_account, interval, interval)
+    print(f"🕒 Next poll for {email_account.email} in {interval}s")
+
+
+def _schedule(email_account, interval, delay):
+    EmailAccount.objects.filter(pk=email_account.pk).update(
+        poll_interval_seconds=interval,
+        next_poll_at=timezone.now() + timedelta(seconds=delay)
+    )
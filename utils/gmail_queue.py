@@ -0,0 +1,225 @@
+import os
+import traceback
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from image_gen.models import EmailAccount, GmailPushNotification
+from utils.image_jobs import worker_name
+
+# Notifications are retried with linear backoff until MAX_ATTEMPTS, then marked failed
+MAX_ATTEMPTS = int(os.getenv('GMAIL_QUEUE_MAX_ATTEMPTS', '5'))
+RETRY_DELAY_SECONDS = int(os.getenv('GMAIL_QUEUE_RETRY_DELAY_SECONDS', '30'))
+# A notification stuck in 'processing' longer than this is assumed to belong to a dead worker
+STALE_AFTER_SECONDS = int(os.getenv('GMAIL_QUEUE_STALE_AFTER_SECONDS', '900'))
+# Only one sync per account may run at a time; the lease is extended after every chunk of
+# messages and expires if its worker dies
+SYNC_LEASE_SECONDS = int(os.getenv('GMAIL_SYNC_LEASE_SECONDS', '900'))
+# Notifications for an account that is already syncing are retried after this delay
+COALESCE_DELAY_SECONDS = int(os.getenv('GMAIL_COALESCE_DELAY_SECONDS', '5'))
+
+
+def enqueue_notification(email_address, history_id, pubsub_message_id=None):
+    """Persist a Gmail push notification for the workers. Redelivered Pub/Sub messages are ignored."""
+    GmailPushNotification.objects.bulk_create(
+        [GmailPushNotification(
+            email_address=email_address,
+            history_id=str(history_id) if history_id is not None else None,
+            pubsub_message_id=pubsub_message_id,
+        )],
+        ignore_conflicts=True
+    )
+
+
+def claim_notifications(batch_size=10):
+    """Claim up to batch_size notifications with SELECT ... FOR UPDATE SKIP LOCKED"""
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            GmailPushNotification.objects.select_for_update(skip_locked=True).filter(
+                Q(status='queued', available_at__lte=now) |
+                Q(status='processing', started_at__lt=now - timedelta(seconds=STALE_AFTER_SECONDS))
+            ).order_by('available_at')[:batch_size]
+        )
+        if notifications:
+            GmailPushNotification.objects.filter(
+                pk__in=[n.pk for n in notifications]
+            ).update(status='processing', started_at=now, attempts=F('attempts') + 1)
+    return notifications
+
+
+class SyncLeaseLost(Exception):
+    """The sync lease expired and another worker took the account over"""
+
+
+def acquire_sync_lease(email_account):
+    """Take the per-account sync lease. Returns False if another sync is already in flight.
+
+    The lease is recorded with an owner token, kept on `email_account` for extend/release.
+    """
+    now = timezone.now()
+    owner = f"{worker_name()}-{uuid.uuid4().hex[:8]}"
+    acquired = EmailAccount.objects.filter(
+        Q(sync_lease_until__isnull=True) | Q(sync_lease_until__lt=now),
+        pk=email_account.pk
+    ).update(sync_lease_until=now + timedelta(seconds=SYNC_LEASE_SECONDS), sync_lease_owner=owner) == 1
+    email_account.sync_lease_owner = owner if acquired else None
+    return acquired
+
+
+def extend_sync_lease(email_account):
+    """Heartbeat for long syncs: push the lease SYNC_LEASE_SECONDS ahead again.
+
+    Raises SyncLeaseLost if another worker holds the lease now. No-op without a lease.
+    """
+    if not email_account.sync_lease_owner:
+        return
+    extended = EmailAccount.objects.filter(
+        pk=email_account.pk,
+        sync_lease_owner=email_account.sync_lease_owner
+    ).update(sync_lease_until=timezone.now() + timedelta(seconds=SYNC_LEASE_SECONDS))
+    if not extended:
+        email_account.sync_lease_owner = None
+        raise SyncLeaseLost(f"Sync lease of {email_account.email} was taken over by another worker")
+
+
+def release_sync_lease(email_account):
+    """Release the lease, only if this sync still holds it"""
+    if not email_account.sync_lease_owner:
+        return
+    EmailAccount.objects.filter(
+        pk=email_account.pk,
+        sync_lease_owner=email_account.sync_lease_owner
+    ).update(sync_lease_until=None, sync_lease_owner=None)
+    email_account.sync_lease_owner = None
+
+
+def process_notifications(notifications):
+    """Process a claimed batch, running at most one sync per email address"""
+    groups = {}
+    for notification in notifications:
+        groups.setdefault(notification.email_address, []).append(notification)
+    for email_address, group in groups.items():
+        process_account_notifications(email_address, group)
+
+
+def process_account_notifications(email_address, notifications):
+    """Coalesce all pending notifications for an account into a single sync run"""
+    # Imported here to avoid a circular import (the views module is loaded by the URL conf)
+    from image_gen.views.email_automation_view import EmailAutomationService
+
+    email_account = EmailAccount.objects.filter(
+        email=email_address,
+        is_active=True,
+        is_automated=True
+    ).first()
+
+    if not email_account:
+        print(f"⚠️ Email account not found or not automated: {email_address}")
+        _mark_completed(notifications, "Email account not found or not automated")
+        return
+
+    if not acquire_sync_lease(email_account):
+        # Another worker is syncing this account. Its run (or the stale check after it) covers these.
+        print(f"⏳ Sync already in flight for {email_address}, deferring {len(notifications)} notification(s)")
+        _defer(notifications)
+        return
+
+    primary = notifications[0]
+    absorbed = notifications[1:]
+    try:
+        absorbed += _absorb_queued(email_address, [n.pk for n in notifications])
+        history_id = _max_history_id([primary] + absorbed)
+        if absorbed:
+            print(f"🧩 Coalesced {len(absorbed) + 1} notification(s) for {email_address} (max history_id {history_id})")
+        # The primary notification stands in for the whole group from here on
+        primary.history_id = history_id
+        _mark_completed(absorbed, f"Coalesced into {primary.notification_id}")
+
+        # Skip if the highest history_id is same or older than stored history_id
+        # This prevents processing duplicate notifications or notifications for changes we've already processed
+        if email_account.watch_history_id and history_id:
+            try:
+                if int(history_id) <= int(email_account.watch_history_id):
+                    print(f"⏭️  Skipping notification: history_id ({history_id}) is same or older than stored ({email_account.watch_history_id})")
+                    _mark_completed([primary], "History already processed")
+                    return
+            except (ValueError, TypeError):
+                # If history IDs can't be compared as integers, proceed with processing
+                pass
+
+        # Use the STORED watch_history_id as starting point, not the notification's history_id
+        print(f"🔄 Processing notification for {email_account.email} from history_id {email_account.watch_history_id}")
+        EmailAutomationService().process_new_emails(
+            email_account,
+            email_account.watch_history_id
+        )
+        _mark_completed([primary])
+
+    except Exception as e:
+        print(f"❌ Error processing notification {primary.notification_id}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        _mark_failed(primary, str(e))
+    finally:
+        release_sync_lease(email_account)
+
+
+def _absorb_queued(email_address, exclude_ids):
+    """Claim every other queued notification for the address, including deferred ones"""
+    with transaction.atomic():
+        queued = list(
+            GmailPushNotification.objects.select_for_update(skip_locked=True).filter(
+                email_address=email_address,
+                status='queued'
+            ).exclude(pk__in=exclude_ids)
+        )
+        if queued:
+            GmailPushNotification.objects.filter(
+                pk__in=[n.pk for n in queued]
+            ).update(status='processing', started_at=timezone.now())
+    return queued
+
+
+def _max_history_id(notifications):
+    history_ids = []
+    for notification in notifications:
+        try:
+            history_ids.append(int(notification.history_id))
+        except (ValueError, TypeError):
+            continue
+    return str(max(history_ids)) if history_ids else None
+
+
+def _defer(notifications):
+    # Deferral is not a failed attempt, so give back the attempt taken by the claim
+    GmailPushNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+        status='queued',
+        available_at=timezone.now() + timedelta(seconds=COALESCE_DELAY_SECONDS),
+        attempts=F('attempts') - 1
+    )
+
+
+def _mark_completed(notifications, note=None):
+    GmailPushNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+        status='completed',
+        completed_at=timezone.now(),
+        error_message=note
+    )
+
+
+def _mark_failed(notification, error_message):
+    attempts = notification.attempts + 1  # The claim incremented attempts in the DB only
+    if attempts < MAX_ATTEMPTS:
+        GmailPushNotification.objects.filter(pk=notification.pk).update(
+            status='queued',
+            history_id=notification.history_id,
+            available_at=timezone.now() + timedelta(seconds=RETRY_DELAY_SECONDS * attempts),
+            error_message=error_message
+        )
+    else:
+        GmailPushNotification.objects.filter(pk=notification.pk).update(
+            status='failed',
+            completed_at=timezone.now(),
+            error_message=error_message
+        )
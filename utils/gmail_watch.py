@@ -0,0 +1,62 @@
+import os
+from datetime import datetime, timezone as dt_timezone
+from image_gen.models import EmailAccount
+from utils.gmail_queue import enqueue_notification
+from utils.google_clients import google_clients
+
+
+class GmailWatchPermissionError(ValueError):
+    """Gmail may not publish to the Pub/Sub topic (403), so push notifications can't be used"""
+
+
+def pubsub_topic():
+    """Full Pub/Sub topic name Gmail publishes to (GMAIL_PUBSUB_TOPIC may be a bare topic ID)"""
+    project_id = os.getenv('GOOGLE_CLOUD_PROJECT_ID')
+    topic_name = os.getenv('GMAIL_PUBSUB_TOPIC')
+    if not project_id:
+        raise ValueError("GOOGLE_CLOUD_PROJECT_ID not configured. Set it in your .env file.")
+
+    # Construct topic name if not provided
+    if not topic_name:
+        return f'projects/{project_id}/topics/gmail-notifs'
+    if not topic_name.startswith('projects/'):
+        # If just topic ID is provided, construct full path
+        return f'projects/{project_id}/topics/{topic_name}'
+    return topic_name
+
+
+def watch_request_body(topic_name=None):
+    return {
+        'labelIds': ['INBOX'],
+        'topicName': topic_name or pubsub_topic(),
+        'labelFilterBehavior': 'INCLUDE'  # Include only messages with these labels
+    }
+
+
+def watch_expiration(response):
+    """Aware datetime from the watch response's expiration (epoch milliseconds), or None"""
+    if 'expiration' not in response:
+        return None
+    return datetime.fromtimestamp(int(response['expiration']) / 1000, tz=dt_timezone.utc)
+
+
+def renew_watch(email_account, topic_name=None):
+    """Re-call users().watch for an account and store the new expiration.
+
+    watch_history_id is the sync cursor, so it is not moved to the watch's historyId
+    (that would skip changes not synced yet). Instead a notification carrying that
+    historyId is queued, so a worker catches up on anything a lapsed or lost push missed.
+    Returns the watch response.
+    """
+    gmail_service = google_clients.get(email_account).gmail
+    response = gmail_service.users().watch(userId='me', body=watch_request_body(topic_name)).execute()
+
+    expiration = watch_expiration(response)
+    if expiration:
+        EmailAccount.objects.filter(pk=email_account.pk).update(watch_expiration=expiration)
+        email_account.watch_expiration = expiration
+
+    history_id = response.get('historyId')
+    if history_id and str(history_id) != str(email_account.watch_history_id):
+        enqueue_notification(email_account.email, str(history_id))
+    return response
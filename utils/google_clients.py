@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from image_gen.models import EmailAccount
+
+# Access tokens are refreshed this long before they expire
+REFRESH_MARGIN = timedelta(seconds=int(os.getenv('GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS', '300')))
+
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+
+def _discovery_doc(api, version):
+    """Parsed discovery document, loaded once per process (build_from_document doesn't modify it)"""
+    with _discovery_lock:
+        if (api, version) not in _discovery_docs:
+            _discovery_docs[(api, version)] = json.loads(discovery_cache.get_static_doc(api, version))
+        return _discovery_docs[(api, version)]
+
+
+def _thread_local_request_builder(credentials):
+    """Request builder giving every thread its own authorized connection, so one service object
+    can be shared between threads (httplib2.Http itself is not thread-safe)"""
+    local = threading.local()
+
+    def build_request(http, *args, **kwargs):
+        if getattr(local, 'http', None) is None:
+            local.http = AuthorizedHttp(credentials, http=httplib2.Http())
+        return HttpRequest(local.http, *args, **kwargs)
+
+    return build_request
+
+
+def credential_source(credentials_json):
+    """Identifies the OAuth grant; a change means the account was re-authorized"""
+    credentials_json = credentials_json or {}
+    return (credentials_json.get('refresh_token'), credentials_json.get('client_id'))
+
+
+class GoogleClients:
+    """Gmail and Drive services for one email account, sharing one set of credentials"""
+
+    def __init__(self, email_account):
+        self.source = credential_source(email_account.credentials)
+        self.credentials = Credentials.from_authorized_user_info(email_account.credentials)
+        self.persisted_token = email_account.credentials.get('token')
+        self.lock = threading.Lock()
+        request_builder = _thread_local_request_builder(self.credentials)
+        self.gmail = build_from_document(
+            _discovery_doc('gmail', 'v1'), credentials=self.credentials, requestBuilder=request_builder
+        )
+        self.drive = build_from_document(
+            _discovery_doc('drive', 'v3'), credentials=self.credentials, requestBuilder=request_builder
+        )
+
+    def ensure_fresh(self, email_account):
+        """Refresh the access token shortly before expiry and store it only when it changed"""
+        with self.lock:
+            creds = self.credentials
+            expiring = creds.token is None or (
+                creds.expiry is not None and creds.expiry - REFRESH_MARGIN <= datetime.utcnow()
+            )
+            if expiring and creds.refresh_token:
+                print(f"🔑 Refreshing access token for {email_account.email}")
+                creds.refresh(Request())
+
+            # The transport may also have refreshed the token on a 401
+            if creds.token != self.persisted_token:
+                credentials_json = json.loads(creds.to_json())
+                EmailAccount.objects.filter(pk=email_account.pk).update(credentials=credentials_json)
+                email_account.credentials = credentials_json
+                self.persisted_token = creds.token
+
+
+class GoogleClientFactory:
+    """Process-wide cache of GoogleClients per email account"""
+
+    def __init__(self, client_class=GoogleClients):
+        self.client_class = client_class
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, email_account):
+        with self._lock:
+            clients = self._clients.get(email_account.pk)
+            if clients is None or clients.source != credential_source(email_account.credentials):
+                clients = self.client_class(email_account)
+                self._clients[email_account.pk] = clients
+        clients.ensure_fresh(email_account)
+        return clients
+
+    def invalidate(self, email_account):
+        with self._lock:
+            self._clients.pop(email_account.pk, None)
+
+    def override(self, client_class=None):
+        """Build clients with client_class from now on (e.g. utils.fake_google); None restores GoogleClients"""
+        with self._lock:
+            self.client_class = client_class or GoogleClients
+            self._clients.clear()
+
+
+google_clients = GoogleClientFactory()
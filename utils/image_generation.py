@@ -0,0 +1,317 @@
+import base64
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from google import genai
+from PIL import Image
+from image_gen.models import ImageGenerationJob
+from utils.job_progress import JobProgressReporter
+from utils.reference_assets import ensure_reference_asset
+
+GENAI_IMAGE_MODEL = "gemini-2.5-flash-image-preview"
+
+# Output dimensions per quality setting
+QUALITY_DIMENSIONS = {
+    'standard': {'width': 512, 'height': 512},
+    'high': {'width': 768, 'height': 768},
+    'ultra': {'width': 1024, 'height': 1024}
+}
+
+
+def public_media_base_url(fallback=None):
+    """Absolute base URL of MEDIA_ROOT: PUBLIC_MEDIA_BASE_URL, else `fallback` (the URL recorded when
+    the job was queued), else the relative MEDIA_URL"""
+    base_url = settings.PUBLIC_MEDIA_BASE_URL or fallback or settings.MEDIA_URL
+    return base_url if base_url.endswith('/') else base_url + '/'
+
+
+@dataclass(frozen=True)
+class ImageJobSpec:
+    """Everything needed to generate a job's image, as plain data.
+
+    Holds no request, model instance or connection, so it can be pickled into a process
+    pool or sent as JSON (to_dict/from_dict) to a worker on another host.
+    """
+    job_id: str
+    prompt: str
+    style: str
+    quality: str
+    media_base_url: str
+    reference_images: tuple = ()  # {'file_path' (default_storage), 'filename', 'content_type'} per reference image
+
+    @classmethod
+    def from_job(cls, job):
+        return cls(
+            job_id=str(job.job_id),
+            prompt=job.prompt,
+            style=job.style,
+            quality=job.quality,
+            media_base_url=public_media_base_url(job.media_base_url),
+            reference_images=tuple(
+                {
+                    'file_path': ensure_reference_asset(ref_img).file_path,
+                    'filename': ref_img.filename,
+                    'content_type': ref_img.content_type
+                }
+                for ref_img in job.reference_images.select_related('asset')
+            )
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{**data, 'reference_images': tuple(data.get('reference_images', ()))})
+
+    def to_dict(self):
+        return {**asdict(self), 'reference_images': list(self.reference_images)}
+
+
+def _store_image(spec, content, extension):
+    image_id = str(uuid.uuid4())
+    file_path = default_storage.save(f"generated_images/{image_id}{extension}", ContentFile(content))
+    return image_id, spec.media_base_url + file_path
+
+
+def generate_image(spec, api_key, report_progress=None):
+    """Generate the image of a job spec with Google Genai (Nano Banana) and store it.
+
+    Uses only the spec, the API and default_storage, never the database. Falls back to a demo
+    image when the API fails. Returns the result fields to record on the job.
+    """
+    report_progress = report_progress or (lambda progress: None)
+    prompt = spec.prompt
+    quality_params = QUALITY_DIMENSIONS.get(spec.quality, QUALITY_DIMENSIONS['standard'])
+    dimensions = f"{quality_params['width']}x{quality_params['height']}"
+    
+    # Enhance prompt based on style
+    style_prompts = {
+        'realistic': f"{prompt}, photorealistic, high detail, natural lighting, professional photography",
+        'artistic': f"{prompt}, artistic style, painted, creative interpretation, masterpiece art",
+        'cartoon': f"{prompt}, cartoon style, animated, colorful, illustration, fun",
+        'abstract': f"{prompt}, abstract art, geometric, modern, creative, artistic"
+    }
+    enhanced_prompt = style_prompts.get(spec.style, prompt)
+    
+    report_progress(30)
+    
+    try:
+        client = genai.Client(api_key=api_key)
+        
+        print("=" * 100)
+        print("🚀 STARTING IMAGE GENERATION WITH GOOGLE GENAI")
+        print("=" * 100)
+        print(f"🎯 PROMPT BEING USED: {enhanced_prompt}")
+        print("=" * 100)
+        report_progress(50)
+        
+        contents = [enhanced_prompt]
+        
+        # Add reference images if provided
+        if spec.reference_images:
+            print(f"Adding {len(spec.reference_images)} reference images")
+            for ref_img in spec.reference_images:
+                try:
+                    with default_storage.open(ref_img["file_path"], 'rb') as f:
+                        pil_image = Image.open(BytesIO(f.read()))
+                    contents.append(pil_image)
+                    print(f"Added reference image: {pil_image.size}")
+                except Exception as e:
+                    print(f"Error processing reference image: {str(e)}")
+        
+        report_progress(60)
+        
+        print("Calling Google Genai API...")
+        response = client.models.generate_content(
+            model=GENAI_IMAGE_MODEL,
+            contents=contents,
+        )
+        
+        print(f"Google Genai Response received: {type(response)}")
+        report_progress(80)
+        
+        # Process the response to extract the generated image
+        image_content = None
+        mime_type = ''
+        if hasattr(response, 'candidates') and response.candidates:
+            candidate = response.candidates[0]
+            if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
+                for part in candidate.content.parts:
+                    if hasattr(part, 'inline_data') and part.inline_data:
+                        image_data = part.inline_data.data
+                        mime_type = part.inline_data.mime_type or ''
+                        print(f"Found image data with mime type: {mime_type}")
+                        
+                        if isinstance(image_data, str):
+                            image_content = base64.b64decode(image_data)
+                        else:
+                            image_content = image_data
+                        
+                        print(f"Image data length: {len(image_content)} bytes")
+                        break
+        
+        if not image_content:
+            if hasattr(response, 'text'):
+                print("Response contains text, not image")
+            print("No image found in Google Genai response")
+            raise Exception("No image data found in API response")
+        
+        file_extension = ".png"
+        if "jpeg" in mime_type.lower() or "jpg" in mime_type.lower():
+            file_extension = ".jpg"
+        elif "webp" in mime_type.lower():
+            file_extension = ".webp"
+        
+        image_id, image_url = _store_image(spec, image_content, file_extension)
+        print(f"✅ Job {spec.job_id} completed successfully with Google Genai!")
+        return {
+            'image_url': image_url,
+            'image_id': image_id,
+            'provider': "google-genai-gemini-2.5-flash-image",
+            'dimensions': dimensions,
+            'note': None
+        }
+    
+    except Exception as e:
+        print(f"Google Genai error: {str(e)}")
+        print("Creating demo image as fallback...")
+        image_id, image_url = _store_image(spec, create_demo_image(enhanced_prompt, quality_params), ".png")
+        print(f"Job {spec.job_id} completed with demo fallback")
+        return {
+            'image_url': image_url,
+            'image_id': image_id,
+            'provider': "google-genai-demo-fallback",
+            'dimensions': dimensions,
+            'note': f"Demo image - API error: {str(e)}"
+        }
+
+
+def run_image_generation_job(job_id, api_key=None):
+    """Generate the image for a job claimed by the run_image_workers command and record the result.
+
+    Writes go through a JobProgressReporter: only the named fields are updated, so they never
+    overwrite the lease the worker's heartbeat extends.
+    """
+    try:
+        job = ImageGenerationJob.objects.get(job_id=job_id)
+    except ImageGenerationJob.DoesNotExist:
+        print(f"Job {job_id} not found in database")
+        return
+    
+    api_key = api_key or os.getenv('NANO_BANANA_API_KEY')
+    print(f"Starting Google Genai (Nano Banana) generation for job {job_id}")
+    print(f"API Key: {'Present' if api_key else 'Missing'}")
+    
+    progress = JobProgressReporter(job)
+    progress.update(10, status="processing", started_at=datetime.now())
+    
+    try:
+        result = generate_image(ImageJobSpec.from_job(job), api_key, progress.update)
+    except Exception as e:
+        print(f"Job {job_id} failed: {str(e)}")
+        progress.update(0, status="error", completed_at=datetime.now(), error_message=str(e))
+        return
+    
+    progress.update(100, status="completed", completed_at=datetime.now(), **result)
+
+
+def create_demo_image(prompt, quality_params):
+    """Create a Google-branded demo image"""
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+        import io
+        import random
+        
+        width = quality_params['width']
+        height = quality_params['height']
+        
+        # Create Google-style gradient
+        image = Image.new('RGB', (width, height))
+        draw = ImageDraw.Draw(image)
+        
+        # Google brand colors gradient
+        colors = [
+            (66, 133, 244),   # Google Blue
+            (234, 67, 53),    # Google Red  
+            (251, 188, 5),    # Google Yellow
+            (52, 168, 83)     # Google Green
+        ]
+        
+        # Create colorful gradient
+        for y in range(height):
+            ratio = y / height
+            color_index = int(ratio * (len(colors) - 1))
+            next_index = min(color_index + 1, len(colors) - 1)
+            local_ratio = (ratio * (len(colors) - 1)) - color_index
+            
+            r = int(colors[color_index][0] * (1 - local_ratio) + colors[next_index][0] * local_ratio)
+            g = int(colors[color_index][1] * (1 - local_ratio) + colors[next_index][1] * local_ratio)
+            b = int(colors[color_index][2] * (1 - local_ratio) + colors[next_index][2] * local_ratio)
+            
+            for x in range(width):
+                noise = random.randint(-20, 20)
+                image.putpixel((x, y), (
+                    max(0, min(255, r + noise)),
+                    max(0, min(255, g + noise)),
+                    max(0, min(255, b + noise))
+                ))
+        
+        # Add text overlay
+        try:
+            font = ImageFont.load_default()
+            
+            # Title
+            title = "Generated by Google Genai"
+            title_bbox = draw.textbbox((0, 0), title, font=font)
+            title_width = title_bbox[2] - title_bbox[0]
+            title_x = (width - title_width) // 2
+            title_y = height // 3
+            
+            # Background for title
+            draw.rectangle([title_x - 15, title_y - 10, title_x + title_width + 15, title_y + 25], 
+                         fill=(255, 255, 255, 220))
+            draw.text((title_x, title_y), title, fill=(60, 60, 60), font=font)
+            
+            # Prompt text
+            prompt_text = prompt[:60] + "..." if len(prompt) > 60 else prompt
+            prompt_bbox = draw.textbbox((0, 0), prompt_text, font=font)
+            prompt_width = prompt_bbox[2] - prompt_bbox[0]
+            prompt_x = (width - prompt_width) // 2
+            prompt_y = title_y + 50
+            
+            # Background for prompt
+            draw.rectangle([prompt_x - 10, prompt_y - 5, prompt_x + prompt_width + 10, prompt_y + 20], 
+                         fill=(255, 255, 255, 200))
+            draw.text((prompt_x, prompt_y), prompt_text, fill=(80, 80, 80), font=font)
+            
+            # Footer
+            footer = "Nano Banana - Powered by Google Genai"
+            footer_bbox = draw.textbbox((0, 0), footer, font=font)
+            footer_width = footer_bbox[2] - footer_bbox[0]
+            footer_x = (width - footer_width) // 2
+            footer_y = height - 60
+            
+            draw.rectangle([footer_x - 10, footer_y - 5, footer_x + footer_width + 10, footer_y + 20], 
+                         fill=(255, 255, 255, 180))
+            draw.text((footer_x, footer_y), footer, fill=(100, 100, 100), font=font)
+            
+        except Exception as e:
+            print(f"Error adding text to demo image: {str(e)}")
+        
+        # Convert to bytes
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+        
+    except Exception as e:
+        print(f"Error creating Google demo image: {str(e)}")
+        # Return simple colored image
+        from PIL import Image
+        import io
+        image = Image.new('RGB', (quality_params['width'], quality_params['height']), color=(66, 133, 244))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
@@ -0,0 +1,78 @@
+import os
+import socket
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from image_gen.models import ImageGenerationJob
+
+# A claimed job is leased for IMAGE_JOB_LEASE_SECONDS; the worker's heartbeat extends the lease
+# every IMAGE_JOB_HEARTBEAT_SECONDS, and a job whose lease ran out (dead worker) is queued again
+IMAGE_JOB_LEASE_SECONDS = int(os.getenv('IMAGE_JOB_LEASE_SECONDS', '300'))
+IMAGE_JOB_HEARTBEAT_SECONDS = int(os.getenv('IMAGE_JOB_HEARTBEAT_SECONDS', '60'))
+# Jobs whose worker died this many times are marked as errors instead of being retried again
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOB_MAX_ATTEMPTS', '3'))
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _claimable(now):
+    expired = Q(lease_until__lt=now) | Q(
+        # Jobs left 'processing' by the old per-request threads have no lease
+        lease_until__isnull=True,
+        created_at__lt=now - timedelta(seconds=IMAGE_JOB_LEASE_SECONDS)
+    )
+    return Q(status='queued') | (Q(status='processing') & expired)
+
+
+def claim_image_jobs(worker_id, limit=1):
+    """Claim up to `limit` jobs, oldest first, with SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Queued jobs and jobs whose lease expired are claimable. Expired jobs that already
+    used IMAGE_JOB_MAX_ATTEMPTS claims are marked as errors instead.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ImageGenerationJob.objects.select_for_update(skip_locked=True)
+            .filter(_claimable(now))
+            .order_by('created_at')
+            .only('job_id', 'status', 'attempts')[:limit]
+        )
+        exhausted = [job.pk for job in jobs if job.status == 'processing' and job.attempts >= IMAGE_JOB_MAX_ATTEMPTS]
+        if exhausted:
+            ImageGenerationJob.objects.filter(pk__in=exhausted).update(
+                status='error',
+                progress=0,
+                completed_at=now,
+                lease_until=None,
+                error_message=f"Job interrupted {IMAGE_JOB_MAX_ATTEMPTS} times (worker stopped while generating)"
+            )
+            print(f"❌ Gave up on {len(exhausted)} image job(s) after {IMAGE_JOB_MAX_ATTEMPTS} interrupted attempts")
+
+        claimed = [job.pk for job in jobs if job.pk not in exhausted]
+        if claimed:
+            ImageGenerationJob.objects.filter(pk__in=claimed).update(
+                status='processing',
+                worker_id=worker_id,
+                lease_until=now + timedelta(seconds=IMAGE_JOB_LEASE_SECONDS),
+                attempts=F('attempts') + 1
+            )
+    return claimed
+
+
+def extend_leases(worker_id, job_ids):
+    """Heartbeat: extend the leases this worker still holds. Returns how many were extended."""
+    if not job_ids:
+        return 0
+    return ImageGenerationJob.objects.filter(
+        pk__in=list(job_ids),
+        worker_id=worker_id,
+        status='processing'
+    ).update(lease_until=timezone.now() + timedelta(seconds=IMAGE_JOB_LEASE_SECONDS))
+
+
+def release_lease(worker_id, job_id):
+    ImageGenerationJob.objects.filter(pk=job_id, worker_id=worker_id).update(lease_until=None)
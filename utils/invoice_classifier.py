@@ -0,0 +1,85 @@
+from functools import lru_cache
+
+# Keywords to detect invoices
+DEFAULT_INVOICE_KEYWORDS = (
+    'invoice', 'bill', 'payment', 'receipt',
+    'statement', 'billing', 'due', 'amount due',
+    'payment due', 'invoice #', 'invoice number',
+    'pay now', 'payment request'
+)
+
+# Common invoice sender domains
+DEFAULT_INVOICE_DOMAINS = (
+    'quickbooks', 'xero', 'freshbooks', 'stripe',
+    'paypal', 'square', 'invoice', 'billing'
+)
+
+
+def _minimal_terms(terms):
+    """Drop terms that contain another term: for an any-match they can never change the result"""
+    terms = sorted({term.lower() for term in terms if term and term.strip()}, key=len)
+    minimal = []
+    for term in terms:
+        if not any(shorter in term for shorter in minimal):
+            minimal.append(term)
+    return minimal
+
+
+class InvoiceClassifier:
+    """Keyword/domain matcher compiled once into minimal lowercase term sets.
+
+    Each check lowercases the text once and runs one substring search per remaining
+    term, stopping at the first match. Terms that contain another term (e.g. 'billing'
+    and 'bill') are dropped at build time since they can never change the result.
+    CPython's substring search beats a single alternation regex over the same terms
+    here (the benchmark_invoice_classifier management command times both).
+    """
+
+    def __init__(self, keywords=DEFAULT_INVOICE_KEYWORDS, domains=DEFAULT_INVOICE_DOMAINS):
+        self.keywords = tuple(keywords)
+        self.domains = tuple(domains)
+        self._keyword_terms = tuple(_minimal_terms(self.keywords))
+        self._domain_terms = tuple(_minimal_terms(self.domains))
+
+    def matches_keywords(self, text):
+        return _contains_any(text, self._keyword_terms)
+
+    def matches_domain(self, sender):
+        return _contains_any(sender, self._domain_terms)
+
+    def is_invoice(self, subject, sender, body):
+        """body may be a callable so the (expensive) body is only extracted when needed"""
+        if self.matches_keywords(subject) or self.matches_domain(sender):
+            return True
+        if callable(body):
+            body = body()
+        return self.matches_keywords(body)
+
+
+def _contains_any(text, terms):
+    if not text or not terms:
+        return False
+    text = text.lower()
+    return any(term in text for term in terms)
+
+
+DEFAULT_CLASSIFIER = InvoiceClassifier()
+
+
+@lru_cache(maxsize=256)
+def get_classifier(extra_keywords=(), extra_domains=()):
+    """Classifier for the default lists extended with custom ones (arguments must be tuples)"""
+    if not extra_keywords and not extra_domains:
+        return DEFAULT_CLASSIFIER
+    return InvoiceClassifier(
+        DEFAULT_INVOICE_KEYWORDS + tuple(extra_keywords),
+        DEFAULT_INVOICE_DOMAINS + tuple(extra_domains)
+    )
+
+
+def classifier_for_account(email_account):
+    """Classifier including the account's custom invoice_keywords / invoice_domains"""
+    return get_classifier(
+        tuple(sorted(email_account.invoice_keywords or [])),
+        tuple(sorted(email_account.invoice_domains or []))
+    )
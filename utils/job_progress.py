@@ -0,0 +1,51 @@
+import os
+import time
+
+# Minimum seconds between two progress-only writes of a job; values reported in between are coalesced
+JOB_PROGRESS_MIN_INTERVAL = float(os.getenv('JOB_PROGRESS_MIN_INTERVAL', '15'))
+
+
+class JobProgressReporter:
+    """Progress and status of a generation job, written with a QuerySet.update of the changed fields only.
+
+    A progress change is written at most once per `min_interval`; values reported in between
+    are held back and the latest one goes out with the next write. A status change or extra
+    fields (started_at, completed_at, results...) are written at once, together with the
+    pending progress. The job instance is kept in step, so a later job.save() writes the same values.
+    """
+
+    def __init__(self, job, min_interval=JOB_PROGRESS_MIN_INTERVAL):
+        self.job = job
+        self.queryset = type(job).objects.filter(pk=job.pk)
+        self.min_interval = min_interval
+        self._written = {'progress': job.progress, 'status': job.status}
+        self._last_write = None
+
+    def update(self, progress=None, status=None, **fields):
+        """Report progress (and optionally a new status or other fields). Returns True if written."""
+        if progress is not None:
+            self.job.progress = progress
+        if status is not None:
+            self.job.status = status
+        for field, value in fields.items():
+            setattr(self.job, field, value)
+
+        urgent = bool(fields) or self.job.status != self._written['status']
+        due = self._last_write is None or time.monotonic() - self._last_write >= self.min_interval
+        if urgent or due:
+            return self.flush(**fields)
+        return False
+
+    def flush(self, **fields):
+        """Write whatever is pending now"""
+        for field in ('progress', 'status'):
+            value = getattr(self.job, field)
+            if value != self._written[field]:
+                fields[field] = value
+        if not fields:
+            return False
+
+        self.queryset.update(**fields)
+        self._written.update({field: fields[field] for field in ('progress', 'status') if field in fields})
+        self._last_write = time.monotonic()
+        return True
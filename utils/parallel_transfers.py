@@ -0,0 +1,51 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared pool for attachment downloads/uploads across all accounts in this process
+TRANSFER_WORKERS = int(os.getenv('ATTACHMENT_TRANSFER_WORKERS', '16'))
+# Max attachments in flight per email account (keeps one big mailbox from hogging the pool and its API quota)
+PER_ACCOUNT_CONCURRENCY = int(os.getenv('ATTACHMENT_CONCURRENCY_PER_ACCOUNT', '4'))
+
+_executor = ThreadPoolExecutor(max_workers=TRANSFER_WORKERS, thread_name_prefix='attachment-transfer')
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _account_semaphore(account_id):
+    with _semaphores_lock:
+        if account_id not in _semaphores:
+            _semaphores[account_id] = threading.BoundedSemaphore(PER_ACCOUNT_CONCURRENCY)
+        return _semaphores[account_id]
+
+
+def run_transfers(account_id, items, transfer):
+    """Run transfer(item) for every item on the shared pool and return the results in input order.
+
+    At most PER_ACCOUNT_CONCURRENCY transfers run at once for the account; the caller
+    blocks while the account is at its cap. A transfer that raises yields None instead
+    of failing the others.
+    """
+    semaphore = _account_semaphore(account_id)
+    futures = []
+    for item in items:
+        semaphore.acquire()
+        try:
+            futures.append(_executor.submit(_run_transfer, semaphore, transfer, item))
+        except Exception:
+            semaphore.release()
+            raise
+    return [future.result() for future in futures]
+
+
+def _run_transfer(semaphore, transfer, item):
+    try:
+        return transfer(item)
+    except Exception as e:
+        print(f"❌ Transfer failed: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return None
+    finally:
+        semaphore.release()
+
@@ -0,0 +1,131 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+from image_gen.models import ProcessedEmail
+
+# Optional in-memory bloom filter of processed message IDs per mailbox. IDs it rules out skip the
+# database lookup entirely; IDs it may contain are still confirmed with the query below.
+BLOOM_FILTER_ENABLED = os.getenv('PROCESSED_EMAIL_BLOOM_FILTER', 'false').lower() in ('1', 'true', 'yes')
+BLOOM_FALSE_POSITIVE_RATE = float(os.getenv('PROCESSED_EMAIL_BLOOM_FP_RATE', '0.01'))
+BLOOM_MIN_CAPACITY = 10000
+# Rows created this long before the last refresh are read again, so rows committed out of order are not missed
+BLOOM_REFRESH_OVERLAP = timedelta(seconds=60)
+# A filter is topped up from the database at most this often. Rows another process saved in between are
+# missed until then: their messages get fetched again and the invoice outbox skips the finished save.
+BLOOM_REFRESH_SECONDS = float(os.getenv('PROCESSED_EMAIL_BLOOM_REFRESH_SECONDS', '10'))
+# Max IDs per IN (...) query
+LOOKUP_CHUNK_SIZE = 1000
+
+
+class BloomFilter:
+    """Fixed-size bloom filter for strings (double hashing over one blake2b digest)"""
+
+    def __init__(self, capacity, false_positive_rate=BLOOM_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item, counted=True):
+        """counted=False sets the bits without raising the fill estimate (the item is counted elsewhere)"""
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        if counted:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class _MailboxFilter:
+    """Bloom filter of one mailbox's processed message IDs, topped up from the database every BLOOM_REFRESH_SECONDS"""
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        self.bloom = BloomFilter(BLOOM_MIN_CAPACITY)
+        self.synced_at = None  # created_at high-water mark of the rows added so far
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        rows = ProcessedEmail.objects.filter(email_account__email__iexact=self.mailbox)
+        if self.synced_at is not None:
+            rows = rows.filter(created_at__gte=self.synced_at - BLOOM_REFRESH_OVERLAP)
+        rows = list(rows.values_list('gmail_message_id', 'created_at'))
+        self.refreshed_at = time.monotonic()
+        if not rows:
+            return
+
+        # Only rows past the high-water mark are new; the overlap re-reads rows already added
+        high_water = self.synced_at
+        new_count = sum(1 for _, created_at in rows if high_water is None or created_at > high_water)
+        if self.bloom.count + new_count > self.bloom.capacity:
+            # Full: rebuild at double the size from the whole table
+            self.bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * (self.bloom.count + new_count)))
+            self.synced_at = high_water = None
+            rows = list(
+                ProcessedEmail.objects.filter(email_account__email__iexact=self.mailbox)
+                .values_list('gmail_message_id', 'created_at')
+            )
+        for gmail_message_id, created_at in rows:
+            self.bloom.add(gmail_message_id, counted=high_water is None or created_at > high_water)
+            if self.synced_at is None or created_at > self.synced_at:
+                self.synced_at = created_at
+
+    def maybe_processed(self, message_ids):
+        with self.lock:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= BLOOM_REFRESH_SECONDS:
+                self.refresh()
+            return [msg_id for msg_id in message_ids if msg_id in self.bloom]
+
+    def add(self, gmail_message_id):
+        with self.lock:
+            # Counted when refresh() reads its row past the high-water mark
+            self.bloom.add(gmail_message_id, counted=False)
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def _mailbox_filter(email_account):
+    # Keyed by address: the same mailbox may be connected by several users, and message IDs are per mailbox.
+    # Addresses are stored as entered, so the key is lowercased and refresh() matches it case-insensitively.
+    mailbox = email_account.email.lower()
+    with _filters_lock:
+        if mailbox not in _filters:
+            _filters[mailbox] = _MailboxFilter(mailbox)
+        return _filters[mailbox]
+
+
+def unprocessed_message_ids(email_account, message_ids):
+    """Drop the IDs that already have a ProcessedEmail, keeping order, with one query per LOOKUP_CHUNK_SIZE IDs"""
+    if not message_ids:
+        return []
+    candidates = message_ids
+    if BLOOM_FILTER_ENABLED:
+        candidates = _mailbox_filter(email_account).maybe_processed(message_ids)
+
+    processed = set()
+    for start in range(0, len(candidates), LOOKUP_CHUNK_SIZE):
+        processed.update(
+            ProcessedEmail.objects.filter(gmail_message_id__in=candidates[start:start + LOOKUP_CHUNK_SIZE])
+            .values_list('gmail_message_id', flat=True)
+        )
+    return [msg_id for msg_id in message_ids if msg_id not in processed]
+
+
+def remember_processed(email_account, gmail_message_id):
+    """Record a newly saved message in this process's bloom filter"""
+    if BLOOM_FILTER_ENABLED:
+        _mailbox_filter(email_account).add(gmail_message_id)
@@ -0,0 +1,43 @@
+import os
+import threading
+import time
+
+# Gmail API calls per second allowed per account (Gmail's per-user quota is 250 units/s,
+# and messages.get/list/modify cost 5 units each)
+GMAIL_CALLS_PER_SECOND = float(os.getenv('GMAIL_API_CALLS_PER_SECOND', '40'))
+
+
+class RateLimiter:
+    """Thread-safe token bucket: acquire(cost) blocks until `cost` calls are allowed"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the tokens now (possibly going negative) so concurrent callers queue up behind us
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def gmail_rate_limiter(account_id):
+    """Shared limiter for all Gmail calls made for one account in this process"""
+    with _limiters_lock:
+        if account_id not in _limiters:
+            _limiters[account_id] = RateLimiter(GMAIL_CALLS_PER_SECOND)
+        return _limiters[account_id]
@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import mimetypes
+import os
+from datetime import timedelta
+from functools import lru_cache
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image
+from image_gen.models import AvatarReferenceImage, ReferenceAsset, ReferenceImage, VideoReferenceImage
+
+REFERENCE_ASSET_DIR = 'reference_assets'
+# Asset files (originals and normalised forms) kept in memory per process, least recently used evicted.
+# Paths are content-addressed, so a cached file never goes stale.
+REFERENCE_ASSET_CACHE_SIZE = int(os.getenv('REFERENCE_ASSET_CACHE_SIZE', '16'))
+# Unreferenced assets used more recently than this are not pruned
+REFERENCE_ASSET_PRUNE_GRACE_SECONDS = int(os.getenv('REFERENCE_ASSET_PRUNE_GRACE_SECONDS', '3600'))
+
+# Models whose rows point at a ReferenceAsset
+REFERENCE_MODELS = (ReferenceImage, VideoReferenceImage, AvatarReferenceImage)
+
+
+def _asset_path(sha256, content_type):
+    extension = mimetypes.guess_extension(content_type or '') or '.bin'
+    if extension == '.jpe':
+        extension = '.jpg'
+    return f"{REFERENCE_ASSET_DIR}/{sha256[:2]}/{sha256}{extension}"
+
+
+def store_reference_asset(content, content_type='image/jpeg'):
+    """The asset holding `content`, written to storage only the first time these bytes are seen"""
+    sha256 = hashlib.sha256(content).hexdigest()
+    # Touching last_used_at keeps prune_unused_assets off the asset until the caller's reference row
+    # exists. No row updated: the asset is new, or a prune deleted it just now.
+    if ReferenceAsset.objects.filter(sha256=sha256).update(last_used_at=timezone.now()):
+        return ReferenceAsset.objects.get(sha256=sha256)
+
+    file_path = _asset_path(sha256, content_type)
+    if not default_storage.exists(file_path):
+        file_path = default_storage.save(file_path, ContentFile(content))
+    asset, created = ReferenceAsset.objects.get_or_create(
+        sha256=sha256,
+        defaults={'file_path': file_path, 'content_type': content_type or 'image/jpeg', 'size': len(content)}
+    )
+    if not created and asset.file_path != file_path:
+        # A concurrent upload of the same bytes won; its file is the one kept
+        default_storage.delete(file_path)
+    return asset
+
+
+def store_uploaded_reference(uploaded_file):
+    return store_reference_asset(uploaded_file.read(), uploaded_file.content_type)
+
+
+@lru_cache(maxsize=REFERENCE_ASSET_CACHE_SIZE)
+def _read_asset_file(file_path):
+    with default_storage.open(file_path, 'rb') as f:
+        return f.read()
+
+
+def read_reference_asset(asset):
+    return _read_asset_file(asset.file_path)
+
+
+def normalized_jpeg_bytes(asset):
+    """The asset as an RGB JPEG (what Veo takes), converted once and stored next to the original"""
+    if asset.normalized_path:
+        return _read_asset_file(asset.normalized_path)
+
+    pil_image = Image.open(BytesIO(read_reference_asset(asset)))
+    if pil_image.mode not in ('RGB', 'RGBA'):
+        pil_image = pil_image.convert('RGB')
+    output = BytesIO()
+    if pil_image.mode == 'RGBA':
+        # JPEG has no alpha: flatten onto white
+        rgb_image = Image.new('RGB', pil_image.size, (255, 255, 255))
+        rgb_image.paste(pil_image, mask=pil_image.split()[3])
+        rgb_image.save(output, format='JPEG', quality=95)
+    else:
+        pil_image.save(output, format='JPEG', quality=95)
+    jpeg_bytes = output.getvalue()
+
+    normalized_path = f"{REFERENCE_ASSET_DIR}/{asset.sha256[:2]}/{asset.sha256}.rgb.jpg"
+    if not default_storage.exists(normalized_path):
+        normalized_path = default_storage.save(normalized_path, ContentFile(jpeg_bytes))
+    ReferenceAsset.objects.filter(pk=asset.pk).update(normalized_path=normalized_path)
+    asset.normalized_path = normalized_path
+    print(f"🖼️ Normalised reference asset {asset.sha256[:12]} to JPEG ({len(jpeg_bytes)} bytes)")
+    return jpeg_bytes
+
+
+def remember_provider_handle(asset, provider, handle):
+    """Record the ID of the asset's copy on a provider, so later jobs skip the upload"""
+    with transaction.atomic():
+        locked = ReferenceAsset.objects.select_for_update().get(pk=asset.pk)
+        locked.provider_handles[provider] = handle
+        locked.save(update_fields=['provider_handles'])
+    asset.provider_handles = locked.provider_handles
+
+
+def forget_provider_handle(asset, provider):
+    """Drop a handle the provider rejected (e.g. expired); the next job uploads again"""
+    with transaction.atomic():
+        locked = ReferenceAsset.objects.select_for_update().get(pk=asset.pk)
+        if locked.provider_handles.pop(provider, None) is not None:
+            locked.save(update_fields=['provider_handles'])
+    asset.provider_handles = locked.provider_handles
+
+
+def ensure_reference_asset(ref_img):
+    """Move a row still holding base64 data to its asset; returns the asset"""
+    if not ref_img.asset_id:
+        ref_img.asset = store_reference_asset(base64.b64decode(ref_img.image_data), ref_img.content_type)
+        ref_img.image_data = None
+        ref_img.save(update_fields=['asset', 'image_data'])
+    return ref_img.asset
+
+
+def legacy_reference_rows(model):
+    return model.objects.filter(asset__isnull=True).exclude(Q(image_data__isnull=True) | Q(image_data=''))
+
+
+def prune_unused_assets():
+    """Delete assets no reference row points at (their jobs were deleted), with their files. Returns the count.
+
+    Assets used within REFERENCE_ASSET_PRUNE_GRACE_SECONDS are kept: an upload may have just
+    got one back and not created its reference row yet.
+    """
+    cutoff = timezone.now() - timedelta(seconds=REFERENCE_ASSET_PRUNE_GRACE_SECONDS)
+    unused = ReferenceAsset.objects.filter(
+        image_references__isnull=True,
+        video_references__isnull=True,
+        avatar_references__isnull=True,
+        last_used_at__lt=cutoff
+    )
+    deleted = 0
+    for sha256 in list(unused.values_list('sha256', flat=True)):
+        with transaction.atomic():
+            # Checked again under the row lock: a concurrent upload touching the asset waits for it
+            asset = unused.select_for_update(of=('self',)).filter(sha256=sha256).first()
+            if asset is None:
+                continue
+            for file_path in filter(None, (asset.file_path, asset.normalized_path)):
+                try:
+                    default_storage.delete(file_path)
+                except Exception as e:
+                    print(f"⚠️ Could not delete reference asset file {file_path}: {e}")
+            asset.delete()
+        deleted += 1
+    return deleted
@@ -0,0 +1,112 @@
+import os
+import traceback
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from image_gen.models import EmailSetupTask
+from utils.gmail_queue import COALESCE_DELAY_SECONDS, STALE_AFTER_SECONDS, acquire_sync_lease, release_sync_lease
+from utils.gmail_polling import switch_to_polling
+from utils.gmail_watch import GmailWatchPermissionError, watch_expiration
+
+# A 403 from users().watch is often Pub/Sub permissions still propagating, so the watch stage is
+# retried with backoff (WATCH_RETRY_DELAY_SECONDS x1.5 per attempt, capped) before falling back to polling
+WATCH_MAX_ATTEMPTS = int(os.getenv('GMAIL_WATCH_MAX_ATTEMPTS', '5'))
+WATCH_RETRY_DELAY_SECONDS = float(os.getenv('GMAIL_WATCH_RETRY_DELAY_SECONDS', '5'))
+WATCH_RETRY_MAX_DELAY_SECONDS = float(os.getenv('GMAIL_WATCH_RETRY_MAX_DELAY_SECONDS', '30'))
+
+
+def claim_setup_tasks(batch_size=1):
+    """Claim due setup tasks (and ones abandoned by a dead worker) with SELECT ... FOR UPDATE SKIP LOCKED"""
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            EmailSetupTask.objects.select_for_update(skip_locked=True, of=('self',)).select_related('email_account').filter(
+                Q(status='queued', available_at__lte=now) |
+                # updated_at is bumped after every sync round, so only dead workers' tasks go stale
+                Q(status='running', updated_at__lt=now - timedelta(seconds=STALE_AFTER_SECONDS))
+            ).order_by('available_at')[:batch_size]
+        )
+        if tasks:
+            EmailSetupTask.objects.filter(pk__in=[t.pk for t in tasks]).update(status='running', started_at=now, updated_at=now)
+    return tasks
+
+
+def run_setup_task(task):
+    """Run a claimed task: the watch stage (rescheduled on 403), then the initial sync"""
+    # Imported here to avoid a circular import (the views module is loaded by the URL conf)
+    from image_gen.views.email_automation_view import EmailAutomationService
+
+    service = EmailAutomationService()
+    email_account = task.email_account
+    try:
+        if task.stage == 'watch' and not _run_watch_stage(task, email_account, service):
+            return
+        _run_sync_stage(task, email_account, service)
+    except Exception as e:
+        print(f"❌ Setup task {task.task_id} for {email_account.email} failed: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        _update(task, status='failed', error_message=str(e), completed_at=timezone.now())
+
+
+def _run_watch_stage(task, email_account, service):
+    """Returns True when the task can move on to the sync stage, False if it was rescheduled"""
+    attempts = task.watch_attempts + 1
+    try:
+        watch_result = service.setup_gmail_watch(email_account)
+    except GmailWatchPermissionError as e:
+        if attempts < WATCH_MAX_ATTEMPTS:
+            delay = min(WATCH_RETRY_DELAY_SECONDS * 1.5 ** (attempts - 1), WATCH_RETRY_MAX_DELAY_SECONDS)
+            print(f"⚠️ Permission error on watch attempt {attempts}/{WATCH_MAX_ATTEMPTS} for {email_account.email}, retrying in {delay:.0f}s")
+            _update(
+                task, status='queued', watch_attempts=attempts, error_message=str(e),
+                available_at=timezone.now() + timedelta(seconds=delay)
+            )
+            return False
+
+        # Pub/Sub can't deliver for this project; keep the account automated by polling instead
+        print(f"⚠️ Gmail watch unavailable for {email_account.email} after {attempts} attempt(s), falling back to polling")
+        switch_to_polling(email_account)
+        email_account.is_automated = True
+        email_account.save(update_fields=['is_automated', 'updated_at'])
+        _update(task, stage='sync', sync_mode='poll', watch_attempts=attempts, error_message=str(e))
+        return True
+
+    # Update with NEW history ID from watch response (the initial sync starts from task.start_history_id)
+    email_account.watch_history_id = watch_result.get('historyId')
+    email_account.watch_expiration = watch_expiration(watch_result) or timezone.now() + timedelta(days=7)
+    email_account.sync_mode = 'push'
+    email_account.is_automated = True
+    email_account.save(update_fields=['watch_history_id', 'watch_expiration', 'sync_mode', 'is_automated', 'updated_at'])
+    _update(task, stage='sync', sync_mode='push', watch_attempts=attempts, error_message=None)
+    return True
+
+
+def _run_sync_stage(task, email_account, service):
+    """Process the emails since the account's previous history ID, running a backfill to completion"""
+    while True:
+        if not acquire_sync_lease(email_account):
+            # A worker is syncing this account; try again shortly
+            print(f"⏳ Sync already in flight for {email_account.email}, setup sync retried in {COALESCE_DELAY_SECONDS}s")
+            _update(task, status='queued', available_at=timezone.now() + timedelta(seconds=COALESCE_DELAY_SECONDS))
+            return
+        try:
+            processed_count = service.process_new_emails(email_account, task.start_history_id)
+        finally:
+            release_sync_lease(email_account)
+
+        _update(task, processed_count=task.processed_count + processed_count)
+        if not email_account.backfill_history_id:
+            break
+        # The backfill paused after a bounded number of pages; it resumes from its checkpoint
+        print(f"⏩ Continuing initial backfill for {email_account.email} ({task.processed_count} invoice(s) so far)")
+
+    _update(task, status='completed', completed_at=timezone.now())
+    print(f"✅ Setup completed for {email_account.email} ({task.sync_mode}, {task.processed_count} invoice(s) processed)")
+
+
+def _update(task, **fields):
+    fields['updated_at'] = timezone.now()
+    EmailSetupTask.objects.filter(pk=task.pk).update(**fields)
+    for field, value in fields.items():
+        setattr(task, field, value)